@@ -1,12 +1,16 @@
 import os
 import streamlit as st
-import json
-from models.segmentation_model import extract_and_save_objects, process_all_images
-from models.identification_model import identify_and_describe_object
-from models.text_extraction_model import extract_text
+import pandas as pd
+from models import registry
+from models.segmentation_model import process_all_images
+from models.identification_model import process_all_segmented_objects
+from models.text_extraction_model import process_images_and_save_results
+from models.pipeline import run_single_image
 from models.summarization_model import load_csv_files, preprocess_dataframes, generate_summaries, save_summaries
 from utils.data_mapping import load_and_prepare_data, merge_data, create_data_mapping, save_data_mapping
-from utils.visualization import plot_image_with_annotations, generate_summary_table
+from utils.visualization import render_visualizations
+from utils.cache import bytes_content_hash
+from utils.storage import read_table, output_exists
 
 # Define directories and file paths
 segmented_objects_dir = 'data/segmented_objects'
@@ -30,46 +34,119 @@ def display_image(image_path):
     st.image(image_path, caption='Uploaded Image', use_column_width=True)
 
 def handle_image_upload(uploaded_file):
-    """Save the uploaded file to a temporary location and return the file path."""
+    """Save the uploaded file to the input directory and return the file path and content hash."""
     image_path = os.path.join(input_images_dir, uploaded_file.name)
     ensure_directory_exists(input_images_dir)
-    with open(image_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return image_path
+    file_hash = bytes_content_hash(uploaded_file.getbuffer())
+    # Reruns re-send the same upload; only rewrite the file when its content changed
+    if not os.path.exists(image_path) or st.session_state.get(image_path) != file_hash:
+        with open(image_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        st.session_state[image_path] = file_hash
+    return image_path, file_hash
+
+@st.cache_resource(show_spinner="Loading model...")
+def load_shared_model(name):
+    """Load a model once per server process and share it across reruns and sessions."""
+    return registry.get_model(name)
+
+def use_shared_model(name):
+    """Make the pipeline functions use the server-wide instance of a model."""
+    registry.set_model(name, load_shared_model(name))
+
+def read_rows(csv_file, master_id, key='master_id'):
+    """Return the rows of a stage output that belong to one image."""
+    if not output_exists(csv_file):
+        return pd.DataFrame()
+    df = read_table(csv_file, dtype={'master_id': str})
+    if df.empty:
+        return df
+    if key == 'Image':
+        return df[df['Image'].map(lambda x: os.path.splitext(x)[0]) == master_id].reset_index(drop=True)
+    return df[df[key] == master_id].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False)
+def segment_upload(file_hash, master_id):
+    """Segment the upload; results are cached by upload content hash."""
+    use_shared_model('segmentation')
+    ensure_directory_exists(segmented_objects_dir)
+    process_all_images(incremental=True)
+    return read_rows(metadata_file, master_id)
+
+@st.cache_data(show_spinner=False)
+def identify_upload(file_hash, master_id):
+    """Identify the upload's segmented objects; results are cached by upload content hash."""
+    segment_upload(file_hash, master_id)
+    use_shared_model('clip')
+    process_all_segmented_objects(incremental=True)
+    return read_rows(descriptions_file, master_id)
+
+@st.cache_data(show_spinner=False)
+def extract_text_upload(file_hash, master_id):
+    """Extract text from the upload; results are cached by upload content hash."""
+    use_shared_model('ocr')
+    process_images_and_save_results(incremental=True)
+    return read_rows(text_extraction_results_file_csv, master_id, key='Image')
+
+@st.cache_data(show_spinner=False)
+def run_upload_pipeline(file_hash, master_id, _image_bytes):
+    """Run every stage on the upload in memory; results are cached by upload content hash."""
+    for name in ('segmentation', 'clip', 'ocr'):
+        use_shared_model(name)
+    return run_single_image(_image_bytes, master_id)
+
+def run_full_pipeline(uploaded_file, file_hash):
+    """Run the whole pipeline on just the uploaded image and show the results."""
+    try:
+        master_id = os.path.splitext(uploaded_file.name)[0]
+        with st.spinner("Running the full pipeline..."):
+            result = run_upload_pipeline(file_hash, master_id, bytes(uploaded_file.getbuffer()))
+        st.image(result['annotated_image'], channels='BGR', caption='Annotated Image', use_column_width=True)
+        st.dataframe(result['summary'].astype({'BBox': str}))
+        timings = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in result['timings'].items())
+        st.caption(f"Stage timings: {timings}")
+        st.success(f"Pipeline completed: {len(result['objects'])} objects, {len(result['text'])} text lines.")
+    except Exception as e:
+        st.error(f"An error occurred while running the pipeline: {e}")
 
-def run_segmentation(image_path):
+def run_segmentation(image_path, file_hash):
     """Run segmentation on the uploaded image."""
     try:
-        ensure_directory_exists(segmented_objects_dir)
-        extract_and_save_objects(image_path, segmented_objects_dir)
-        process_all_images()
-        st.success("Segmentation completed successfully.")
+        master_id = os.path.splitext(os.path.basename(image_path))[0]
+        with st.spinner("Running segmentation..."):
+            metadata_df = segment_upload(file_hash, master_id)
+        st.success(f"Segmentation completed successfully: {len(metadata_df)} objects found.")
+        st.dataframe(metadata_df)
     except Exception as e:
         st.error(f"An error occurred during segmentation: {e}")
 
-def run_identification():
+def run_identification(image_path, file_hash):
     """Run identification on segmented objects."""
     try:
-        ensure_directory_exists(segmented_objects_dir)
-        identify_and_describe_object(segmented_objects_dir)  # Pass only the directory
+        master_id = os.path.splitext(os.path.basename(image_path))[0]
+        with st.spinner("Running identification..."):
+            descriptions_df = identify_upload(file_hash, master_id)
         st.success("Identification completed successfully.")
+        st.dataframe(descriptions_df)
     except Exception as e:
         st.error(f"An error occurred during identification: {e}")
 
 
-def run_text_extraction():
-    """Run text extraction on segmented objects."""
+def run_text_extraction(image_path, file_hash):
+    """Run text extraction on the uploaded image."""
     try:
-        ensure_directory_exists(input_images_dir)
-        extract_text(input_images_dir)
+        master_id = os.path.splitext(os.path.basename(image_path))[0]
+        with st.spinner("Running text extraction..."):
+            text_df = extract_text_upload(file_hash, master_id)
         st.success("Text extraction completed successfully.")
+        st.dataframe(text_df)
     except Exception as e:
         st.error(f"An error occurred during text extraction: {e}")
         
 def run_summarization():
     """Run summarization of results."""
     try:
-        if not os.path.exists(metadata_file) or not os.path.exists(text_extraction_results_file_csv):
+        if not output_exists(metadata_file) or not output_exists(text_extraction_results_file_csv):
             st.warning("Required files for summarization are missing.")
             return
         
@@ -95,31 +172,12 @@ def run_data_mapping():
 def run_visualization():
     """Run visualization of results."""
     try:
-        if not os.path.exists(data_mapping_file):
+        if not output_exists(data_mapping_file):
             st.warning(f"Data mapping file not found: {data_mapping_file}")
             return
 
-        with open(data_mapping_file, 'r') as json_file:
-            data_mapping = json.load(json_file)['images']
-
-        ensure_directory_exists(output_dir)
-
-        for entry in data_mapping:
-            master_id = entry['master_id']
-            objects = entry['object_details']
-
-            base_image_name = f"{master_id}.jpg"
-            original_image_path = os.path.join(input_images_dir, base_image_name)
-            annotated_image_path = os.path.join(output_dir, f"annotated_{base_image_name}")
-            summary_table_csv_path = os.path.join(output_dir, f"summary_{master_id}.csv")
-            summary_table_json_path = os.path.join(output_dir, f"summary_{master_id}.json")
-
-            if not os.path.exists(original_image_path):
-                st.warning(f"Image not found: {original_image_path}")
-                continue
-
-            plot_image_with_annotations(original_image_path, objects, annotated_image_path)
-            generate_summary_table(objects, summary_table_csv_path, summary_table_json_path)
+        for master_id in render_visualizations(data_mapping_file, input_images_dir, output_dir):
+            st.warning(f"Image not found: {os.path.join(input_images_dir, f'{master_id}.jpg')}")
 
         st.success("Visualization completed and results saved.")
     except Exception as e:
@@ -131,17 +189,20 @@ def main():
 
     uploaded_file = st.file_uploader("Upload an Image", type=["jpg", "jpeg", "png"])
     if uploaded_file is not None:
-        image_path = handle_image_upload(uploaded_file)
+        image_path, file_hash = handle_image_upload(uploaded_file)
         display_image(image_path)
 
+        if st.button("Run Full Pipeline"):
+            run_full_pipeline(uploaded_file, file_hash)
+
         if st.button("Run Segmentation"):
-            run_segmentation(image_path)
+            run_segmentation(image_path, file_hash)
         
         if st.button("Run Identification"):
-            run_identification()
+            run_identification(image_path, file_hash)
         
         if st.button("Run Text Extraction"):
-            run_text_extraction()
+            run_text_extraction(image_path, file_hash)
         
         if st.button("Run Summarization"):
             run_summarization()
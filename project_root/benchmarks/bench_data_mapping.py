@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.data_mapping import create_data_mapping, write_data_mapping_json
+from utils.association import image_master_ids
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def make_merged_frame(num_rows, objects_per_image=20, seed=0):
+    """Build a synthetic merged identification/OCR frame with num_rows rows."""
+    rng = np.random.default_rng(seed)
+    image_ids = rng.integers(0, max(1, num_rows // objects_per_image), size=num_rows)
+    master_ids = pd.Series(image_ids).map(lambda i: f"img{i:07d}")
+    object_ids = np.arange(num_rows) % objects_per_image
+    has_text = rng.random(num_rows) < 0.7
+    x, y = rng.integers(0, 1000, size=num_rows), rng.integers(0, 1000, size=num_rows)
+    bboxes = [f"[[{a}, {b}], [{a + 50}, {b}], [{a + 50}, {b + 20}], [{a}, {b + 20}]]" if t else np.nan
+              for a, b, t in zip(x, y, has_text)]
+    return pd.DataFrame({
+        'master_id': master_ids,
+        'object_id': object_ids,
+        'file_path': [f"data/segmented_objects/{m}_object_{o}.png" for m, o in zip(master_ids, object_ids)],
+        'description': rng.choice(['a cat', 'a dog', 'a car', 'a person'], size=num_rows),
+        'BBox': bboxes,
+        'Text': pd.Series('text', index=range(num_rows)).where(has_text),
+        'Confidence': np.where(has_text, rng.random(num_rows), np.nan),
+    })
+
+def legacy_create_data_mapping(merged_df):
+    """The previous groupby + iterrows implementation, kept as the reference."""
+    data_mapping = []
+    for master_id, group in merged_df.groupby('master_id'):
+        object_details = []
+        for _, row in group.iterrows():
+            object_details.append({
+                'object_id': row['object_id'],
+                'file_path': row['file_path'],
+                'description': row['description'],
+                'text_data': {
+                    'BBox': row.get('BBox', 'N/A'),
+                    'Text': row.get('Text', 'N/A'),
+                    'Confidence': row.get('Confidence', 'N/A')
+                }
+            })
+        data_mapping.append({'master_id': master_id, 'object_details': object_details})
+    return data_mapping
+
+def timed(label, func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"{label}: {elapsed:.2f}s")
+    return result, elapsed
+
+def run_benchmark(num_rows, check_legacy):
+    merged_df = make_merged_frame(num_rows)
+    image_names = merged_df['master_id'] + '.jpg'
+
+    timed("master ids (apply)", lambda: image_names.apply(lambda x: os.path.splitext(x)[0]))
+    timed("master ids (vectorized)", image_master_ids, image_names)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        new_path = os.path.join(tmp_dir, 'vectorized.json')
+        mapping, build_time = timed("mapping (vectorized)", create_data_mapping, merged_df)
+        _, write_time = timed("write (streaming)", write_data_mapping_json, mapping, new_path)
+        print(f"rows={num_rows} vectorized build={build_time:.2f}s write={write_time:.2f}s "
+              f"rows/sec={num_rows / (build_time + write_time):,.0f}")
+
+        if check_legacy:
+            legacy_path = os.path.join(tmp_dir, 'legacy.json')
+            legacy_mapping, legacy_time = timed("mapping (groupby + iterrows)", legacy_create_data_mapping, merged_df)
+            with open(legacy_path, 'w') as json_file:
+                json.dump({"images": legacy_mapping}, json_file, indent=4)
+            with open(new_path, 'rb') as a, open(legacy_path, 'rb') as b:
+                identical = a.read() == b.read()
+            print(f"legacy build={legacy_time:.2f}s speedup={legacy_time / build_time:.1f}x identical={identical}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark building data_mapping.json from a synthetic merged frame.")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--skip-legacy', action='store_true', help="Do not time or compare the old implementation.")
+    args = parser.parse_args()
+
+    run_benchmark(args.rows, check_legacy=not args.skip_legacy)
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+import logging
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.text_extraction_model import iter_ocr_results, input_images_dir
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def list_benchmark_images(images_dir, repeat):
+    image_paths = sorted(
+        os.path.join(images_dir, f) for f in os.listdir(images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+    )
+    return image_paths * repeat
+
+def run_benchmark(image_paths, worker_counts, torch_threads):
+    """Time OCR over the images for each worker count and return {workers: images/sec}."""
+    results = {}
+    for num_workers in worker_counts:
+        start_time = time.perf_counter()
+        processed = sum(1 for _ in iter_ocr_results(image_paths, num_workers, torch_threads))
+        elapsed = time.perf_counter() - start_time
+        results[num_workers] = processed / elapsed if elapsed > 0 else float('inf')
+        logging.info(f"{num_workers:>3} workers: {processed} images in {elapsed:.2f}s "
+                     f"({results[num_workers]:.2f} images/sec)")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare OCR throughput across worker counts.")
+    parser.add_argument('--images-dir', default=input_images_dir)
+    parser.add_argument('--repeat', type=int, default=8, help="Repeat the image set to get a larger corpus.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--torch-threads', type=int, default=1)
+    args = parser.parse_args()
+
+    image_paths = list_benchmark_images(args.images_dir, args.repeat)
+    results = run_benchmark(image_paths, args.workers, args.torch_threads)
+
+    baseline = results[args.workers[0]]
+    for num_workers, throughput in results.items():
+        print(f"workers={num_workers:<3} images/sec={throughput:8.2f} speedup={throughput / baseline:5.2f}x")
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import write_synthetic_images
+from models import segmentation_model
+from models.identification_model import identify_and_describe_object, identify_objects_batch
+from models.text_extraction_model import extract_text, format_ocr_results, input_images_dir
+from models.summarization_model import generate_summaries
+from utils.preprocessing import preprocess_image
+from utils.data_mapping import merge_data, create_data_mapping, write_data_mapping_json
+from utils.metrics import peak_rss_bytes
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Stages in the order they run; each one feeds the next
+benchmark_stages = ['preprocess', 'segmentation', 'segmentation_batch', 'identification', 'identification_batch',
+                    'ocr', 'summarization', 'data_mapping']
+regression_tolerance = 0.1
+
+def list_benchmark_images(images_dir):
+    """Return (image_path, master_id) pairs for the images in images_dir."""
+    return [
+        (os.path.join(images_dir, f), os.path.splitext(f)[0])
+        for f in sorted(os.listdir(images_dir)) if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+    ]
+
+def reset_peak_memory():
+    """Reset the kernel's resident-set high-water mark so each stage reports its own peak (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def current_peak_memory():
+    """Return the resident-set high-water mark in bytes since the last reset, or since process start."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return peak_rss_bytes()
+
+def summarize_latencies(name, latencies, items, elapsed, peak_memory):
+    latencies = np.asarray(latencies, dtype=float)
+    return {
+        'stage': name,
+        'calls': int(latencies.size),
+        'items': int(items),
+        'seconds': elapsed,
+        'items_per_second': items / elapsed if elapsed > 0 else None,
+        'p50_seconds': float(np.percentile(latencies, 50)) if latencies.size else None,
+        'p95_seconds': float(np.percentile(latencies, 95)) if latencies.size else None,
+        'peak_memory_bytes': peak_memory,
+    }
+
+def run_stage(name, func, inputs, warmup=1):
+    """Call func once per input, timing each call, and return (outputs, stage stats).
+
+    The first `warmup` inputs are run and discarded first so lazy model
+    loading and allocator warm-up do not land in the measured latencies.
+    """
+    for item in inputs[:warmup]:
+        func(item)
+    reset_peak_memory()
+    outputs, latencies = [], []
+    start_time = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        outputs.append(func(item))
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start_time
+    stats = summarize_latencies(name, latencies, len(inputs), elapsed, current_peak_memory())
+    logging.info(f"{name}: {len(inputs)} items in {elapsed:.2f}s")
+    return outputs, stats
+
+def run_batch_stage(name, func, inputs):
+    """Time one call of a batched stage over all inputs; its latency is per item."""
+    reset_peak_memory()
+    start_time = time.perf_counter()
+    outputs = func(inputs)
+    elapsed = time.perf_counter() - start_time
+    per_item = [elapsed / len(inputs)] if inputs else []
+    stats = summarize_latencies(name, per_item, len(inputs), elapsed, current_peak_memory())
+    logging.info(f"{name}: {len(inputs)} items in {elapsed:.2f}s")
+    return outputs, stats
+
+def run_pipeline_benchmark(image_items, work_dir, warmup=1):
+    """Run every stage over image_items and return the per-stage stats in stage order."""
+    segmentation_model.segmented_objects_dir = os.path.join(work_dir, 'segmented_objects')
+    image_paths = [path for path, _ in image_items]
+    results = []
+
+    _, stats = run_stage('preprocess', lambda path: preprocess_image(path, segmentation_model.device),
+                         image_paths, warmup)
+    results.append(stats)
+
+    segmented, stats = run_stage('segmentation', lambda item: segmentation_model.extract_and_save_objects(*item),
+                                 image_items, warmup)
+    results.append(stats)
+    metadata = [row for rows in segmented for row in rows]
+    _, stats = run_batch_stage('segmentation_batch', segmentation_model.extract_and_save_objects_batch, image_items)
+    results.append(stats)
+
+    crop_paths = [row['file_path'] for row in metadata]
+    descriptions, stats = run_stage('identification', identify_and_describe_object, crop_paths, warmup)
+    results.append(stats)
+    _, stats = run_batch_stage('identification_batch', identify_objects_batch, crop_paths)
+    results.append(stats)
+
+    ocr_results, stats = run_stage('ocr', lambda path: format_ocr_results(extract_text(path)), image_paths, warmup)
+    results.append(stats)
+
+    identification_df = pd.DataFrame(metadata, columns=['master_id', 'object_id', 'file_path', 'x_min', 'y_min',
+                                                        'x_max', 'y_max'])
+    identification_df['description'] = [description or 'N/A' for description in descriptions]
+    text_extraction_df = pd.DataFrame(
+        [dict(row, Image=os.path.basename(path)) for path, rows in zip(image_paths, ocr_results) for row in rows],
+        columns=['Image', 'BBox', 'Text', 'Confidence'])
+
+    _, stats = run_batch_stage('summarization', lambda _: generate_summaries(identification_df, text_extraction_df),
+                               crop_paths)
+    results.append(stats)
+
+    mapping_path = os.path.join(work_dir, 'data_mapping.json')
+    _, stats = run_batch_stage(
+        'data_mapping',
+        lambda _: write_data_mapping_json(create_data_mapping(merge_data(identification_df, text_extraction_df)),
+                                          mapping_path),
+        crop_paths)
+    results.append(stats)
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=regression_tolerance):
+    """Return messages for stages whose p50 latency rose or throughput fell by more than tolerance."""
+    baseline_stages = {stats['stage']: stats for stats in baseline['stages']}
+    regressions = []
+    for stats in results:
+        base = baseline_stages.get(stats['stage'])
+        if base is None:
+            continue
+        if base['p50_seconds'] and stats['p50_seconds'] and stats['p50_seconds'] > base['p50_seconds'] * (1 + tolerance):
+            regressions.append(f"{stats['stage']}: p50 {base['p50_seconds'] * 1000:.1f}ms -> "
+                               f"{stats['p50_seconds'] * 1000:.1f}ms")
+        if base['items_per_second'] and stats['items_per_second'] and \
+                stats['items_per_second'] < base['items_per_second'] * (1 - tolerance):
+            regressions.append(f"{stats['stage']}: {base['items_per_second']:.2f} -> "
+                               f"{stats['items_per_second']:.2f} items/sec")
+    return regressions
+
+def format_results(results):
+    lines = [f"{'stage':<22}{'items':>8}{'items/sec':>12}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>10}"]
+    for stats in results:
+        def ms(value):
+            return f"{value * 1000:.1f}" if value is not None else '-'
+        peak = f"{stats['peak_memory_bytes'] / 2 ** 20:.0f}" if stats['peak_memory_bytes'] else '-'
+        rate = f"{stats['items_per_second']:.2f}" if stats['items_per_second'] else '-'
+        lines.append(f"{stats['stage']:<22}{stats['items']:>8}{rate:>12}{ms(stats['p50_seconds']):>10}"
+                     f"{ms(stats['p95_seconds']):>10}{peak:>10}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on sample or synthetic images.")
+    parser.add_argument('--images-dir', default=None,
+                        help=f"Benchmark these images (e.g. {input_images_dir}) instead of synthetic ones.")
+    parser.add_argument('--count', type=int, default=16, help="Number of synthetic images.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--objects', type=int, default=5, help="Shapes drawn per synthetic image.")
+    parser.add_argument('--text-lines', type=int, default=3, help="Words drawn per synthetic image.")
+    parser.add_argument('--stand-in', action='store_true',
+                        help="Use tiny stand-in models so the benchmark runs offline without model weights.")
+    parser.add_argument('--warmup', type=int, default=1, help="Inputs run untimed before each per-item stage.")
+    parser.add_argument('--output', help="Write the results as JSON.")
+    parser.add_argument('--save-baseline', help="Write the results as a baseline for later runs.")
+    parser.add_argument('--baseline', help="Compare against a saved baseline and exit 1 on regression.")
+    parser.add_argument('--tolerance', type=float, default=regression_tolerance,
+                        help="Allowed relative slowdown before a stage counts as a regression.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.stand_in:
+            from benchmarks.stand_ins import install_stand_in_models
+            install_stand_in_models(args.objects, os.path.join(work_dir, 'text_embeddings'))
+
+        if args.images_dir:
+            image_items = list_benchmark_images(args.images_dir)
+        else:
+            images_dir = os.path.join(work_dir, 'input_images')
+            write_synthetic_images(images_dir, args.count, args.width, args.height, args.objects, args.text_lines)
+            image_items = list_benchmark_images(images_dir)
+
+        results = run_pipeline_benchmark(image_items, work_dir, args.warmup)
+
+    report = {
+        'images': len(image_items),
+        'images_dir': args.images_dir or 'synthetic',
+        'stand_in': args.stand_in,
+        'stages': results,
+    }
+    print(format_results(results))
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w') as json_file:
+                json.dump(report, json_file, indent=4)
+            logging.info(f"Saved benchmark results to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            regressions = compare_to_baseline(results, json.load(json_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import numpy as np
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_pipeline import summarize_latencies, reset_peak_memory, current_peak_memory
+from models import identification_model
+from models.identification_model import identify_crops, get_text_features
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+default_vocabulary_sizes = [100, 1000, 10000, 50000]
+
+def synthetic_vocabulary(size):
+    """Return size distinct made-up labels."""
+    return [f"object type {index}" for index in range(size)]
+
+def synthetic_crops(count, size=224, seed=0):
+    """Return count random BGR crops."""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+def benchmark_vocabulary(labels, crops, batch_size, stand_in=False):
+    """Build the label embeddings, then time batched identification of the crops against them.
+
+    Returns a stats dict whose latencies are per crop.
+    """
+    if stand_in:
+        from benchmarks.stand_ins import write_stand_in_text_features
+        write_stand_in_text_features(labels)
+    build_start = time.perf_counter()
+    get_text_features(labels)
+    build_seconds = time.perf_counter() - build_start
+
+    # One untimed batch so lazy model loading and allocator warm-up are not measured
+    identify_crops(crops[:batch_size], labels, batch_size)
+    reset_peak_memory()
+    latencies = []
+    start_time = time.perf_counter()
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size]
+        batch_start = time.perf_counter()
+        identify_crops(batch, labels, batch_size)
+        latencies.extend([(time.perf_counter() - batch_start) / len(batch)] * len(batch))
+    elapsed = time.perf_counter() - start_time
+
+    stats = summarize_latencies(f"{len(labels)} labels", latencies, len(crops), elapsed, current_peak_memory())
+    stats['labels'] = len(labels)
+    stats['build_seconds'] = build_seconds
+    logging.info(f"{len(labels)} labels: {len(crops)} crops in {elapsed:.2f}s")
+    return stats
+
+def format_results(results):
+    lines = [f"{'labels':>8}{'build s':>10}{'crops/sec':>11}{'p50 ms':>9}{'p95 ms':>9}{'vs first':>10}{'peak MB':>9}"]
+    for stats in results:
+        growth = stats['p50_seconds'] / results[0]['p50_seconds'] if results[0]['p50_seconds'] else None
+        peak = f"{stats['peak_memory_bytes'] / 2 ** 20:.0f}" if stats['peak_memory_bytes'] else '-'
+        lines.append(f"{stats['labels']:>8}{stats['build_seconds']:>10.2f}{stats['items_per_second']:>11.2f}"
+                     f"{stats['p50_seconds'] * 1000:>9.2f}{stats['p95_seconds'] * 1000:>9.2f}"
+                     f"{(f'{growth:.2f}x' if growth else '-'):>10}{peak:>9}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure per-crop identification latency as the label vocabulary grows.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_vocabulary_sizes, help="Vocabulary sizes to test.")
+    parser.add_argument('--labels-file', help="Take the vocabularies from the first labels of this file.")
+    parser.add_argument('--crops', type=int, default=128, help="Random crops identified per vocabulary.")
+    parser.add_argument('--batch-size', type=int, default=identification_model.identification_batch_size)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=identification_model.label_chunk_size,
+                        help="Labels scored per matrix multiply.")
+    parser.add_argument('--prompt-ensemble', action='store_true', help="Encode every label with all prompt templates.")
+    parser.add_argument('--stand-in', action='store_true',
+                        help="Use tiny stand-in models and random label embeddings so the benchmark runs offline.")
+    parser.add_argument('--output', help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    identification_model.label_top_k = args.top_k
+    identification_model.label_chunk_size = args.chunk_size
+    if args.prompt_ensemble:
+        identification_model.prompt_templates = identification_model.ensemble_prompt_templates
+    vocabulary = identification_model.load_labels(args.labels_file) if args.labels_file else None
+    crops = synthetic_crops(args.crops)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Label embeddings built here are throwaway, so they stay out of the real cache
+        identification_model.text_embeddings_cache_dir = os.path.join(work_dir, 'text_embeddings')
+        if args.stand_in:
+            from benchmarks.stand_ins import install_stand_in_models
+            install_stand_in_models()
+        results = []
+        for size in sorted(args.sizes):
+            labels = vocabulary[:size] if vocabulary is not None else synthetic_vocabulary(size)
+            results.append(benchmark_vocabulary(labels, crops, args.batch_size, args.stand_in))
+
+    print(format_results(results))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as json_file:
+            json.dump({'crops': args.crops, 'top_k': args.top_k, 'stand_in': args.stand_in, 'results': results},
+                      json_file, indent=4)
+        logging.info(f"Saved vocabulary benchmark results to {args.output}")
@@ -0,0 +1,167 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import logging
+import tempfile
+import numpy as np
+import torch
+from PIL import Image
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_pipeline import list_benchmark_images
+from models import segmentation_model, identification_model
+from utils.preprocessing import load_image, preprocess_image_array
+from utils.postprocessing import extract_object_crops
+from utils.precision import precision_modes, apply_precision, precision_context
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def mask_iou(mask_a, mask_b):
+    union = np.logical_or(mask_a, mask_b).sum()
+    return float(np.logical_and(mask_a, mask_b).sum() / union) if union else 1.0
+
+def match_detections(reference, candidate, score_threshold=0.5, mask_threshold=0.5):
+    """Pair each confident reference detection with the candidate mask it overlaps most.
+
+    Returns (ious, label_matches) with one entry per reference detection; a
+    detection with no overlapping candidate counts as IoU 0 and a mismatch.
+    """
+    keep = reference['scores'] > score_threshold
+    reference_masks = reference['masks'][keep, 0] > mask_threshold
+    reference_labels = reference['labels'][keep]
+    candidate_keep = candidate['scores'] > score_threshold
+    candidate_masks = candidate['masks'][candidate_keep, 0] > mask_threshold
+    candidate_labels = candidate['labels'][candidate_keep]
+
+    ious, label_matches = [], []
+    for mask, label in zip(reference_masks, reference_labels):
+        overlaps = [mask_iou(mask, other) for other in candidate_masks]
+        best = int(np.argmax(overlaps)) if overlaps else None
+        if best is None or overlaps[best] == 0:
+            ious.append(0.0)
+            label_matches.append(False)
+            continue
+        ious.append(overlaps[best])
+        label_matches.append(bool(candidate_labels[best] == label))
+    return ious, label_matches
+
+def run_segmentation(model, mode, image_tensors):
+    """Return (predictions as NumPy dicts, seconds per image) for one model and precision mode."""
+    device = segmentation_model.device
+    predictions = []
+    with torch.no_grad(), precision_context(mode, device):
+        model(image_tensors[0])  # Warm-up
+        start_time = time.perf_counter()
+        for image_tensor in image_tensors:
+            prediction = model(image_tensor)[0]
+            predictions.append({key: value.float().cpu().numpy() if value.is_floating_point() else value.cpu().numpy()
+                                for key, value in prediction.items()})
+        elapsed = time.perf_counter() - start_time
+    return predictions, elapsed / len(image_tensors)
+
+def run_clip(model, mode, images, text_features):
+    """Return (top label indices, normalized image embeddings, seconds per crop)."""
+    device = identification_model.device
+    with torch.no_grad():
+        with precision_context(mode, device):
+            model.encode_image(images[:1])  # Warm-up
+            start_time = time.perf_counter()
+            image_features = model.encode_image(images)
+            elapsed = time.perf_counter() - start_time
+        image_features = image_features.float()
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+        top_indices = (image_features @ text_features.T).argmax(dim=-1)
+    return top_indices.cpu().numpy(), image_features.cpu(), elapsed / len(images)
+
+def check_precision(image_paths, modes, score_threshold=0.5):
+    """Compare every precision mode against fp32 on the images and return one report row per model and mode."""
+    seg_device = segmentation_model.device
+    images = [load_image(image_path) for image_path in image_paths]
+    image_tensors = [preprocess_image_array(image, seg_device) for image in images]
+
+    # The registry loads fp32 models; the reduced precision variants are derived from copies of them
+    seg_model = segmentation_model.get_segmentation_model()
+    reference, seg_seconds = run_segmentation(seg_model, 'fp32', image_tensors)
+
+    crops = [obj['crop'] for image, prediction in zip(images, reference)
+             for obj in extract_object_crops(prediction['masks'], prediction['scores'], image, score_threshold)]
+    clip_model, preprocess = identification_model.get_clip_model()
+    text_features = identification_model.get_text_features()
+    clip_images = None
+    if crops:
+        clip_images = torch.stack([preprocess(Image.fromarray(np.ascontiguousarray(crop[:, :, ::-1])))
+                                   for crop in crops]).to(identification_model.device)
+        clip_reference, clip_reference_features, clip_seconds = run_clip(clip_model, 'fp32', clip_images,
+                                                                         text_features)
+
+    rows = [{'model': 'segmentation', 'precision': 'fp32', 'seconds_per_item': seg_seconds, 'speedup': 1.0,
+             'label_agreement': 1.0, 'mask_iou': 1.0, 'items': len(image_tensors)}]
+    if clip_images is not None:
+        rows.append({'model': 'clip', 'precision': 'fp32', 'seconds_per_item': clip_seconds, 'speedup': 1.0,
+                     'label_agreement': 1.0, 'embedding_cosine': 1.0, 'items': len(crops)})
+
+    for mode in modes:
+        variant = apply_precision(copy.deepcopy(seg_model), mode, seg_device)
+        predictions, seconds = run_segmentation(variant, mode, image_tensors)
+        ious, label_matches = [], []
+        for expected, actual in zip(reference, predictions):
+            image_ious, image_matches = match_detections(expected, actual, score_threshold)
+            ious += image_ious
+            label_matches += image_matches
+        rows.append({'model': 'segmentation', 'precision': mode, 'seconds_per_item': seconds,
+                     'speedup': seg_seconds / seconds, 'items': len(image_tensors),
+                     'label_agreement': float(np.mean(label_matches)) if label_matches else None,
+                     'mask_iou': float(np.mean(ious)) if ious else None})
+
+        if clip_images is None:
+            continue
+        variant = apply_precision(copy.deepcopy(clip_model), mode, identification_model.device)
+        top_indices, features, seconds = run_clip(variant, mode, clip_images, text_features)
+        rows.append({'model': 'clip', 'precision': mode, 'seconds_per_item': seconds,
+                     'speedup': clip_seconds / seconds, 'items': len(crops),
+                     'label_agreement': float(np.mean(top_indices == clip_reference)),
+                     'embedding_cosine': float((features * clip_reference_features).sum(dim=-1).mean())})
+    return rows
+
+def format_rows(rows):
+    lines = [f"{'model':<14}{'precision':<11}{'items':>7}{'ms/item':>10}{'speedup':>9}{'labels':>8}"
+             f"{'mask IoU':>10}{'cosine':>8}"]
+    for row in rows:
+        def fmt(key, spec):
+            return format(row[key], spec) if row.get(key) is not None else '-'
+        lines.append(f"{row['model']:<14}{row['precision']:<11}{row['items']:>7}"
+                     f"{row['seconds_per_item'] * 1000:>10.1f}{fmt('speedup', '.2f'):>9}"
+                     f"{fmt('label_agreement', '.3f'):>8}{fmt('mask_iou', '.3f'):>10}{fmt('embedding_cosine', '.4f'):>8}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare reduced precision Mask R-CNN and CLIP against fp32.")
+    parser.add_argument('--images-dir', default=segmentation_model.input_images_dir)
+    parser.add_argument('--modes', nargs='+', choices=[m for m in precision_modes if m != 'fp32'],
+                        default=['int8', 'bf16'])
+    parser.add_argument('--score-threshold', type=float, default=0.5)
+    parser.add_argument('--stand-in', action='store_true', help="Use tiny stand-in models (checks the plumbing only).")
+    parser.add_argument('--output', help="Write the report as JSON.")
+    args = parser.parse_args()
+
+    if args.stand_in:
+        from benchmarks.stand_ins import install_stand_in_models
+        install_stand_in_models(text_embeddings_dir=tempfile.mkdtemp())
+
+    image_paths = [path for path, _ in list_benchmark_images(args.images_dir)]
+    if not image_paths:
+        sys.exit(f"No images found in {args.images_dir}")
+
+    rows = check_precision(image_paths, args.modes, args.score_threshold)
+    print(format_rows(rows))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as json_file:
+            json.dump({'images': len(image_paths), 'results': rows}, json_file, indent=4)
+        logging.info(f"Saved precision report to {args.output}")
@@ -0,0 +1,139 @@
+import os
+import cv2
+import numpy as np
+import torch
+from torch import nn
+from torchvision import transforms
+
+from models import registry
+
+class StandInSegmentation(nn.Module):
+    """Tiny Mask R-CNN stand-in: a few convolutions plus a fixed grid of box-shaped detections.
+
+    It takes and returns the same structures as torchvision's detection
+    models, so the real pre- and post-processing code runs unchanged.
+    """
+
+    def __init__(self, objects_per_image=5):
+        super().__init__()
+        self.objects_per_image = objects_per_image
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 8, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(8, 16, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(16, 1, 3, stride=2, padding=1),
+        )
+
+    def forward(self, images):
+        predictions = []
+        for image in images:
+            _, height, width = image.shape
+            # The convolutions only stand in for backbone compute; detections come from a fixed grid
+            self.features(image.unsqueeze(0))
+            masks = torch.zeros(self.objects_per_image, 1, height, width)
+            boxes = []
+            columns = max(1, int(np.ceil(np.sqrt(self.objects_per_image))))
+            cell_width, cell_height = width // columns, height // columns
+            for i in range(self.objects_per_image):
+                x_min = (i % columns) * cell_width + cell_width // 4
+                y_min = (i // columns) * cell_height + cell_height // 4
+                x_max, y_max = x_min + cell_width // 2, y_min + cell_height // 2
+                masks[i, 0, y_min:y_max, x_min:x_max] = 1.0
+                boxes.append([x_min, y_min, x_max, y_max])
+            predictions.append({
+                'boxes': torch.tensor(boxes, dtype=torch.float32),
+                'labels': torch.ones(self.objects_per_image, dtype=torch.int64),
+                'scores': torch.full((self.objects_per_image,), 0.9),
+                'masks': masks,
+            })
+        return predictions
+
+class StandInClip(nn.Module):
+    """Tiny CLIP stand-in with encode_image / encode_text and a 224px preprocess."""
+
+    def __init__(self, embedding_size=512, input_resolution=224):
+        super().__init__()
+        self.visual = nn.Module()
+        self.visual.input_resolution = input_resolution
+        self.image_encoder = nn.Sequential(
+            nn.Conv2d(3, 16, 7, stride=4, padding=3), nn.ReLU(),
+            nn.Conv2d(16, 32, 3, stride=2, padding=1), nn.ReLU(),
+            nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(32, embedding_size),
+        )
+        self.embedding_size = embedding_size
+
+    def encode_image(self, images):
+        return self.image_encoder(images)
+
+    def encode_text(self, labels):
+        generator = torch.Generator().manual_seed(0)
+        return torch.randn(len(labels), self.embedding_size, generator=generator)
+
+    def preprocess(self):
+        return transforms.Compose([
+            transforms.Resize(self.visual.input_resolution),
+            transforms.CenterCrop(self.visual.input_resolution),
+            transforms.ToTensor(),
+        ])
+
+class StandInOcrReader:
+    """EasyOCR stand-in that finds dark-on-light text blobs with thresholding and contours."""
+
+    def readtext(self, image):
+        horizontal_list, free_list = self.detect(image)
+        return self.recognize(image, horizontal_list=horizontal_list[0], free_list=free_list[0])
+
+    def detect(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        binary = cv2.dilate(binary, np.ones((3, 15), np.uint8))
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        horizontal = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w > 2 * h and h >= 8:
+                horizontal.append([x, x + w, y, y + h])
+        return [horizontal], [[]]
+
+    def recognize(self, image, horizontal_list=(), free_list=(), batch_size=1):
+        results = []
+        for x_min, x_max, y_min, y_max in horizontal_list:
+            roi = image[y_min:y_max, x_min:x_max]
+            confidence = float(roi.std() / 128.0) if roi.size else 0.0
+            results.append(([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]], 'TEXT',
+                            min(1.0, confidence)))
+        for polygon in free_list:
+            results.append((polygon, 'TEXT', 0.5))
+        return results
+
+def install_stand_in_models(objects_per_image=5, text_embeddings_dir=None):
+    """Register tiny stand-ins for Mask R-CNN, CLIP and EasyOCR so benchmarks run offline on CPU.
+
+    text_embeddings_dir redirects the CLIP label embedding cache so the
+    real clip package is never needed to encode the labels.
+    """
+    from models import identification_model
+
+    segmentation = StandInSegmentation(objects_per_image).eval()
+    clip_model = StandInClip().eval()
+    registry.set_model('segmentation', segmentation)
+    registry.set_model('clip', (clip_model, clip_model.preprocess()))
+    registry.set_model('ocr', StandInOcrReader())
+
+    if text_embeddings_dir is not None:
+        identification_model.text_embeddings_cache_dir = text_embeddings_dir
+    write_stand_in_text_features(identification_model.descriptions, clip_model.embedding_size)
+
+def write_stand_in_text_features(labels, embedding_size=512, seed=0):
+    """Write random normalized label embeddings where get_text_features looks for them.
+
+    The real text encoder needs the clip package, so benchmarks on stand-ins
+    pre-fill the text embedding cache for every label list they use.
+    """
+    from models import identification_model
+
+    generator = torch.Generator().manual_seed(seed)
+    text_features = torch.randn(len(labels), embedding_size, generator=generator)
+    text_features /= text_features.norm(dim=-1, keepdim=True)
+    cache_path = identification_model.text_embeddings_cache_path(labels)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    torch.save(text_features, cache_path)
@@ -0,0 +1,74 @@
+import os
+import argparse
+import cv2
+import numpy as np
+
+# Words drawn onto synthetic images as text lines
+synthetic_words = ['STOP', 'EXIT', 'OPEN', 'SALE', 'PARKING', 'CAFE', 'BUS', 'HOTEL', 'NO ENTRY', 'TAXI']
+
+def make_synthetic_image(width=1280, height=720, num_objects=5, text_lines=3, seed=0):
+    """Draw a BGR test image with filled shapes as objects and printed words as text.
+
+    Returns (image, object_boxes, text_boxes) with (x_min, y_min, x_max, y_max)
+    boxes, so benchmarks can also sanity-check what the stages find.
+    """
+    rng = np.random.default_rng(seed)
+    # Smooth background gradient plus noise so compression and detection are not trivial
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = np.linspace(40, 120, width, dtype=np.uint8)[None, :, None]
+    image = cv2.add(image, rng.integers(0, 20, size=image.shape, dtype=np.uint8))
+
+    object_boxes = []
+    for _ in range(num_objects):
+        box_width = int(rng.integers(width // 10, width // 3))
+        box_height = int(rng.integers(height // 10, height // 3))
+        x_min = int(rng.integers(0, width - box_width))
+        y_min = int(rng.integers(0, height - box_height))
+        color = tuple(int(c) for c in rng.integers(60, 255, size=3))
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (x_min, y_min), (x_min + box_width, y_min + box_height), color, -1)
+        else:
+            center = (x_min + box_width // 2, y_min + box_height // 2)
+            cv2.ellipse(image, center, (box_width // 2, box_height // 2), 0, 0, 360, color, -1)
+        object_boxes.append((x_min, y_min, x_min + box_width, y_min + box_height))
+
+    text_boxes = []
+    font_scale = max(0.6, height / 720)
+    for _ in range(text_lines):
+        word = str(rng.choice(synthetic_words))
+        (text_width, text_height), baseline = cv2.getTextSize(word, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 2)
+        x_min = int(rng.integers(0, max(1, width - text_width)))
+        y_min = int(rng.integers(0, max(1, height - text_height - baseline)))
+        cv2.rectangle(image, (x_min - 4, y_min - 4), (x_min + text_width + 4, y_min + text_height + baseline + 4),
+                      (255, 255, 255), -1)
+        cv2.putText(image, word, (x_min, y_min + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 2,
+                    cv2.LINE_AA)
+        text_boxes.append((x_min, y_min, x_min + text_width, y_min + text_height + baseline))
+
+    return image, object_boxes, text_boxes
+
+def write_synthetic_images(output_dir, count=16, width=1280, height=720, num_objects=5, text_lines=3, seed=0):
+    """Write count synthetic JPEGs to output_dir and return their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    image_paths = []
+    for i in range(count):
+        image, _, _ = make_synthetic_image(width, height, num_objects, text_lines, seed=seed + i)
+        image_path = os.path.join(output_dir, f"synthetic_{i:05d}.jpg")
+        cv2.imwrite(image_path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        image_paths.append(image_path)
+    return image_paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark images.")
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=16)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--objects', type=int, default=5, help="Shapes drawn per image.")
+    parser.add_argument('--text-lines', type=int, default=3, help="Words drawn per image.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_synthetic_images(args.output_dir, args.count, args.width, args.height, args.objects,
+                                   args.text_lines, args.seed)
+    print(f"Wrote {len(paths)} images to {args.output_dir}")
@@ -0,0 +1,112 @@
+import os
+import json
+import logging
+import torch
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Only needed for the onnx backend
+    ort = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# torch runs the eager modules; torchscript and onnx run graphs written by models/export.py
+inference_backends = ('torch', 'torchscript', 'onnx')
+exported_models_dir = 'data/exported'
+onnx_opset = 17
+# Intra-op threads per ONNX Runtime session; 0 lets ONNX Runtime decide
+onnx_num_threads = 0
+# TorchScript graphs run where the eager models would, so their inputs need no extra copies
+device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+
+def exported_model_path(name, fmt):
+    extension = '.onnx' if fmt == 'onnx' else '.pt'
+    return os.path.join(exported_models_dir, f"{name}{extension}")
+
+def export_info_path(name):
+    return os.path.join(exported_models_dir, f"{name}.json")
+
+def write_export_info(name, info):
+    """Save what a backend needs to rebuild the model interface, e.g. the input resolution."""
+    os.makedirs(exported_models_dir, exist_ok=True)
+    with open(export_info_path(name), 'w') as info_file:
+        json.dump(info, info_file, indent=4)
+
+def read_export_info(name):
+    with open(export_info_path(name)) as info_file:
+        return json.load(info_file)
+
+class OnnxGraph:
+    """Runs an exported graph on the ONNX Runtime CPU execution provider, torch tensors in and out."""
+
+    def __init__(self, path, num_threads=onnx_num_threads):
+        if ort is None:
+            raise ImportError("The onnx backend requires onnxruntime (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [graph_input.name for graph_input in self.session.get_inputs()]
+
+    def __call__(self, *inputs):
+        feeds = {name: tensor.detach().cpu().numpy() for name, tensor in zip(self.input_names, inputs)}
+        return [torch.from_numpy(output) for output in self.session.run(None, feeds)]
+
+class TorchScriptGraph:
+    """Runs an exported TorchScript module on the model device and returns its outputs as a list of tensors."""
+
+    def __init__(self, path, device=device):
+        self.device = device
+        self.module = torch.jit.load(path, map_location=device).eval()
+
+    def __call__(self, *inputs):
+        with torch.no_grad():
+            outputs = self.module(*(tensor.to(self.device) for tensor in inputs))
+        return list(outputs) if isinstance(outputs, (tuple, list)) else [outputs]
+
+def load_graph(name, fmt):
+    """Load the exported graph of a model component for the torchscript or onnx backend."""
+    path = exported_model_path(name, fmt)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No exported {fmt} graph for '{name}' at {path}; run python models/export.py first")
+    logging.info(f"Loading {fmt} graph {path}.")
+    return OnnxGraph(path) if fmt == 'onnx' else TorchScriptGraph(path)
+
+def export_graph(module, example_inputs, name, fmt, input_names=None, output_names=None, dynamic_axes=None,
+                 script=False):
+    """Export an eval-mode module as ONNX or TorchScript and return the file path.
+
+    TorchScript modules are traced (or scripted when the module has
+    data-dependent control flow) and frozen for inference.
+    """
+    os.makedirs(exported_models_dir, exist_ok=True)
+    path = exported_model_path(name, fmt)
+    module = module.eval()
+    with torch.no_grad():
+        if fmt == 'onnx':
+            torch.onnx.export(module, example_inputs, path, input_names=input_names, output_names=output_names,
+                              dynamic_axes=dynamic_axes, opset_version=onnx_opset, do_constant_folding=True)
+        elif script:
+            torch.jit.save(torch.jit.script(module), path)
+        else:
+            traced = torch.jit.trace(module, example_inputs, check_trace=False)
+            torch.jit.save(torch.jit.optimize_for_inference(traced), path)
+    logging.info(f"Exported '{name}' to {path}.")
+    return path
+
+def max_abs_difference(expected, actual):
+    """Largest absolute difference between two lists of tensors, or inf if their shapes differ."""
+    difference = 0.0
+    for expected_tensor, actual_tensor in zip(expected, actual):
+        if expected_tensor.shape != actual_tensor.shape:
+            return float('inf')
+        if expected_tensor.numel():
+            difference = max(difference, (expected_tensor.float() - actual_tensor.float().to(expected_tensor.device)).abs().max().item())
+    return difference
+
+def add_backend_argument(parser, default='torch'):
+    """Add the shared --backend flag to a stage CLI."""
+    parser.add_argument('--backend', choices=inference_backends, default=default,
+                        help="Run eager PyTorch or the TorchScript / ONNX Runtime graph from models/export.py.")
@@ -0,0 +1,94 @@
+import os
+import sys
+import argparse
+import logging
+import torch
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import backends
+from models.backends import max_abs_difference
+from models import segmentation_model, identification_model, text_extraction_model
+from utils.preprocessing import load_image, preprocess_image_array
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+exportable_models = ('segmentation', 'clip', 'ocr')
+# Largest absolute output difference tolerated between the eager model and its exported graph
+parity_tolerance = 1e-3
+
+def example_segmentation_image():
+    """Return a (3, H, W) input from the first sample image, or noise if there is none."""
+    image_items = segmentation_model.list_input_images() if os.path.isdir(segmentation_model.input_images_dir) else []
+    if image_items:
+        return preprocess_image_array(load_image(image_items[0][0]), 'cpu')[0]
+    return torch.rand(3, 600, 800)
+
+def parity_segmentation_image(image):
+    """Crop the export example to another height and width, so the check exercises the dynamic image axes."""
+    _, height, width = image.shape
+    return image[:, :height * 3 // 4, :width * 5 // 6].contiguous()
+
+def check_segmentation_parity(model, fmt, image):
+    expected = model([image])[0]
+    actual = segmentation_model.load_segmentation_model(backend=fmt)([image])[0]
+    keys = ['boxes', 'labels', 'scores', 'masks']
+    return max_abs_difference([expected[key] for key in keys], [actual[key] for key in keys])
+
+def check_clip_parity(model, fmt):
+    import clip
+    # Batch sizes differ from the export examples to exercise the dynamic batch axis
+    resolution = model.visual.input_resolution
+    images = torch.rand(3, 3, resolution, resolution)
+    tokens = clip.tokenize(['a red car', 'a dog', 'a bottle'])
+    exported, _ = identification_model.load_clip_model(backend=fmt)
+    return max(max_abs_difference([model.encode_image(images)], [exported.encode_image(images)]),
+               max_abs_difference([model.encode_text(tokens)], [exported.encode_text(tokens)]))
+
+def check_ocr_parity(reader, fmt):
+    exported = text_extraction_model.load_ocr_reader(backend=fmt, quantize=False)
+    images, lines = torch.rand(1, 3, 320, 416), torch.rand(3, 1, 64, 180)
+    return max(max_abs_difference(list(reader.detector(images)), list(exported.detector(images))),
+               max_abs_difference([reader.recognizer(lines, None)], [exported.recognizer(lines)]))
+
+def export_models(names, fmt):
+    """Export each model from its fp32 eager weights, then compare the graph against eager PyTorch.
+
+    Returns {name: max absolute output difference}.
+    """
+    differences = {}
+    with torch.no_grad():
+        if 'segmentation' in names:
+            model = segmentation_model.load_segmentation_model('fp32', backend='torch').cpu()
+            image = example_segmentation_image()
+            segmentation_model.export_segmentation_model(model, fmt, image)
+            differences['segmentation'] = check_segmentation_parity(model, fmt, parity_segmentation_image(image))
+        if 'clip' in names:
+            model, _ = identification_model.load_clip_model('fp32', backend='torch')
+            identification_model.export_clip_model(model, fmt)
+            differences['clip'] = check_clip_parity(model.float().cpu(), fmt)
+        if 'ocr' in names:
+            # EasyOCR quantizes its CPU networks by default; graphs are exported from the float weights
+            reader = text_extraction_model.load_ocr_reader(backend='torch', quantize=False)
+            text_extraction_model.export_ocr_model(reader, fmt)
+            differences['ocr'] = check_ocr_parity(reader, fmt)
+    return differences
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export Mask R-CNN, CLIP and EasyOCR for the torchscript or onnx backend.")
+    parser.add_argument('--models', nargs='+', choices=exportable_models, default=list(exportable_models))
+    parser.add_argument('--format', choices=['torchscript', 'onnx'], default='onnx')
+    parser.add_argument('--output-dir', default=backends.exported_models_dir)
+    args = parser.parse_args()
+
+    backends.exported_models_dir = args.output_dir
+    differences = export_models(args.models, args.format)
+    failed = False
+    for name, difference in differences.items():
+        status = 'ok' if difference <= parity_tolerance else 'MISMATCH'
+        failed = failed or difference > parity_tolerance
+        print(f"{name:<14}{args.format:<13}max abs diff {difference:.2e}  {status}")
+    if failed:
+        sys.exit(1)
@@ -1,11 +1,31 @@
 import torch
-import clip
+import numpy as np
 from PIL import Image
+from torch import nn
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+from types import SimpleNamespace
 import pandas as pd
+import hashlib
 import json
+import argparse
 import os
+import sys
 import logging
 
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.registry import register_model, get_model
+from models.backends import load_graph, export_graph, read_export_info, write_export_info, add_backend_argument
+from utils.cache import get_result_cache, file_content_hash, config_fingerprint, add_cache_arguments
+from utils.manifest import (load_manifest, save_manifest, recorded_inputs, upstream_fingerprint, plan_stage,
+                            record_stage, forget_stage, merge_records)
+from utils.storage import read_table, save_output, load_output_records, add_output_format_argument, set_output_format
+from utils.metrics import timed, instrument, add_metrics_arguments, write_metrics_report
+from utils.precision import apply_precision, precision_context, add_precision_argument
+from utils.embedding_store import get_embedding_store
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -14,6 +34,37 @@ segmented_objects_dir = 'data/segmented_objects'
 metadata_file = 'data/metadata.csv'
 descriptions_file = 'data/descriptions.csv'
 descriptions_json_file = 'data/descriptions.json'
+text_embeddings_cache_dir = 'data/cache/text_embeddings'
+
+# Batched identification settings
+clip_model_name = "ViT-B/32"
+identification_batch_size = 32
+identification_num_workers = 2
+# Inference precision: 'fp32', 'int8' (dynamic quantization of the transformer linears, CPU) or 'bf16' autocast
+clip_precision = 'fp32'
+# Inference backend: 'torch' (eager) or the 'torchscript' / 'onnx' encoders written by models/export.py
+clip_backend = 'torch'
+# Keep every crop's normalized image embedding in the embedding store for search and re-labelling
+store_embeddings = True
+
+# Open-vocabulary labelling: a labels file has one label per line; None uses the built-in descriptions
+labels_file = None
+# Prompt templates averaged into one embedding per label; ['{}'] encodes the bare labels
+prompt_templates = ['{}']
+ensemble_prompt_templates = ['a photo of a {}.', 'a photo of the {}.', 'a photo of one {}.', 'a close-up photo of a {}.',
+                             'a cropped photo of a {}.', 'a bright photo of a {}.', 'a dark photo of a {}.',
+                             'a blurry photo of a {}.', 'a good photo of a {}.', 'a photo of a small {}.',
+                             'a photo of a large {}.', 'a rendering of a {}.']
+# Labels per text encoder call when building the label embedding matrix
+text_encode_batch_size = 256
+# Labels scored per matrix multiply; bounds memory for vocabularies of tens of thousands of labels
+label_chunk_size = 8192
+# Labels returned per object; above 1 the outputs get a top_labels column
+label_top_k = 1
+# Softmax temperature over the whole vocabulary (CLIP's logit scale)
+label_temperature = 100.0
+# Stored embeddings scored per step when re-labelling
+relabel_block_size = 4096
 
 # Define textual descriptions
 descriptions = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 
@@ -30,64 +81,513 @@ descriptions = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'tr
                 'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 
                 'hair drier', 'toothbrush']
 
-# Load CLIP model and preprocess function
 device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
-text_inputs = clip.tokenize(descriptions).to(device)  # Tokenize once and move to device
+
+# Label lists already read in this process, keyed by file path
+_labels_cache = {}
+
+def load_labels(path):
+    """Read one label per line, skipping blank lines, '#' comments and repeated labels."""
+    labels = []
+    with open(path, encoding='utf-8') as labels_handle:
+        for line in labels_handle:
+            label = line.strip()
+            if label and not label.startswith('#'):
+                labels.append(label)
+    return list(dict.fromkeys(labels))
+
+def get_labels():
+    """Return the configured label vocabulary: the labels file if set, else the built-in descriptions."""
+    if labels_file is None:
+        return descriptions
+    if labels_file not in _labels_cache:
+        _labels_cache[labels_file] = load_labels(labels_file)
+        logging.info(f"Loaded {len(_labels_cache[labels_file])} labels from {labels_file}.")
+    return _labels_cache[labels_file]
+
+class ClipImageEncoder(nn.Module):
+    """CLIP's image tower as a standalone module for export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, images):
+        return self.model.encode_image(images)
+
+class ClipTextEncoder(nn.Module):
+    """CLIP's text tower as a standalone module for export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens):
+        return self.model.encode_text(tokens)
+
+class ExportedClipModel:
+    """Exported CLIP encoders behind the eager model's encode_image / encode_text interface.
+
+    Features are returned on the model device like the eager encoders', since
+    ONNX Runtime always hands back CPU tensors.
+    """
+
+    def __init__(self, image_graph, text_graph, input_resolution):
+        self.image_graph = image_graph
+        self.text_graph = text_graph
+        self.visual = SimpleNamespace(input_resolution=input_resolution)
+
+    def encode_image(self, images):
+        return self.image_graph(images)[0].to(device)
+
+    def encode_text(self, tokens):
+        return self.text_graph(tokens)[0].to(device)
+
+def _convert_image_to_rgb(image):
+    return image.convert('RGB')
+
+def clip_preprocess(input_resolution):
+    """CLIP's image transform, rebuilt so the exported encoders do not need the eager model."""
+    return transforms.Compose([
+        transforms.Resize(input_resolution, interpolation=transforms.InterpolationMode.BICUBIC),
+        transforms.CenterCrop(input_resolution),
+        _convert_image_to_rgb,
+        transforms.ToTensor(),
+        transforms.Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711)),
+    ])
+
+def load_clip_model(precision=None, backend=None):
+    """Load the CLIP model in the configured precision and backend, plus its preprocess function."""
+    backend = backend or clip_backend
+    if backend != 'torch':
+        if (precision or clip_precision) != 'fp32':
+            logging.warning("Precision modes only apply to the torch backend; exported graphs run in fp32.")
+        input_resolution = read_export_info('clip')['input_resolution']
+        model = ExportedClipModel(load_graph('clip_image', backend), load_graph('clip_text', backend),
+                                  input_resolution)
+        return model, clip_preprocess(input_resolution)
+
+    import clip
+    model, preprocess = clip.load(clip_model_name, device=device)
+    return apply_precision(model.eval(), precision or clip_precision, device), preprocess
+
+register_model('clip', load_clip_model)
+
+def export_clip_model(model, fmt):
+    """Export the image and text encoders of an fp32 eager CLIP model; the batch size stays dynamic."""
+    import clip
+    model = model.float().cpu().eval()
+    input_resolution = model.visual.input_resolution
+    images = torch.rand(2, 3, input_resolution, input_resolution)
+    tokens = clip.tokenize(['a photo of a cat', 'a stop sign'])
+    export_graph(ClipImageEncoder(model), (images,), 'clip_image', fmt, input_names=['images'],
+                 output_names=['image_features'],
+                 dynamic_axes={'images': {0: 'batch'}, 'image_features': {0: 'batch'}})
+    export_graph(ClipTextEncoder(model), (tokens,), 'clip_text', fmt, input_names=['tokens'],
+                 output_names=['text_features'], dynamic_axes={'tokens': {0: 'batch'}, 'text_features': {0: 'batch'}})
+    write_export_info('clip', {'model_name': clip_model_name, 'input_resolution': input_resolution})
+
+def get_clip_model():
+    """Return the shared (model, preprocess) pair, loading CLIP on first use."""
+    return get_model('clip')
+
+# Normalized text embeddings already computed in this process, keyed by cache path
+_text_features_cache = {}
+
+def text_embeddings_cache_path(labels, model_name=clip_model_name, templates=None):
+    """Return the on-disk location of the text embeddings for a model, label list and prompt templates."""
+    templates = list(templates or prompt_templates)
+    labels_key = '\n'.join(labels)
+    # Bare labels keep the hash they had before prompt templates existed
+    if templates != ['{}']:
+        labels_key = '\n'.join(templates) + '\n\n' + labels_key
+    labels_hash = hashlib.sha1(labels_key.encode('utf-8')).hexdigest()[:16]
+    safe_model_name = model_name.replace('/', '-')
+    # Reduced precision embeddings differ slightly, so they get their own file; fp32 keeps the old name
+    if clip_precision != 'fp32':
+        safe_model_name = f"{safe_model_name}_{clip_precision}"
+    return os.path.join(text_embeddings_cache_dir, f"{safe_model_name}_{labels_hash}.pt")
+
+def encode_texts(texts):
+    """Return normalized CLIP text embeddings for arbitrary texts, e.g. search queries, without caching them."""
+    import clip
+    model, _ = get_clip_model()
+    with timed('identification.text_encode', items=len(texts)), torch.no_grad(), \
+            precision_context(clip_precision, device):
+        text_inputs = clip.tokenize(texts, truncate=True).to(device)
+        text_features = model.encode_text(text_inputs).float()
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+    return text_features
+
+def build_text_features(labels, templates=None, batch_size=None):
+    """Encode labels in batches, averaging the normalized embeddings of each label's prompts."""
+    templates = list(templates or prompt_templates)
+    batch_size = batch_size or text_encode_batch_size
+    text_features = None
+    for start in range(0, len(labels), batch_size):
+        batch = labels[start:start + batch_size]
+        batch_features = sum(encode_texts([template.format(label) for label in batch]) for template in templates)
+        batch_features /= batch_features.norm(dim=-1, keepdim=True)
+        if text_features is None:
+            text_features = torch.empty(len(labels), batch_features.shape[1])
+        text_features[start:start + len(batch)] = batch_features.cpu()
+        if len(labels) > batch_size:
+            logging.info(f"Encoded {start + len(batch)}/{len(labels)} labels.")
+    return text_features
+
+def get_text_features(labels=None, templates=None):
+    """Return the normalized text embedding matrix for the labels, encoding it at most once."""
+    labels = labels or get_labels()
+    cache_path = text_embeddings_cache_path(labels, templates=templates)
+    if cache_path in _text_features_cache:
+        return _text_features_cache[cache_path]
+
+    text_features = None
+    if os.path.exists(cache_path):
+        try:
+            text_features = torch.load(cache_path, map_location=device)
+            logging.info(f"Loaded cached text embeddings from {cache_path}.")
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable text embeddings cache {cache_path}: {e}")
+
+    if text_features is None:
+        text_features = build_text_features(labels, templates)
+        os.makedirs(text_embeddings_cache_dir, exist_ok=True)
+        torch.save(text_features.cpu(), cache_path)
+        logging.info(f"Saved text embeddings for {len(labels)} labels to {cache_path}.")
+
+    text_features = text_features.to(device)
+    _text_features_cache[cache_path] = text_features
+    return text_features
+
+class SegmentedObjectDataset(Dataset):
+    """Loads and preprocesses segmented object crops for batched CLIP inference."""
+
+    def __init__(self, image_paths):
+        self.image_paths = list(image_paths)
+        model, self.preprocess = get_clip_model()
+        self.input_resolution = model.visual.input_resolution
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, index):
+        image_path = self.image_paths[index]
+        try:
+            image = self.preprocess(Image.open(image_path))
+            return image, index, True
+        except Exception as e:
+            logging.error(f"Error processing image {image_path}: {e}")
+            # Placeholder keeps the batch shape; the flag drops it from the results
+            return torch.zeros(3, self.input_resolution, self.input_resolution), index, False
+
+def build_object_loader(image_paths, batch_size=identification_batch_size, num_workers=identification_num_workers):
+    """Create a prefetching DataLoader over the crop image paths."""
+    loader_kwargs = {
+        'batch_size': batch_size,
+        'shuffle': False,
+        'num_workers': num_workers,
+        'pin_memory': device == "cuda",
+    }
+    if num_workers > 0:
+        loader_kwargs['prefetch_factor'] = 2
+        loader_kwargs['persistent_workers'] = False
+    return DataLoader(SegmentedObjectDataset(image_paths), **loader_kwargs)
+
+def top_k_labels(image_features, text_features, k=None, temperature=None, chunk_size=None):
+    """Return (probabilities, label indices) of the k best labels per image, best first.
+
+    Similarities are computed chunk_size labels at a time with a running
+    top-k and log-sum-exp, so the probabilities are a softmax over the whole
+    vocabulary while memory stays bounded by one (images, chunk_size) block.
+    """
+    k = k or label_top_k
+    temperature = temperature or label_temperature
+    chunk_size = chunk_size or label_chunk_size
+    best_logits, best_indices, log_norm = None, None, None
+    for start in range(0, len(text_features), chunk_size):
+        logits = temperature * image_features @ text_features[start:start + chunk_size].T
+        chunk_norm = torch.logsumexp(logits, dim=-1)
+        log_norm = chunk_norm if log_norm is None else torch.logaddexp(log_norm, chunk_norm)
+        candidate_logits, candidate_indices = logits.topk(min(k, logits.shape[1]), dim=-1)
+        candidate_indices = candidate_indices + start
+        if best_logits is not None:
+            candidate_logits = torch.cat([best_logits, candidate_logits], dim=1)
+            candidate_indices = torch.cat([best_indices, candidate_indices], dim=1)
+        best_logits, positions = candidate_logits.topk(min(k, candidate_logits.shape[1]), dim=-1)
+        best_indices = candidate_indices.gather(1, positions)
+    return (best_logits - log_norm.unsqueeze(1)).exp(), best_indices
+
+def label_result(labels, label_indices, probabilities, k=None):
+    """Return (description, score) for one object, plus the [label, score] list of the top k when k > 1.
+
+    The shape follows k (label_top_k by default), not how many labels were
+    found, so a vocabulary smaller than k still yields the top list.
+    """
+    if (k or label_top_k) == 1:
+        return labels[label_indices[0]], probabilities[0]
+    return (labels[label_indices[0]], probabilities[0],
+            [[labels[index], probability] for index, probability in zip(label_indices, probabilities)])
+
+def identify_objects_batch(image_paths, labels=None, batch_size=identification_batch_size,
+                           num_workers=identification_num_workers, return_embeddings=False):
+    """Classify crops in mini-batches and return a (description, score) tuple or None per path.
+
+    The tuples gain a third item, the top label_top_k [label, score] pairs,
+    when label_top_k is above 1.
+
+    With return_embeddings, also return the normalized image embeddings as
+    an (n, dim) float32 array whose rows for unreadable crops are zero.
+    """
+    image_paths = list(image_paths)
+    results = [None] * len(image_paths)
+    embeddings = None
+    if not image_paths:
+        return (results, np.zeros((0, 0), dtype=np.float32)) if return_embeddings else results
+
+    labels = labels or get_labels()
+    text_features = get_text_features(labels)
+    loader = build_object_loader(image_paths, batch_size=batch_size, num_workers=num_workers)
+
+    for images, indices, valid in loader:
+        if not valid.any():
+            continue
+        batch_results, batch_embeddings = classify_image_batch(images[valid], text_features, labels,
+                                                               return_embeddings=True)
+        if embeddings is None:
+            embeddings = np.zeros((len(image_paths), batch_embeddings.shape[1]), dtype=np.float32)
+        embeddings[indices[valid].numpy()] = batch_embeddings
+        for index, result in zip(indices[valid].tolist(), batch_results):
+            results[index] = result
+
+    if return_embeddings:
+        return results, embeddings if embeddings is not None else np.zeros((len(image_paths), 0), dtype=np.float32)
+    return results
+
+def classify_image_batch(images, text_features, labels=None, return_embeddings=False):
+    """Return the top (description, score) for each preprocessed image in a batch tensor.
+
+    With return_embeddings, also return the normalized image embeddings as a NumPy array.
+    """
+    model, _ = get_clip_model()
+    with timed('identification.clip_encode', items=len(images)), torch.no_grad():
+        images = images.to(device, non_blocking=True)
+        # Only the encoder runs in reduced precision; the label similarities stay in fp32
+        with precision_context(clip_precision, device):
+            image_features = model.encode_image(images)
+        image_features = image_features.float()
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+        probabilities, label_indices = top_k_labels(image_features, text_features)
+        # tolist() waits for the device, so the span covers the whole forward pass
+        probabilities, label_indices = probabilities.tolist(), label_indices.tolist()
+
+    labels = labels or get_labels()
+    results = [label_result(labels, indices, scores) for indices, scores in zip(label_indices, probabilities)]
+    if return_embeddings:
+        return results, image_features.cpu().numpy()
+    return results
+
+def identify_crops(crops, labels=None, batch_size=identification_batch_size):
+    """Classify in-memory BGR crops and return a (description, score) tuple per crop."""
+    _, preprocess = get_clip_model()
+    labels = labels or get_labels()
+    text_features = get_text_features(labels)
+
+    results = []
+    for start in range(0, len(crops), batch_size):
+        with timed('identification.preprocess', items=len(crops[start:start + batch_size])):
+            images = torch.stack([
+                preprocess(Image.fromarray(np.ascontiguousarray(crop[:, :, ::-1])))
+                for crop in crops[start:start + batch_size]
+            ])
+        results.extend(classify_image_batch(images, text_features, labels))
+    return results
 
 def identify_and_describe_object(image_path):
-    try:
-        # Load and preprocess the image
-        image = preprocess(Image.open(image_path)).unsqueeze(0).to(device)
-        
-        # Get the image and text features
-        with torch.no_grad():
-            image_features = model.encode_image(image)
-            text_features = model.encode_text(text_inputs)
-            
-            # Calculate similarity between image and text features
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-        
-        # Get the top description
-        top_description = descriptions[similarity[0].argmax().item()]
-        return top_description
-
-    except Exception as e:
-        logging.error(f"Error processing image {image_path}: {e}")
+    # Single crops skip the worker pool; the label embeddings come from the shared cache
+    result = identify_objects_batch([image_path], batch_size=1, num_workers=0)[0]
+    if result is None:
         return None
 
-def process_all_segmented_objects():
+    # Get the top description
+    return result[0]
+
+def identification_fingerprint(labels=None):
+    """Fingerprint of the model, label set and prompts a cached identification result depends on."""
+    parts = [clip_model_name, text_embeddings_cache_path(labels or get_labels())]
+    # The default single label at CLIP's temperature keeps the fingerprint it had before these settings
+    if label_top_k != 1 or label_temperature != 100.0:
+        parts += [label_top_k, label_temperature]
+    return config_fingerprint(*parts)
+
+def embedding_fingerprint():
+    """Fingerprint of the model and precision the stored image embeddings depend on."""
+    return config_fingerprint(clip_model_name, clip_precision)
+
+def description_record(master_id, object_id, file_path, result):
+    """Return the output row of one identified object; top_labels holds the top k as a JSON list."""
+    record = {'master_id': master_id, 'object_id': object_id, 'file_path': file_path, 'description': result[0],
+              'description_score': result[1]}
+    if len(result) > 2:
+        record['top_labels'] = json.dumps(result[2])
+    return record
+
+def relabel_stored_objects(labels=None, block_size=relabel_block_size):
+    """Re-label every object in the embedding store against labels without re-encoding any image."""
+    store = get_embedding_store()
+    if not len(store):
+        logging.error("The embedding store is empty; run identification first.")
+        return
+    if store.meta['fingerprint'] != embedding_fingerprint():
+        logging.error("The embedding store was built with another CLIP model or precision; run identification again.")
+        return
+
+    labels = labels or get_labels()
+    text_features = get_text_features(labels)
+    ids = store.ids()
+    master_ids, object_ids, file_paths = ids['master_id'].tolist(), ids['object_id'].tolist(), ids['file_path'].tolist()
+    all_descriptions = []
+    with timed('identification.relabel', items=len(store)), torch.no_grad():
+        for start, block in store.blocks(block_size):
+            probabilities, label_indices = top_k_labels(torch.from_numpy(block).to(device), text_features)
+            for row, indices, scores in zip(range(start, start + len(block)), label_indices.tolist(),
+                                            probabilities.tolist()):
+                all_descriptions.append(description_record(master_ids[row], object_ids[row], file_paths[row],
+                                                           label_result(labels, indices, scores)))
+    save_output(all_descriptions, descriptions_file, descriptions_json_file)
+    logging.info(f"Re-labelled {len(all_descriptions)} stored objects against {len(labels)} labels.")
+
+@instrument('identification')
+def process_all_segmented_objects(batch_size=identification_batch_size, num_workers=identification_num_workers,
+                                  use_cache=True, incremental=False):
     try:
-        metadata_df = pd.read_csv(metadata_file)
+        metadata_df = read_table(metadata_file, dtype={'master_id': str})
     except FileNotFoundError:
         logging.error(f"Metadata file {metadata_file} not found.")
         return
-    
-    all_descriptions = []
 
-    for _, row in metadata_df.iterrows():
-        object_image_path = row['file_path']
-        description = identify_and_describe_object(object_image_path)
-        
-        if description:  # Check if description is valid
-            all_descriptions.append({
-                'master_id': row['master_id'],
-                'object_id': row['object_id'],
-                'file_path': object_image_path,
-                'description': description
-            })
-
-    # Save descriptions to CSV
-    descriptions_df = pd.DataFrame(all_descriptions)
-    descriptions_df.to_csv(descriptions_file, index=False)
-    logging.info(f"Descriptions saved to {descriptions_file}.")
-
-    # Save descriptions to JSON
-    with open(descriptions_json_file, 'w') as json_file:
-        json.dump(all_descriptions, json_file, indent=4)
-    logging.info(f"Descriptions saved to {descriptions_json_file}.")
+    if incremental:
+        # Only identify objects of images whose segmentation changed since the last run
+        manifest = load_manifest()
+        inputs = recorded_inputs(manifest, ['segmentation'])
+
+        def stage_fingerprint(master_id):
+            return config_fingerprint(identification_fingerprint(),
+                                      upstream_fingerprint(manifest, master_id, ['segmentation']))
+
+        changed, removed = plan_stage(manifest, 'identification', inputs, stage_fingerprint)
+        metadata_df = metadata_df[metadata_df['master_id'].astype(str).isin(changed)]
+
+    object_image_paths = metadata_df['file_path'].tolist()
+    object_keys = list(zip(metadata_df['master_id'].astype(str), metadata_df['object_id'].astype(int)))
+    results = [None] * len(object_image_paths)
+    cache = get_result_cache() if use_cache else None
+    fingerprint = identification_fingerprint()
+
+    store = get_embedding_store() if store_embeddings else None
+    stored_keys = set()
+    if store is not None:
+        store.ensure_fingerprint(embedding_fingerprint())
+        # Objects of changed images are re-encoded, so their stored rows do not count
+        stale_master_ids = set(changed + removed) if incremental else set()
+        stored_keys = {key for key in store.keys() if key[0] not in stale_master_ids}
+
+    # Serve cache hits from the crop bytes alone and only run CLIP on the misses
+    content_hashes = [None] * len(object_image_paths)
+    pending_indices = []
+    for index, object_image_path in enumerate(object_image_paths):
+        # A label alone is not enough while the store still lacks the object's embedding
+        if store is not None and object_keys[index] not in stored_keys:
+            pending_indices.append(index)
+            continue
+        if cache is not None and os.path.exists(object_image_path):
+            content_hashes[index] = file_content_hash(object_image_path)
+            cached = cache.get('identification', content_hashes[index], fingerprint)
+            if cached is not None:
+                results[index] = tuple(cached)
+                continue
+        pending_indices.append(index)
+
+    if cache is not None:
+        logging.info(f"Identification cache: {len(object_image_paths) - len(pending_indices)} hits, "
+                     f"{len(pending_indices)} misses.")
+
+    pending_results, pending_embeddings = identify_objects_batch([object_image_paths[i] for i in pending_indices],
+                                                                 batch_size=batch_size, num_workers=num_workers,
+                                                                 return_embeddings=True)
+    for index, result in zip(pending_indices, pending_results):
+        results[index] = result
+        if cache is not None and result is not None and content_hashes[index] is not None:
+            cache.put('identification', content_hashes[index], fingerprint, list(result))
+
+    if store is not None:
+        encoded = [position for position, result in enumerate(pending_results) if result is not None]
+        encoded_ids = [{'master_id': object_keys[pending_indices[position]][0],
+                        'object_id': object_keys[pending_indices[position]][1],
+                        'file_path': object_image_paths[pending_indices[position]]} for position in encoded]
+        if incremental:
+            store.update(encoded_ids, pending_embeddings[encoded], drop_master_ids=changed + removed)
+        else:
+            store.update(encoded_ids, pending_embeddings[encoded], keep_keys=set(object_keys))
+        logging.info(f"Stored {len(encoded_ids)} image embeddings; the store holds {len(store)}.")
+
+    # Built lazily so the jsonl output format writes each record without holding them all
+    all_descriptions = (
+        description_record(master_id, object_id, file_path, result)
+        for master_id, object_id, file_path, result in zip(metadata_df['master_id'].tolist(),
+                                                           metadata_df['object_id'].tolist(),
+                                                           metadata_df['file_path'].tolist(), results)
+        if result  # Check if description is valid
+    )
+
+    if incremental:
+        all_descriptions = merge_records(load_output_records(descriptions_file, descriptions_json_file), all_descriptions, changed + removed)
+        for master_id in changed:
+            record_stage(manifest, 'identification', master_id, inputs[master_id], stage_fingerprint(master_id))
+        for master_id in removed:
+            forget_stage(manifest, 'identification', master_id)
+        save_manifest(manifest)
+
+    # Save descriptions as CSV + JSON, Parquet or JSON Lines
+    save_output(all_descriptions, descriptions_file, descriptions_json_file)
 
 if __name__ == '__main__':
-    process_all_segmented_objects()
+    parser = argparse.ArgumentParser(description="Identify segmented objects with CLIP.")
+    parser.add_argument('--batch-size', type=int, default=identification_batch_size)
+    parser.add_argument('--num-workers', type=int, default=identification_num_workers)
+    parser.add_argument('--incremental', action='store_true', help="Only process new or changed images.")
+    parser.add_argument('--relabel', action='store_true',
+                        help="Re-label all stored objects from their saved embeddings instead of encoding crops.")
+    parser.add_argument('--no-embeddings', action='store_true', help="Do not keep image embeddings.")
+    parser.add_argument('--labels-file', default=labels_file,
+                        help="Classify against the labels in this file (one per line) instead of the built-in list.")
+    parser.add_argument('--prompt-ensemble', action='store_true',
+                        help="Average each label over the photo prompt templates instead of encoding it bare.")
+    parser.add_argument('--top-k', type=int, default=label_top_k, help="Labels kept per object.")
+    parser.add_argument('--temperature', type=float, default=label_temperature,
+                        help="Softmax temperature used for the label scores.")
+    add_precision_argument(parser, clip_precision)
+    add_backend_argument(parser, clip_backend)
+    add_cache_arguments(parser)
+    add_output_format_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    set_output_format(args.output_format)
+    clip_precision = args.precision
+    clip_backend = args.backend
+    store_embeddings = not args.no_embeddings
+    labels_file = args.labels_file
+    if args.prompt_ensemble:
+        prompt_templates = ensemble_prompt_templates
+    label_top_k = args.top_k
+    label_temperature = args.temperature
+    if args.invalidate_cache:
+        get_result_cache().invalidate('identification')
+
+    if args.relabel:
+        relabel_stored_objects()
+    else:
+        process_all_segmented_objects(batch_size=args.batch_size, num_workers=args.num_workers,
+                                      use_cache=not args.no_cache, incremental=args.incremental)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
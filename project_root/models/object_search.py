@@ -0,0 +1,105 @@
+import os
+import sys
+import argparse
+import logging
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import embedding_store
+from utils.embedding_store import get_embedding_store
+from utils.metrics import timed, add_metrics_arguments, write_metrics_report
+from utils.precision import add_precision_argument
+from models import identification_model
+from models.identification_model import encode_texts, embedding_fingerprint
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+search_top_k = 10
+
+def open_store():
+    """Return the embedding store, refusing one built with another CLIP model or precision."""
+    store = get_embedding_store()
+    if not len(store):
+        raise ValueError("The embedding store is empty; run python models/identification_model.py first")
+    if store.meta['fingerprint'] != embedding_fingerprint():
+        raise ValueError("The embedding store was built with another CLIP model or precision; "
+                         "run python models/identification_model.py again")
+    return store
+
+def run_search(store, queries, k, approximate=False, num_probes=embedding_store.ivf_num_probes):
+    """Return (scores, row indices) from the IVF index when asked and available, else from the exact scan."""
+    if approximate and store.has_index():
+        return store.search_index(queries, k, num_probes=num_probes)
+    if approximate:
+        logging.warning("No IVF index has been built; using exact search.")
+    return store.search(queries, k)
+
+def result_records(store, scores, indices):
+    """Turn one query's scores and row indices into id records, skipping unfilled slots."""
+    ids = store.ids()
+    return [
+        {'master_id': ids['master_id'].iloc[row], 'object_id': int(ids['object_id'].iloc[row]),
+         'file_path': ids['file_path'].iloc[row], 'score': float(score)}
+        for score, row in zip(scores, indices) if row >= 0
+    ]
+
+def search_by_text(queries, k=search_top_k, approximate=False, num_probes=embedding_store.ivf_num_probes):
+    """Return, for each text query, the k stored objects whose image embeddings match it best."""
+    store = open_store()
+    with timed('search.text', items=len(queries)):
+        query_features = encode_texts(list(queries)).cpu().numpy()
+        scores, indices = run_search(store, query_features, k, approximate, num_probes)
+    return [result_records(store, query_scores, query_indices) for query_scores, query_indices in zip(scores, indices)]
+
+def search_similar(master_id, object_id, k=search_top_k, approximate=False, num_probes=embedding_store.ivf_num_probes):
+    """Return the k stored objects most similar to a stored object, excluding the object itself."""
+    store = open_store()
+    ids = store.ids()
+    matches = ((ids['master_id'] == str(master_id)) & (ids['object_id'].astype(int) == int(object_id))).to_numpy()
+    if not matches.any():
+        raise KeyError(f"Object {object_id} of image {master_id} is not in the embedding store")
+    row = int(matches.argmax())
+    with timed('search.similar', items=1):
+        scores, indices = run_search(store, store.embeddings()[row:row + 1], k + 1, approximate, num_probes)
+    keep = indices[0] != row
+    return result_records(store, scores[0][keep][:k], indices[0][keep][:k])
+
+def print_results(title, records):
+    print(title)
+    for rank, record in enumerate(records, start=1):
+        print(f"  {rank:>3}. {record['score']:.4f}  {record['master_id']} object {record['object_id']}  "
+              f"{record['file_path']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search segmented objects by text or by example using stored CLIP embeddings.")
+    parser.add_argument('--text', nargs='+', default=[], help="Text queries, e.g. 'a red car'.")
+    parser.add_argument('--like', nargs=2, metavar=('MASTER_ID', 'OBJECT_ID'),
+                        help="Find objects that look like this stored object.")
+    parser.add_argument('--top-k', type=int, default=search_top_k)
+    parser.add_argument('--approximate', action='store_true', help="Search the IVF index instead of every embedding.")
+    parser.add_argument('--num-probes', type=int, default=embedding_store.ivf_num_probes,
+                        help="IVF lists scanned per query; more is slower and closer to exact.")
+    parser.add_argument('--build-index', action='store_true', help="(Re)build the IVF index before searching.")
+    parser.add_argument('--num-lists', type=int, default=embedding_store.ivf_num_lists,
+                        help="IVF lists to build; defaults to about 4 * sqrt(stored objects).")
+    add_precision_argument(parser, identification_model.clip_precision)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    identification_model.clip_precision = args.precision
+    try:
+        if args.build_index:
+            open_store().build_index(args.num_lists)
+        if args.text:
+            for query, records in zip(args.text, search_by_text(args.text, args.top_k, args.approximate,
+                                                                args.num_probes)):
+                print_results(f"'{query}'", records)
+        if args.like:
+            records = search_similar(args.like[0], args.like[1], args.top_k, args.approximate, args.num_probes)
+            print_results(f"Like {args.like[0]} object {args.like[1]}", records)
+    except (ValueError, KeyError) as error:
+        logging.error(error)
+        sys.exit(1)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
@@ -0,0 +1,415 @@
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import argparse
+import threading
+import logging
+import cv2
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.segmentation_model import (segment_image, list_input_images, metadata_file, segmented_objects_dir,
+                                       segmentation_fingerprint)
+from models import identification_model
+from models.identification_model import (identify_crops, descriptions_file, descriptions_json_file,
+                                         identification_fingerprint)
+from models.text_extraction_model import (extract_text_from_array, extract_text_roi, format_ocr_results,
+                                          text_extraction_results_file_csv, text_extraction_results_file_json,
+                                          ocr_fingerprint)
+from models.summarization_model import summary_results_file, summary_results_json_file
+from utils import preprocessing
+from utils.preprocessing import load_image, add_decode_argument
+from utils.postprocessing import draw_annotations, save_object_crop
+from utils.association import match_text_boxes, text_box_rect
+from utils.manifest import (load_manifest, save_manifest, scan_inputs, record_stage, forget_stage, forget_missing,
+                            upstream_fingerprint)
+from utils.cache import config_fingerprint
+from utils.storage import write_json_records
+from utils.metrics import add_metrics_arguments, write_metrics_report
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+summary_columns = ['master_id', 'object_id', 'file_path', 'description', 'BBox', 'Text', 'Confidence']
+metadata_columns = ['master_id', 'object_id', 'file_path', 'label', 'score', 'x_min', 'y_min', 'x_max', 'y_max']
+descriptions_columns = ['master_id', 'object_id', 'file_path', 'description', 'description_score']
+text_extraction_columns = ['Image', 'BBox', 'Text', 'Confidence']
+
+# Manifest stages whose outputs the streaming pipeline rewrites
+streaming_stages = ['segmentation', 'identification', 'ocr', 'summarization']
+
+# Streaming pipeline settings: worker threads per stage and the bound of every queue between stages
+pipeline_queue_size = 4
+pipeline_stage_workers = {
+    'decode': 2,
+    'segmentation': 1,
+    'save_crops': 2,
+    'identification': 1,
+    'text_extraction': 1,
+    'write': 1,
+}
+
+def decode_image_bytes(image_bytes):
+    """Decode an encoded image (e.g. an upload) into a BGR array."""
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Failed to decode image bytes")
+    return image
+
+def set_description(obj, result):
+    """Copy an identification result onto an object, including its top labels when several are kept."""
+    obj['description'], obj['description_score'] = result[0], result[1]
+    if len(result) > 2:
+        obj['top_labels'] = json.dumps(result[2])
+
+def assign_text_to_objects(objects, text_rows):
+    """Map each object_id to the OCR rows whose box mostly lies inside the object's box."""
+    matches = match_text_boxes([tuple(obj['bbox']) for obj in objects], [text_box_rect(row['BBox']) for row in text_rows])
+    return {obj['object_id']: [text_rows[i] for i in matches.get(object_idx, [])]
+            for object_idx, obj in enumerate(objects)}
+
+def summarize_objects(master_id, objects, text_rows):
+    """Build the summary table for one image in the same layout as summaries.csv."""
+    assigned = assign_text_to_objects(objects, text_rows)
+    summary_rows = []
+    for obj in objects:
+        base_row = {
+            'master_id': master_id,
+            'object_id': obj['object_id'],
+            'file_path': obj.get('file_path', 'N/A'),
+            'description': obj.get('description', 'N/A'),
+        }
+        rows = assigned[obj['object_id']] or [{'BBox': 'N/A', 'Text': 'N/A', 'Confidence': 'N/A'}]
+        for row in rows:
+            summary_rows.append({**base_row, 'BBox': row['BBox'], 'Text': row['Text'], 'Confidence': row['Confidence']})
+    return pd.DataFrame(summary_rows, columns=summary_columns)
+
+def run_single_image(image, master_id, score_threshold=0.5, ocr_mode='full'):
+    """Run segmentation, identification, OCR, summary and annotation for a single image in memory.
+
+    image is either a decoded BGR array or encoded image bytes. Nothing is
+    read from or written to the shared CSV/JSON outputs. Returns a dict with
+    the objects (including crops), OCR rows, summary DataFrame, annotated BGR
+    image and per-stage timings in seconds. ocr_mode='roi' only recognizes
+    text in regions found by a downscaled detection pass.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = decode_image_bytes(bytes(image))
+
+    timings = {}
+
+    start_time = time.perf_counter()
+    objects = segment_image(image, score_threshold)
+    timings['segmentation'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for obj, result in zip(objects, identify_crops([obj['crop'] for obj in objects])):
+        set_description(obj, result)
+    timings['identification'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    if ocr_mode == 'roi':
+        text_rows = format_ocr_results(extract_text_roi(image))
+    else:
+        text_rows = format_ocr_results(extract_text_from_array(image))
+    timings['text_extraction'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    summary_df = summarize_objects(master_id, objects, text_rows)
+    timings['summarization'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    annotated_image = draw_annotations(image, objects, text_rows)
+    timings['annotation'] = time.perf_counter() - start_time
+
+    logging.info(f"Processed {master_id} in memory: {len(objects)} objects, {len(text_rows)} text lines, "
+                 f"{sum(timings.values()):.2f}s total.")
+
+    return {
+        'master_id': master_id,
+        'objects': objects,
+        'text': text_rows,
+        'summary': summary_df,
+        'annotated_image': annotated_image,
+        'timings': timings,
+    }
+
+_STOP = object()
+
+class StreamingPipeline:
+    """Runs a chain of stages concurrently, connected by bounded queues.
+
+    stages is a list of (name, func, workers) tuples. Each func takes an item
+    and returns the item for the next stage, or None to drop it. A full
+    queue blocks the stage feeding it, so at most queue_size items wait
+    between any two stages regardless of how many items are fed in.
+    """
+
+    def __init__(self, stages, queue_size=pipeline_queue_size):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {name: {'items': 0, 'errors': 0, 'busy_seconds': 0.0} for name, _, _ in stages}
+        self._stats_lock = threading.Lock()
+
+    def _run_stage(self, name, func, input_queue, output_queue, remaining, remaining_lock):
+        while True:
+            item = input_queue.get()
+            if item is _STOP:
+                # Let sibling workers see the sentinel; the last one to stop forwards it downstream
+                input_queue.put(_STOP)
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last_worker = remaining[0] == 0
+                if last_worker:
+                    output_queue.put(_STOP)
+                return
+
+            start_time = time.perf_counter()
+            try:
+                result = func(item)
+                error = False
+            except Exception as e:
+                logging.error(f"Stage {name} failed: {e}")
+                result, error = None, True
+            with self._stats_lock:
+                stats = self.stats[name]
+                stats['items'] += 1
+                stats['errors'] += int(error)
+                stats['busy_seconds'] += time.perf_counter() - start_time
+
+            if result is not None:
+                output_queue.put(result)
+
+    def run(self, items):
+        """Feed items through every stage and yield what comes out of the last one."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        threads = []
+        for index, (name, func, workers) in enumerate(self.stages):
+            remaining, remaining_lock = [workers], threading.Lock()
+            for worker_index in range(workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage, name=f"{name}-{worker_index}", daemon=True,
+                    args=(name, func, queues[index], queues[index + 1], remaining, remaining_lock)
+                ))
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            queues[0].put(_STOP)
+
+        threads.append(threading.Thread(target=feed, name='feed', daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = queues[-1].get()
+            if item is _STOP:
+                break
+            yield item
+
+        for thread in threads:
+            thread.join()
+
+class StreamingResultWriter:
+    """Appends each image's rows to the CSV outputs as soon as the image is done.
+
+    The JSON copies that the csv format keeps next to descriptions.csv,
+    text_extraction_results.csv and summaries.csv are written on close.
+    """
+
+    def __init__(self):
+        self._files = []
+        self._json_copies = []
+        self.metadata = self._open(metadata_file, metadata_columns)
+        # The top_labels column only exists when more than one label is kept per object
+        self.descriptions = self._open(descriptions_file, descriptions_columns +
+                                       (['top_labels'] if identification_model.label_top_k > 1 else []),
+                                       descriptions_json_file)
+        self.text_extraction = self._open(text_extraction_results_file_csv, text_extraction_columns,
+                                          text_extraction_results_file_json)
+        self.summaries = self._open(summary_results_file, summary_columns, summary_results_json_file)
+
+    def _open(self, path, columns, json_path=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        f = open(path, 'w', newline='', encoding='utf-8')
+        self._files.append(f)
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        records = None
+        if json_path is not None:
+            records = []
+            self._json_copies.append((records, json_path))
+        return writer, columns, records
+
+    def _write_row(self, output, row):
+        writer, columns, records = output
+        writer.writerow(row)
+        if records is not None:
+            records.append({column: row.get(column) for column in columns})
+
+    def write(self, item):
+        master_id = item['master_id']
+        for obj in item['objects']:
+            x_min, y_min, x_max, y_max = obj['bbox']
+            row = {'master_id': master_id, 'object_id': obj['object_id'], 'file_path': obj['file_path'],
+                   'label': obj['label'], 'score': obj['score'],
+                   'x_min': x_min, 'y_min': y_min, 'x_max': x_max, 'y_max': y_max,
+                   'description': obj.get('description'), 'description_score': obj.get('description_score'),
+                   'top_labels': obj.get('top_labels')}
+            self._write_row(self.metadata, row)
+            if obj.get('description'):
+                self._write_row(self.descriptions, row)
+        for row in item['text']:
+            self._write_row(self.text_extraction, {'Image': os.path.basename(item['image_path']), **row})
+        for row in summarize_objects(master_id, item['objects'], item['text']).to_dict(orient='records'):
+            self._write_row(self.summaries, row)
+        for f in self._files:
+            f.flush()
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        # Incremental stage runs merge into these, so they must match the CSVs
+        for records, json_path in self._json_copies:
+            write_json_records(records, json_path)
+
+def record_streamed_image(manifest, master_id, info, identification_version, ocr_version):
+    """Record the stages the streaming pipeline ran for an image with the fingerprints the batch stages use.
+
+    identification_version is None when the identification stage has to run again.
+    """
+    record_stage(manifest, 'segmentation', master_id, info, segmentation_fingerprint(master_id))
+    if identification_version is None:
+        forget_stage(manifest, 'identification', master_id)
+    else:
+        record_stage(manifest, 'identification', master_id, info,
+                     config_fingerprint(identification_version,
+                                        upstream_fingerprint(manifest, master_id, ['segmentation'])))
+    record_stage(manifest, 'ocr', master_id, info, ocr_version)
+    record_stage(manifest, 'summarization', master_id, info,
+                 upstream_fingerprint(manifest, master_id, ['identification', 'ocr']))
+
+def _decode_stage(item):
+    item['image'] = load_image(item['image_path'])
+    return item
+
+def _segmentation_stage(item):
+    item['objects'] = segment_image(item['image'])
+    return item
+
+def _save_crops_stage(item):
+    os.makedirs(segmented_objects_dir, exist_ok=True)
+    for obj in item['objects']:
+        object_file_path = os.path.join(segmented_objects_dir, f"{item['master_id']}_{obj['object_id']}.jpg")
+        obj['file_path'] = save_object_crop(obj['crop'], obj['mask'], object_file_path)
+    return item
+
+def _identification_stage(item):
+    results = identify_crops([obj['crop'] for obj in item['objects']])
+    for obj, result in zip(item['objects'], results):
+        set_description(obj, result)
+        # Crops are on disk now; dropping the pixels keeps memory flat
+        del obj['crop'], obj['mask']
+    return item
+
+def _make_text_extraction_stage(ocr_mode):
+    def text_extraction_stage(item):
+        if ocr_mode == 'roi':
+            item['text'] = format_ocr_results(extract_text_roi(item['image']))
+        else:
+            item['text'] = format_ocr_results(extract_text_from_array(item['image']))
+        del item['image']
+        return item
+    return text_extraction_stage
+
+def run_streaming_pipeline(image_items=None, stage_workers=None, queue_size=pipeline_queue_size, ocr_mode='full'):
+    """Run decode, segmentation, crop saving, identification, OCR and writing as concurrent stages.
+
+    image_items defaults to every image in the input directory. Rows are
+    appended to metadata.csv, descriptions.csv, text_extraction_results.csv
+    and summaries.csv as each image completes. Returns the pipeline stats.
+
+    Every written image is recorded in the manifest and the images that were
+    not written lose their records, so --incremental stage runs can pick up
+    where a streaming run left off.
+    """
+    image_items = list_input_images() if image_items is None else image_items
+    workers = {**pipeline_stage_workers, **(stage_workers or {})}
+    manifest = load_manifest()
+    inputs = scan_inputs(manifest, image_items)
+    # The streamed crops are not added to the embedding store, so with a store identification is not recorded
+    identification_version = None if identification_model.store_embeddings else identification_fingerprint()
+    ocr_version = ocr_fingerprint(ocr_mode)
+    written = set()
+    writer = StreamingResultWriter()
+
+    def write_stage(item):
+        writer.write(item)
+        record_streamed_image(manifest, item['master_id'], inputs[item['master_id']], identification_version,
+                              ocr_version)
+        written.add(item['master_id'])
+        return item
+
+    # The writer owns the output files, so it always runs on a single thread
+    pipeline = StreamingPipeline([
+        ('decode', _decode_stage, workers['decode']),
+        ('segmentation', _segmentation_stage, workers['segmentation']),
+        ('save_crops', _save_crops_stage, workers['save_crops']),
+        ('identification', _identification_stage, workers['identification']),
+        ('text_extraction', _make_text_extraction_stage(ocr_mode), workers['text_extraction']),
+        ('write', write_stage, 1),
+    ], queue_size=queue_size)
+
+    start_time = time.perf_counter()
+    items = ({'image_path': image_path, 'master_id': master_id} for image_path, master_id in image_items)
+    completed = 0
+    try:
+        for item in pipeline.run(items):
+            completed += 1
+            logging.info(f"[{time.perf_counter() - start_time:.1f}s] Completed {item['master_id']}: "
+                         f"{len(item['objects'])} objects, {len(item['text'])} text lines.")
+    finally:
+        writer.close()
+        # The outputs only hold the written images now
+        forget_missing(manifest, streaming_stages, written)
+        save_manifest(manifest)
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"Streaming pipeline processed {completed}/{len(image_items)} images in {elapsed:.2f}s.")
+    for name, stats in pipeline.stats.items():
+        logging.info(f"  {name}: {stats['items']} items, {stats['errors']} errors, "
+                     f"{stats['busy_seconds']:.2f}s busy")
+    return pipeline.stats
+
+def parse_stage_workers(values):
+    """Parse stage=count pairs from the command line."""
+    stage_workers = {}
+    for value in values:
+        name, _, count = value.partition('=')
+        if name not in pipeline_stage_workers or not count.isdigit() or int(count) < 1:
+            raise argparse.ArgumentTypeError(f"Invalid stage worker setting: {value}")
+        stage_workers[name] = int(count)
+    return stage_workers
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run every pipeline stage concurrently over the input images.")
+    parser.add_argument('--workers', nargs='*', default=[], metavar='STAGE=N',
+                        help=f"Worker threads per stage, e.g. text_extraction=2. Stages: {', '.join(pipeline_stage_workers)}")
+    parser.add_argument('--queue-size', type=int, default=pipeline_queue_size)
+    parser.add_argument('--ocr-mode', choices=['full', 'roi'], default='full')
+    add_decode_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    preprocessing.decode_max_side = args.decode_max_side or None
+
+    run_streaming_pipeline(stage_workers=parse_stage_workers(args.workers), queue_size=args.queue_size,
+                           ocr_mode=args.ocr_mode)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
@@ -0,0 +1,74 @@
+import time
+import importlib
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Module that registers the loader for each model name
+model_modules = {
+    'segmentation': 'models.segmentation_model',
+    'clip': 'models.identification_model',
+    'ocr': 'models.text_extraction_model',
+}
+
+_loaders = {}
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+def register_model(name, loader):
+    """Register a zero-argument loader; it runs the first time the model is requested."""
+    with _registry_lock:
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+
+def _get_loader(name):
+    if name not in _loaders and name in model_modules:
+        # Importing the model module registers its loader without loading any weights
+        importlib.import_module(model_modules[name])
+    if name not in _loaders:
+        raise KeyError(f"No loader registered for model '{name}'")
+    return _loaders[name], _locks[name]
+
+def get_model(name):
+    """Return the shared instance of a model, loading it on first use.
+
+    Concurrent first calls from several threads load the model only once.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    loader, lock = _get_loader(name)
+    with lock:
+        if name not in _models:
+            start_time = time.perf_counter()
+            _models[name] = loader()
+            logging.info(f"Loaded model '{name}' in {time.perf_counter() - start_time:.2f}s.")
+        return _models[name]
+
+def set_model(name, model):
+    """Install an already loaded instance, e.g. one shared by an application-level cache."""
+    _, lock = _get_loader(name)
+    with lock:
+        _models[name] = model
+
+def is_loaded(name):
+    """Return True if the model has already been loaded in this process."""
+    return name in _models
+
+def loaded_models():
+    return sorted(_models)
+
+def warm_up(names=None):
+    """Load the given models (all known models by default) ahead of the first request."""
+    for name in names or sorted(set(model_modules) | set(_loaders)):
+        get_model(name)
+
+def unload(name):
+    """Drop a loaded model so the next request loads it again."""
+    _, lock = _get_loader(name)
+    with lock:
+        _models.pop(name, None)
@@ -1,17 +1,27 @@
 import os
-import cv2
 import torch
-import numpy as np
 import pandas as pd
 import sys
+import time
+import argparse
 import logging
-from torchvision.models.detection import maskrcnn_resnet50_fpn
 
 # Add the project root directory to the system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from utils.preprocessing import preprocess_image
-from utils.postprocessing import save_image
+from models.registry import register_model, get_model
+from models.backends import load_graph, export_graph, add_backend_argument
+from utils import preprocessing
+from utils.preprocessing import load_image, preprocess_image_array, add_decode_argument
+from utils.postprocessing import extract_object_crops, save_object_crop
+from utils.cache import get_result_cache, file_content_hash, config_fingerprint, add_cache_arguments
+from utils.manifest import load_manifest, save_manifest, scan_inputs, plan_stage, record_stage, forget_stage, merge_records
+from utils.storage import read_table, write_table, output_exists, add_output_format_argument, set_output_format
+from utils.metrics import timed, instrument, add_metrics_arguments, write_metrics_report
+from utils.precision import apply_precision, precision_context, add_precision_argument
+from utils import dedup
+from utils.dedup import (find_duplicates, scale_factors, reuse_object_rows, log_dedup_stats, save_duplicates,
+                         duplicate_fingerprint, add_dedup_arguments)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,74 +31,381 @@ input_images_dir = 'data/input_images'
 segmented_objects_dir = 'data/segmented_objects'
 metadata_file = 'data/metadata.csv'
 
+segmentation_model_name = 'maskrcnn_resnet50_fpn'
+# Inference precision: 'fp32', 'int8' (dynamic quantization of the box head, CPU) or 'bf16' autocast
+segmentation_precision = 'fp32'
+# Inference backend: 'torch' (eager) or the 'torchscript' / 'onnx' graph written by models/export.py
+segmentation_backend = 'torch'
+
+# Batched inference settings
+segmentation_batch_size = 4
+segmentation_max_batch_memory_mb = 512
+
+# Crop output settings
+save_alpha_crops = False
+save_mask_sidecars = False
+
 # Set device
 device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
 
-# Load pre-trained Mask R-CNN model
-model = maskrcnn_resnet50_fpn(pretrained=True)
-model = model.to(device)
-model.eval()
+class ExportedSegmentationModel:
+    """Exported Mask R-CNN behind the eager interface: a list or batch of images in, prediction dicts out."""
+
+    def __init__(self, graph, fmt):
+        self.graph = graph
+        self.fmt = fmt
+
+    def __call__(self, images):
+        if self.fmt == 'torchscript':
+            # Scripted detection models return (losses, detections)
+            _, detections = self.graph.module(list(images))
+            return detections
+        predictions = []
+        for image in images:
+            boxes, labels, scores, masks = self.graph(image)
+            predictions.append({'boxes': boxes, 'labels': labels, 'scores': scores, 'masks': masks})
+        return predictions
+
+def load_segmentation_model(precision=None, backend=None):
+    """Load the pre-trained Mask R-CNN model in the configured precision and backend."""
+    backend = backend or segmentation_backend
+    if backend != 'torch':
+        if (precision or segmentation_precision) != 'fp32':
+            logging.warning("Precision modes only apply to the torch backend; exported graphs run in fp32.")
+        return ExportedSegmentationModel(load_graph('segmentation', backend), backend)
+
+    from torchvision.models.detection import maskrcnn_resnet50_fpn
+    model = maskrcnn_resnet50_fpn(pretrained=True)
+    model = model.to(device)
+    model.eval()
+    return apply_precision(model, precision or segmentation_precision, device)
+
+register_model('segmentation', load_segmentation_model)
+
+def export_segmentation_model(model, fmt, example_image):
+    """Export an fp32 eager Mask R-CNN for the torchscript or onnx backend.
+
+    example_image is a (3, H, W) float tensor; height and width stay dynamic
+    in the ONNX graph, as does the number of detections.
+    """
+    model = model.cpu().eval()
+    if fmt == 'torchscript':
+        return export_graph(model, None, 'segmentation', fmt, script=True)
+    detections = {0: 'detections'}
+    return export_graph(model, ([example_image],), 'segmentation', fmt, input_names=['image'],
+                        output_names=['boxes', 'labels', 'scores', 'masks'],
+                        dynamic_axes={'image': {1: 'height', 2: 'width'}, 'boxes': detections,
+                                      'labels': detections, 'scores': detections,
+                                      'masks': {0: 'detections', 2: 'height', 3: 'width'}})
+
+def get_segmentation_model():
+    """Return the shared Mask R-CNN instance, loading it on first use."""
+    return get_model('segmentation')
+
+@instrument('segmentation.postprocess')
+def save_objects_from_prediction(prediction, image_path, master_id, score_threshold=0.5,
+                                 with_alpha=None, mask_sidecar=None, image=None):
+    with_alpha = save_alpha_crops if with_alpha is None else with_alpha
+    mask_sidecar = save_mask_sidecars if mask_sidecar is None else mask_sidecar
+
+    # bf16 predictions are cast back since NumPy has no bfloat16
+    masks = prediction['masks'].float().cpu().numpy()
+    labels = prediction['labels'].cpu().numpy()
+    scores = prediction['scores'].float().cpu().numpy()
+    
+    # Reuse the buffer the prediction was made from instead of decoding the file again
+    original_image = image
+    if original_image is None:
+        try:
+            original_image = load_image(image_path)
+        except ValueError as e:
+            logging.error(str(e))
+            return []
+
+    os.makedirs(segmented_objects_dir, exist_ok=True)
+
+    metadata = []
+    object_id = 1
+
+    for obj in extract_object_crops(masks, scores, original_image, score_threshold):
+        object_file_path = os.path.join(segmented_objects_dir, f'{master_id}_{object_id}.jpg')
+        object_file_path = save_object_crop(obj['crop'], obj['mask'], object_file_path,
+                                            with_alpha=with_alpha, mask_sidecar=mask_sidecar)
+
+        x_min, y_min, x_max, y_max = obj['bbox']
+        metadata.append({
+            'master_id': master_id,
+            'object_id': object_id,
+            'file_path': object_file_path,
+            'label': int(labels[obj['index']]),
+            'score': obj['score'],
+            'x_min': x_min,
+            'y_min': y_min,
+            'x_max': x_max,
+            'y_max': y_max
+        })
+        object_id += 1
+
+    return metadata
 
 def extract_and_save_objects(image_path, master_id, score_threshold=0.5):
     try:
-        # Load and preprocess the image
-        image_tensor = preprocess_image(image_path, device)
+        # Decode once; the same buffer is preprocessed and cropped
+        image = load_image(image_path)
+        image_tensor = preprocess_image_array(image, device)
     except Exception as e:
         logging.error(f"Error in preprocessing image {image_path}: {e}")
         return []
 
     try:
-        with torch.no_grad():
-            prediction = model(image_tensor)
+        with torch.no_grad(), precision_context(segmentation_precision, device):
+            prediction = get_segmentation_model()(image_tensor)
     except Exception as e:
         logging.error(f"Error in model prediction for image {image_path}: {e}")
         return []
 
-    masks = prediction[0].get('masks', []).cpu().numpy()
-    labels = prediction[0].get('labels', []).cpu().numpy()
-    scores = prediction[0].get('scores', []).cpu().numpy()
-    
-    original_image = cv2.imread(image_path)
-    original_height, original_width, _ = original_image.shape
+    return save_objects_from_prediction(prediction[0], image_path, master_id, score_threshold, image=image)
 
-    os.makedirs(segmented_objects_dir, exist_ok=True)
+def segment_image(image, score_threshold=0.5):
+    """Segment a decoded BGR image in memory and return its objects without writing any files.
 
-    metadata = []
-    object_id = 1
+    Each object is a dict with object_id, label, score, bbox (full-resolution
+    x_min, y_min, x_max, y_max), crop and mask.
+    """
+    with timed('segmentation.preprocess'):
+        image_tensor = preprocess_image_array(image, device)
+    with timed('segmentation.forward'), torch.no_grad(), precision_context(segmentation_precision, device):
+        prediction = get_segmentation_model()(image_tensor)[0]
+        masks = prediction['masks'].float().cpu().numpy()
 
-    for i in range(len(masks)):
-        if scores[i] > score_threshold:
-            mask = masks[i, 0]
-            mask = (mask > 0.5).astype(np.uint8)
-            mask_resized = cv2.resize(mask, (original_width, original_height))
-            masked_image = np.zeros_like(original_image)
-            masked_image[mask_resized == 1] = original_image[mask_resized == 1]
+    with timed('segmentation.postprocess'):
+        labels = prediction['labels'].cpu().numpy()
+        scores = prediction['scores'].float().cpu().numpy()
 
-            object_file_path = os.path.join(segmented_objects_dir, f'{master_id}_{object_id}.jpg')
-            save_image(masked_image, object_file_path)
+        objects = []
+        for object_id, obj in enumerate(extract_object_crops(masks, scores, image, score_threshold), start=1):
+            obj['object_id'] = object_id
+            obj['label'] = int(labels[obj.pop('index')])
+            objects.append(obj)
+    return objects
 
-            metadata.append({
-                'master_id': master_id,
-                'object_id': object_id,
-                'file_path': object_file_path
-            })
-            object_id += 1
+def iter_image_batches(image_items, batch_size=segmentation_batch_size,
+                       max_batch_memory_mb=segmentation_max_batch_memory_mb):
+    """Preprocess (image_path, master_id) pairs and yield them grouped into batches.
 
-    return metadata
+    Each image is decoded once and its buffer kept for cropping. A batch is
+    closed when it holds batch_size images or when adding another image
+    tensor and buffer would exceed max_batch_memory_mb.
+    """
+    max_batch_bytes = max_batch_memory_mb * 1024 * 1024
+    batch, batch_bytes = [], 0
+
+    for image_path, master_id in image_items:
+        try:
+            with timed('segmentation.preprocess'):
+                image = load_image(image_path)
+                image_tensor = preprocess_image_array(image, device)[0]
+        except Exception as e:
+            logging.error(f"Error in preprocessing image {image_path}: {e}")
+            continue
+
+        item_bytes = image_tensor.element_size() * image_tensor.nelement() + image.nbytes
+        if batch and (len(batch) >= batch_size or batch_bytes + item_bytes > max_batch_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+
+        batch.append((image_path, master_id, image_tensor, image))
+        batch_bytes += item_bytes
+
+    if batch:
+        yield batch
+
+def iter_segmented_images(image_items, score_threshold=0.5, batch_size=segmentation_batch_size,
+                          max_batch_memory_mb=segmentation_max_batch_memory_mb):
+    """Segment (image_path, master_id) pairs in batches, yielding (image_path, master_id, metadata)
+    for every image that was processed successfully."""
+    for batch in iter_image_batches(image_items, batch_size, max_batch_memory_mb):
+        try:
+            with timed('segmentation.forward', items=len(batch)), torch.no_grad(), \
+                    precision_context(segmentation_precision, device):
+                predictions = get_segmentation_model()([image_tensor for _, _, image_tensor, _ in batch])
+        except Exception as e:
+            logging.error(f"Error in model prediction for batch of {len(batch)} images: {e}")
+            continue
+
+        for (image_path, master_id, _, image), prediction in zip(batch, predictions):
+            logging.info(f"Processing image {os.path.basename(image_path)} with master ID {master_id}")
+            yield image_path, master_id, save_objects_from_prediction(prediction, image_path, master_id, score_threshold,
+                                                                      image=image)
 
-def process_all_images():
+def extract_and_save_objects_batch(image_items, score_threshold=0.5, batch_size=segmentation_batch_size,
+                                   max_batch_memory_mb=segmentation_max_batch_memory_mb):
+    """Segment (image_path, master_id) pairs with one Mask R-CNN forward pass per batch."""
     all_metadata = []
-    for image_file in os.listdir(input_images_dir):
+    for _, _, metadata in iter_segmented_images(image_items, score_threshold, batch_size, max_batch_memory_mb):
+        all_metadata.extend(metadata)
+    return all_metadata
+
+def list_input_images():
+    """Return (image_path, master_id) pairs for the images in the input directory."""
+    image_items = []
+    for image_file in sorted(os.listdir(input_images_dir)):
         if image_file.lower().endswith(('.jpg', '.jpeg', '.png')):
             image_path = os.path.join(input_images_dir, image_file)
             master_id = os.path.splitext(image_file)[0]
-            logging.info(f"Processing image {image_file} with master ID {master_id}")
-            metadata = extract_and_save_objects(image_path, master_id)
-            all_metadata.extend(metadata)
+            image_items.append((image_path, master_id))
+    return image_items
+
+def delete_stale_crops(old_rows, new_rows, master_ids):
+    """Delete the crop files (and mask sidecars) of master_ids that the new rows no longer point at.
+
+    Only files named after the image itself are deleted, so crops shared
+    with other images are left alone.
+    """
+    master_ids = set(master_ids)
+    kept_paths = {row['file_path'] for row in new_rows}
+    deleted = 0
+    for row in old_rows:
+        file_path = row['file_path']
+        if row['master_id'] not in master_ids or file_path in kept_paths or not isinstance(file_path, str):
+            continue
+        if not os.path.basename(file_path).startswith(f"{row['master_id']}_"):
+            continue
+        for path in (file_path, os.path.splitext(file_path)[0] + '_mask.png'):
+            if os.path.exists(path):
+                os.remove(path)
+                deleted += 1
+    if deleted:
+        logging.info(f"Deleted {deleted} stale crop files.")
+
+def segmentation_fingerprint(master_id, score_threshold=0.5):
+    """Fingerprint of everything a cached segmentation result depends on besides the pixels."""
+    # fp32 keeps the fingerprint it had before precision modes existed, so old cache entries stay valid
+    precision = () if segmentation_precision == 'fp32' else (segmentation_precision,)
+    # Boxes and crops are in decoded pixels; full-resolution decoding keeps the old fingerprint
+    decode = () if preprocessing.decode_max_side is None else (preprocessing.decode_max_side,)
+    return config_fingerprint(segmentation_model_name, master_id, score_threshold,
+                              save_alpha_crops, save_mask_sidecars, *precision, *decode)
+
+@instrument('segmentation')
+def process_all_images(batch_size=segmentation_batch_size, max_batch_memory_mb=segmentation_max_batch_memory_mb,
+                       use_cache=True, incremental=False, deduplicate=None):
+    image_items = list_input_images()
+    cache = get_result_cache() if use_cache else None
+    deduplicate = dedup.dedup_images if deduplicate is None else deduplicate
+
+    # Near-duplicates are found among all inputs, so a new copy of an unchanged image is skipped too
+    duplicates = {}
+    if deduplicate:
+        duplicates = find_duplicates(image_items)
+        save_duplicates(duplicates)
+    image_paths = {master_id: image_path for image_path, master_id in image_items}
+
+    if incremental:
+        # Only segment new or changed images and merge their rows into the existing metadata
+        manifest = load_manifest()
+        inputs = scan_inputs(manifest, image_items)
+
+        def stage_fingerprint(master_id):
+            return duplicate_fingerprint(segmentation_fingerprint(master_id), master_id, duplicates, inputs)
+
+        changed, removed = plan_stage(manifest, 'segmentation', inputs, stage_fingerprint)
+        changed_ids = set(changed)
+        image_items = [(image_path, master_id) for image_path, master_id in image_items if master_id in changed_ids]
+
+    metadata_by_master_id = {}
+    content_hashes = {}
+    pending_items = []
+    for image_path, master_id in image_items:
+        if master_id in duplicates:
+            continue
+        if cache is not None:
+            content_hash = inputs[master_id]['content_hash'] if incremental else file_content_hash(image_path)
+            content_hashes[master_id] = content_hash
+            cached = cache.get('segmentation', content_hash, segmentation_fingerprint(master_id))
+            # A hit is only usable while the crops it points at are still on disk
+            if cached is not None and all(os.path.exists(row['file_path']) for row in cached):
+                metadata_by_master_id[master_id] = cached
+                continue
+        pending_items.append((image_path, master_id))
+
+    skipped = {master_id: duplicates[master_id] for _, master_id in image_items if master_id in duplicates}
+    if cache is not None:
+        logging.info(f"Segmentation cache: {len(image_items) - len(skipped) - len(pending_items)} hits, "
+                     f"{len(pending_items)} misses.")
+
+    start_time = time.perf_counter()
+    for _, master_id, metadata in iter_segmented_images(pending_items, batch_size=batch_size,
+                                                         max_batch_memory_mb=max_batch_memory_mb):
+        metadata_by_master_id[master_id] = metadata
+        if cache is not None:
+            cache.put('segmentation', content_hashes[master_id], segmentation_fingerprint(master_id), metadata)
+    elapsed = time.perf_counter() - start_time
+    if pending_items and elapsed > 0:
+        logging.info(f"Segmented {len(pending_items)} images in {elapsed:.2f}s "
+                     f"({len(pending_items) / elapsed:.2f} images/sec, batch size {batch_size}).")
+
+    existing_metadata = []
+    if incremental and output_exists(metadata_file):
+        existing_metadata = read_table(metadata_file, dtype={'master_id': str}).to_dict('records')
+
+    if deduplicate:
+        # Duplicates get the objects of the image they copy, boxes scaled to their own size and crops shared
+        run_ids = {master_id for _, master_id in image_items}
+        for master_id, (duplicate_of, _) in skipped.items():
+            original_rows = metadata_by_master_id.get(duplicate_of)
+            if original_rows is None and duplicate_of in run_ids:
+                # Segmentation failed on the original in this run, so there is nothing to reuse
+                continue
+            if original_rows is None:
+                original_rows = [row for row in existing_metadata if row['master_id'] == duplicate_of]
+            metadata_by_master_id[master_id] = reuse_object_rows(
+                original_rows, master_id, scale_factors(image_paths[master_id], image_paths[duplicate_of]))
+        log_dedup_stats('segmentation', len(image_items), skipped)
+
+    all_metadata = []
+    for _, master_id in image_items:
+        all_metadata.extend(metadata_by_master_id.get(master_id, []))
+
+    if incremental:
+        delete_stale_crops(existing_metadata, all_metadata, changed + removed)
+        all_metadata = merge_records(existing_metadata, all_metadata, changed + removed)
+        for master_id in metadata_by_master_id:
+            record_stage(manifest, 'segmentation', master_id, inputs[master_id], stage_fingerprint(master_id))
+        for master_id in removed:
+            forget_stage(manifest, 'segmentation', master_id)
+        save_manifest(manifest)
 
     metadata_df = pd.DataFrame(all_metadata)
-    metadata_df.to_csv(metadata_file, index=False)
-    logging.info(f"Extraction and storage complete. Metadata saved to {metadata_file}.")
+    metadata_path = write_table(metadata_df, metadata_file)
+    logging.info(f"Extraction and storage complete. Metadata saved to {metadata_path}.")
 
 if __name__ == '__main__':
-    process_all_images()
+    parser = argparse.ArgumentParser(description="Segment objects from the input images with Mask R-CNN.")
+    parser.add_argument('--batch-size', type=int, default=segmentation_batch_size)
+    parser.add_argument('--max-batch-memory-mb', type=int, default=segmentation_max_batch_memory_mb)
+    parser.add_argument('--alpha', action='store_true', help="Save crops as PNG with an alpha channel.")
+    parser.add_argument('--mask-sidecar', action='store_true', help="Save a PNG mask next to each crop.")
+    parser.add_argument('--incremental', action='store_true', help="Only process new or changed images.")
+    add_dedup_arguments(parser)
+    add_decode_argument(parser)
+    add_precision_argument(parser, segmentation_precision)
+    add_backend_argument(parser, segmentation_backend)
+    add_cache_arguments(parser)
+    add_output_format_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    set_output_format(args.output_format)
+    segmentation_precision = args.precision
+    segmentation_backend = args.backend
+    save_alpha_crops = args.alpha
+    save_mask_sidecars = args.mask_sidecar
+    dedup.dedup_max_distance = args.dedup_max_distance
+    preprocessing.decode_max_side = args.decode_max_side or None
+    if args.invalidate_cache:
+        get_result_cache().invalidate('segmentation')
+
+    process_all_images(batch_size=args.batch_size, max_batch_memory_mb=args.max_batch_memory_mb,
+                       use_cache=not args.no_cache, incremental=args.incremental, deduplicate=args.dedup)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
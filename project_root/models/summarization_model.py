@@ -1,14 +1,26 @@
 import pandas as pd
-import json
 import os
 import csv
+import sys
+import argparse
 import logging
 
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.manifest import (load_manifest, save_manifest, recorded_inputs, upstream_fingerprint, plan_stage,
+                            record_stage, forget_stage, merge_records)
+from utils.storage import (read_table, save_output, load_output_records, output_exists, add_output_format_argument,
+                           set_output_format)
+from utils.association import attach_object_boxes, associate_text_with_objects, image_master_ids
+from utils.metrics import instrument, add_metrics_arguments, write_metrics_report
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Define file paths
 identification_results_file = 'data/descriptions.csv'
+metadata_file = 'data/metadata.csv'
 text_extraction_results_file = 'data/text_extraction_results.csv'
 summary_results_file = 'data/summaries.csv'
 summary_results_json_file = 'data/summaries.json'
@@ -18,17 +30,18 @@ def file_exists(file_path):
     return os.path.isfile(file_path)
 
 def load_csv_files():
-    if not file_exists(identification_results_file):
+    if not output_exists(identification_results_file):
         logging.error(f"Identification results file not found: {identification_results_file}")
         raise FileNotFoundError(f"File not found: {identification_results_file}")
     
-    if not file_exists(text_extraction_results_file):
+    if not output_exists(text_extraction_results_file):
         logging.error(f"Text extraction results file not found: {text_extraction_results_file}")
         raise FileNotFoundError(f"File not found: {text_extraction_results_file}")
     
     try:
-        identification_df = pd.read_csv(identification_results_file, encoding='utf-8', quoting=csv.QUOTE_MINIMAL)
-        text_extraction_df = pd.read_csv(text_extraction_results_file, encoding='utf-8', quoting=csv.QUOTE_MINIMAL)
+        identification_df = read_table(identification_results_file, dtype={'master_id': str}, encoding='utf-8',
+                                       quoting=csv.QUOTE_MINIMAL)
+        text_extraction_df = read_table(text_extraction_results_file, encoding='utf-8', quoting=csv.QUOTE_MINIMAL)
         return identification_df, text_extraction_df
     except pd.errors.EmptyDataError:
         logging.error("One or more CSV files are empty.")
@@ -53,11 +66,17 @@ def preprocess_dataframes(identification_df, text_extraction_df):
     if missing_text_columns:
         logging.warning(f"Missing columns in text extraction results: {missing_text_columns}")
 
+    # Attach the segmentation box of every object so OCR lines can be matched to it
+    if output_exists(metadata_file):
+        identification_df = attach_object_boxes(identification_df, read_table(metadata_file, dtype={'master_id': str}))
+    else:
+        logging.warning(f"Segmentation metadata not found: {metadata_file}")
+
     return identification_df
 
 def generate_summaries(identification_df, text_extraction_df):
-    # Merge results on 'Image' column
-    merged_df = pd.merge(identification_df, text_extraction_df, on='Image', how='left')
+    # Link each OCR line to the objects of the same image that it overlaps
+    merged_df = associate_text_with_objects(identification_df, text_extraction_df)
 
     # Populate summary DataFrame
     summary_df = merged_df[['master_id', 'object_id', 'file_path', 'description', 'BBox', 'Text', 'Confidence']].copy()
@@ -67,41 +86,62 @@ def generate_summaries(identification_df, text_extraction_df):
 
 def save_summaries(summary_df):
     try:
-        # Save summary results to CSV
-        summary_df.to_csv(summary_results_file, index=False)
-        logging.info(f"Saved summary results to {summary_results_file}")
-
-        # Save summary results to JSON
-        summary_json = summary_df.to_dict(orient='records')
-        with open(summary_results_json_file, 'w') as json_file:
-            json.dump(summary_json, json_file, indent=4)
-        logging.info(f"Saved summary results to {summary_results_json_file}")
+        # Save summary results as CSV + JSON, Parquet or JSON Lines
+        save_output(summary_df, summary_results_file, summary_results_json_file)
 
     except Exception as e:
         logging.error(f"Error saving summaries: {e}")
         raise
 
-if __name__ == '__main__':
-    try:
-        # Load CSV files
-        identification_df, text_extraction_df = load_csv_files()
+@instrument('summarization')
+def summarize(incremental=False):
+    # Load CSV files
+    identification_df, text_extraction_df = load_csv_files()
+
+    logging.info(f"Loaded {len(identification_df)} identification rows and {len(text_extraction_df)} OCR rows.")
 
-        # Log column names and sample rows for debugging
-        logging.info(f"Identification DataFrame columns: {identification_df.columns}")
-        logging.info(f"Text Extraction DataFrame columns: {text_extraction_df.columns}")
-        logging.info("Sample rows from identification DataFrame:")
-        logging.info(identification_df.head())
-        logging.info("Sample rows from text extraction DataFrame:")
-        logging.info(text_extraction_df.head())
+    # Preprocess the dataframes
+    identification_df = preprocess_dataframes(identification_df, text_extraction_df)
 
-        # Preprocess the dataframes
-        identification_df = preprocess_dataframes(identification_df, text_extraction_df)
+    if incremental:
+        # Only summarize images whose identification or OCR results changed since the last run
+        manifest = load_manifest()
+        upstream_stages = ['identification', 'ocr']
+        inputs = recorded_inputs(manifest, upstream_stages)
 
-        # Generate summaries
-        summary_df = generate_summaries(identification_df, text_extraction_df)
+        def stage_fingerprint(master_id):
+            return upstream_fingerprint(manifest, master_id, upstream_stages)
 
-        # Save summaries
-        save_summaries(summary_df)
+        changed, removed = plan_stage(manifest, 'summarization', inputs, stage_fingerprint)
+        identification_df = identification_df[identification_df['master_id'].astype(str).isin(changed)]
+        text_extraction_df = text_extraction_df[image_master_ids(text_extraction_df['Image']).isin(changed)]
 
+    # Generate summaries
+    summary_df = generate_summaries(identification_df, text_extraction_df)
+
+    if incremental:
+        summary_records = merge_records(load_output_records(summary_results_file, summary_results_json_file),
+                                        summary_df.to_dict(orient='records'), changed + removed)
+        summary_df = pd.DataFrame(summary_records)
+        for master_id in changed:
+            record_stage(manifest, 'summarization', master_id, inputs[master_id], stage_fingerprint(master_id))
+        for master_id in removed:
+            forget_stage(manifest, 'summarization', master_id)
+        save_manifest(manifest)
+
+    # Save summaries
+    save_summaries(summary_df)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize identification and text extraction results.")
+    parser.add_argument('--incremental', action='store_true', help="Only process new or changed images.")
+    add_output_format_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    set_output_format(args.output_format)
+    try:
+        summarize(incremental=args.incremental)
     except Exception as e:
         logging.error(f"An error occurred during the summarization process: {e}")
+    write_metrics_report(args.metrics_json, args.metrics_prom)
@@ -1,9 +1,31 @@
 import os
 import cv2
-import easyocr
 import pandas as pd
-import json
+import sys
+import argparse
 import logging
+import multiprocessing
+import torch
+from torch import nn
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.registry import register_model, get_model
+from models.backends import load_graph, export_graph, add_backend_argument
+from utils.cache import get_result_cache, file_content_hash, config_fingerprint, add_cache_arguments
+from utils.manifest import (load_manifest, save_manifest, scan_inputs, plan_stage, record_stage, forget_stage,
+                            merge_records)
+from utils.storage import (read_table, save_output, load_output_records, output_exists, add_output_format_argument,
+                           set_output_format)
+from utils import metrics
+from utils.metrics import timed, instrument, add_metrics_arguments, write_metrics_report
+from utils import preprocessing
+from utils.preprocessing import load_image, add_decode_argument
+from utils import dedup
+from utils.dedup import (find_duplicates, scale_factors, reuse_text_rows, log_dedup_stats, save_duplicates,
+                         duplicate_fingerprint, add_dedup_arguments)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,20 +34,275 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 input_images_dir = 'data/input_images'
 text_extraction_results_file_csv = 'data/text_extraction_results.csv'
 text_extraction_results_file_json = 'data/text_extraction_results.json'
+metadata_file = 'data/metadata.csv'
+
+ocr_languages = ['en']
+
+# OCR mode: 'full' runs EasyOCR on the whole frame, 'roi' runs a downscaled
+# detection pass first and only recognizes the detected text regions
+ocr_mode = 'full'
+ocr_detect_scale = 0.5
+ocr_min_region_size = 32
+ocr_recognize_batch_size = 16
+
+# Parallel OCR settings; each worker process owns its own reader
+ocr_num_workers = 1
+ocr_torch_threads = 1
+
+# Inference backend: 'torch' (eager) or the 'torchscript' / 'onnx' networks written by models/export.py
+ocr_backend = 'torch'
+
+class RecognizerGraph(nn.Module):
+    """EasyOCR's recognizer with only the image input; its text argument is unused at inference."""
+
+    def __init__(self, recognizer):
+        super().__init__()
+        self.recognizer = recognizer
+
+    def forward(self, images):
+        return self.recognizer(images, None)
+
+class ExportedOcrNetwork:
+    """Exported EasyOCR detector or recognizer that the reader calls in place of its torch module."""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def eval(self):
+        return self
+
+    def __call__(self, images, *unused):
+        outputs = self.graph(images)
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+def load_ocr_reader(backend=None, quantize=True):
+    """Initialize the EasyOCR reader with the networks of the configured backend."""
+    import easyocr
+    reader = easyocr.Reader(ocr_languages, quantize=quantize)
+    backend = backend or ocr_backend
+    if backend != 'torch':
+        # EasyOCR keeps its own pre- and post-processing; only the two networks are swapped
+        reader.detector = ExportedOcrNetwork(load_graph('ocr_detector', backend))
+        reader.recognizer = ExportedOcrNetwork(load_graph('ocr_recognizer', backend))
+    return reader
+
+register_model('ocr', load_ocr_reader)
 
-# Initialize EasyOCR reader
-reader = easyocr.Reader(['en'])
+def export_ocr_model(reader, fmt):
+    """Export the detector and recognizer of an unquantized EasyOCR reader.
 
-def extract_text(image_path):
-    image = cv2.imread(image_path)
+    Image height and width stay dynamic for the detector, batch size and
+    line width for the recognizer.
+    """
+    detector = getattr(reader.detector, 'module', reader.detector).cpu().eval()
+    recognizer = RecognizerGraph(getattr(reader.recognizer, 'module', reader.recognizer).cpu().eval())
+    export_graph(detector, (torch.rand(1, 3, 480, 640),), 'ocr_detector', fmt, input_names=['images'],
+                 output_names=['scores', 'features'],
+                 dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'},
+                               'scores': {0: 'batch', 1: 'height', 2: 'width'},
+                               'features': {0: 'batch', 2: 'height', 3: 'width'}})
+    export_graph(recognizer, (torch.rand(2, 1, 64, 256),), 'ocr_recognizer', fmt, input_names=['lines'],
+                 output_names=['logits'], dynamic_axes={'lines': {0: 'batch', 3: 'width'},
+                                                        'logits': {0: 'batch', 1: 'steps'}})
+
+def get_ocr_reader():
+    """Return the shared EasyOCR reader, initializing it on first use."""
+    return get_model('ocr')
+
+def extract_text(image_path, mode='full', regions=None, image=None):
+    """Run OCR on an image file, or on its already decoded buffer when one is passed."""
     if image is None:
-        raise ValueError(f"Failed to load image: {image_path}")
-    
+        with timed('ocr.decode'):
+            image = load_image(image_path)
+
+    if mode == 'roi':
+        return extract_text_roi(image, regions)
+    return extract_text_from_array(image)
+
+def extract_text_from_array(image):
+    """Run OCR on an already decoded image."""
     # Extract text from the image
-    results = reader.readtext(image)
+    with timed('ocr.readtext'):
+        results = get_ocr_reader().readtext(image)
     return results
 
-def process_images_and_save_results():
+def merge_regions(regions):
+    """Merge overlapping (x_min, y_min, x_max, y_max) regions so no area is detected twice."""
+    merged = [list(region) for region in regions]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(len(merged) - 1, i, -1):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del merged[j]
+                    changed = True
+    return [tuple(region) for region in merged]
+
+def detect_text_regions(image, regions=None, detect_scale=ocr_detect_scale):
+    """Run the EasyOCR text detector on (downscaled) regions of a BGR image.
+
+    regions defaults to the whole frame. Returns EasyOCR's horizontal boxes
+    ([x_min, x_max, y_min, y_max]) and free-form quadrilaterals in full-image
+    coordinates.
+    """
+    reader = get_ocr_reader()
+    height, width = image.shape[:2]
+    if regions is None:
+        regions = [(0, 0, width, height)]
+
+    horizontal_list, free_list = [], []
+    for x_min, y_min, x_max, y_max in merge_regions(regions):
+        x_min, y_min = max(0, int(x_min)), max(0, int(y_min))
+        x_max, y_max = min(width, int(x_max)), min(height, int(y_max))
+        if x_max - x_min < ocr_min_region_size or y_max - y_min < ocr_min_region_size:
+            continue
+
+        roi = image[y_min:y_max, x_min:x_max]
+        # Only downscale while the region stays large enough for the detector
+        scale = detect_scale if min(roi.shape[:2]) * detect_scale >= ocr_min_region_size else 1.0
+        if scale != 1.0:
+            roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        with timed('ocr.detect'):
+            region_horizontal, region_free = reader.detect(roi)
+        for box_x_min, box_x_max, box_y_min, box_y_max in region_horizontal[0]:
+            horizontal_list.append([
+                int(box_x_min / scale) + x_min, int(box_x_max / scale) + x_min,
+                int(box_y_min / scale) + y_min, int(box_y_max / scale) + y_min,
+            ])
+        for polygon in region_free[0]:
+            free_list.append([[point[0] / scale + x_min, point[1] / scale + y_min] for point in polygon])
+
+    return horizontal_list, free_list
+
+def extract_text_roi(image, regions=None, detect_scale=ocr_detect_scale, batch_size=ocr_recognize_batch_size):
+    """Detect text cheaply first and only run recognition on the detected boxes.
+
+    regions optionally restricts detection to e.g. segmented object boxes.
+    Images without any detected text skip recognition entirely. Returns the
+    same (bbox, text, prob) tuples as readtext.
+    """
+    horizontal_list, free_list = detect_text_regions(image, regions, detect_scale)
+    if not horizontal_list and not free_list:
+        return []
+
+    # All candidate boxes of the image are recognized together in batches
+    with timed('ocr.recognize', items=len(horizontal_list) + len(free_list)):
+        return get_ocr_reader().recognize(image, horizontal_list=horizontal_list, free_list=free_list,
+                                          batch_size=batch_size)
+
+def load_segmentation_regions():
+    """Return {master_id: [(x_min, y_min, x_max, y_max), ...]} from the segmentation metadata."""
+    if not output_exists(metadata_file):
+        return {}
+    metadata_df = read_table(metadata_file, dtype={'master_id': str})
+    if not {'x_min', 'y_min', 'x_max', 'y_max'}.issubset(metadata_df.columns):
+        logging.warning(f"{metadata_file} has no object boxes; re-run segmentation to use them as OCR regions.")
+        return {}
+    return {
+        master_id: list(group[['x_min', 'y_min', 'x_max', 'y_max']].itertuples(index=False, name=None))
+        for master_id, group in metadata_df.groupby('master_id')
+    }
+
+def format_ocr_results(results):
+    """Convert EasyOCR (bbox, text, prob) tuples into JSON-friendly BBox/Text/Confidence rows."""
+    rows = []
+    for (bbox, text, prob) in results:
+        bbox = [[float(coord) for coord in point] for point in bbox]  # Convert bbox coordinates to float
+        prob = float(prob)  # Ensure confidence is a float
+        rows.append({
+            'BBox': bbox,
+            'Text': text,
+            'Confidence': prob
+        })
+    return rows
+
+def _init_ocr_worker(torch_threads, backend='torch', decode_max_side=preprocessing.decode_max_side):
+    global ocr_backend
+    # Cap intra-op threads so workers x threads does not oversubscribe the host
+    torch.set_num_threads(torch_threads)
+    # Spawned workers re-import this module, so settings from the parent's CLI are passed in
+    ocr_backend = backend
+    preprocessing.decode_max_side = decode_max_side
+
+def _ocr_worker(image_path, mode='full', regions=None):
+    try:
+        return format_ocr_results(extract_text(image_path, mode, regions)), None
+    except Exception as e:
+        return None, str(e)
+
+def _ocr_pool_worker(image_path, mode='full', regions=None):
+    # Worker processes have their own metrics registry, so ship its spans back with the result
+    rows, error = _ocr_worker(image_path, mode, regions)
+    return rows, error, metrics.collect_and_reset()
+
+def iter_ocr_results(image_paths, num_workers=ocr_num_workers, torch_threads=ocr_torch_threads, mode='full',
+                     regions_by_path=None):
+    """Run OCR over image paths and yield (image_path, rows, error) in input order.
+
+    regions_by_path optionally maps an image path to the regions 'roi' mode
+    should detect text in.
+
+    With more than one worker the images are sharded across a process pool;
+    each result is yielded as soon as it and every earlier one are complete,
+    and at most a few images per worker are in flight at a time.
+    """
+    image_paths = list(image_paths)
+    regions_by_path = regions_by_path or {}
+    if num_workers <= 1:
+        for image_path in image_paths:
+            rows, error = _ocr_worker(image_path, mode, regions_by_path.get(image_path))
+            yield image_path, rows, error
+        return
+
+    max_in_flight = num_workers * 4
+    completed = {}
+    next_to_submit = 0
+    next_to_yield = 0
+    # Spawned workers start without the parent's torch thread pools or loaded models
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_ocr_worker,
+                             initargs=(torch_threads, ocr_backend, preprocessing.decode_max_side)) as executor:
+        in_flight = {}
+        while next_to_yield < len(image_paths):
+            while next_to_submit < len(image_paths) and len(in_flight) < max_in_flight:
+                image_path = image_paths[next_to_submit]
+                future = executor.submit(_ocr_pool_worker, image_path, mode, regions_by_path.get(image_path))
+                in_flight[future] = next_to_submit
+                next_to_submit += 1
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                try:
+                    rows, error, worker_metrics = future.result()
+                    metrics.get_metrics().merge(worker_metrics)
+                    completed[index] = (rows, error)
+                except Exception as e:
+                    completed[index] = (None, str(e))
+
+            while next_to_yield in completed:
+                rows, error = completed.pop(next_to_yield)
+                yield image_paths[next_to_yield], rows, error
+                next_to_yield += 1
+
+def ocr_fingerprint(mode='full', use_segmentation_regions=False):
+    """Fingerprint of the OCR engine settings a cached result depends on."""
+    import easyocr
+    # Text boxes are in decoded pixels; full-resolution decoding keeps the old fingerprint
+    decode = () if preprocessing.decode_max_side is None else (preprocessing.decode_max_side,)
+    if mode == 'full':
+        return config_fingerprint('easyocr', easyocr.__version__, ocr_languages, *decode)
+    return config_fingerprint('easyocr', easyocr.__version__, ocr_languages, mode, ocr_detect_scale,
+                              ocr_min_region_size, use_segmentation_regions, *decode)
+
+@instrument('ocr')
+def process_images_and_save_results(use_cache=True, incremental=False, num_workers=ocr_num_workers,
+                                    torch_threads=ocr_torch_threads, mode=ocr_mode, use_segmentation_regions=False,
+                                    deduplicate=None):
     # Validate the input directory
     if not os.path.exists(input_images_dir):
         logging.error(f"Input directory {input_images_dir} does not exist.")
@@ -35,47 +312,156 @@ def process_images_and_save_results():
     results_list = []
 
     # Get a list of image files in the input directory
-    image_files = [f for f in os.listdir(input_images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    image_files = sorted(f for f in os.listdir(input_images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
 
     if not image_files:
         logging.warning(f"No image files found in {input_images_dir}.")
         return
 
-    # Extract text/data from each image
+    cache = get_result_cache() if use_cache else None
+    fingerprint = ocr_fingerprint(mode, use_segmentation_regions)
+    cache_hits = 0
+
+    # Near-duplicates are found among all inputs, so a new copy of an unchanged image is skipped too
+    deduplicate = dedup.dedup_images if deduplicate is None else deduplicate
+    files_by_master_id = {os.path.splitext(f)[0]: f for f in image_files}
+    duplicates = {}
+    if deduplicate:
+        duplicates = find_duplicates([(os.path.join(input_images_dir, f), os.path.splitext(f)[0])
+                                      for f in image_files])
+        save_duplicates(duplicates)
+
+    # In 'roi' mode, images already segmented are only searched for text inside their object boxes
+    regions_by_master_id = load_segmentation_regions() if mode == 'roi' and use_segmentation_regions else {}
+
+    if incremental:
+        # Only run OCR on new or changed images and merge their rows into the existing results
+        manifest = load_manifest()
+        inputs = scan_inputs(manifest, [(os.path.join(input_images_dir, f), os.path.splitext(f)[0])
+                                        for f in image_files])
+
+        def stage_fingerprint(master_id):
+            return duplicate_fingerprint(fingerprint, master_id, duplicates, inputs)
+
+        changed, removed = plan_stage(manifest, 'ocr', inputs, stage_fingerprint)
+        replaced_files = ([inputs[master_id]['file_name'] for master_id in changed]
+                          + [manifest['images'][master_id].get('file_name') for master_id in removed])
+        changed_ids = set(changed)
+        image_files = [f for f in image_files if os.path.splitext(f)[0] in changed_ids]
+
+    # Serve cache hits first and collect the images that still need OCR
+    rows_by_file = {}
+    content_hashes = {}
+    pending_paths = []
     for image_file in image_files:
         image_path = os.path.join(input_images_dir, image_file)
-        try:
-            results = extract_text(image_path)
-            
-            # Process the results and store them in the list
-            for (bbox, text, prob) in results:
-                bbox = [[float(coord) for coord in point] for point in bbox]  # Convert bbox coordinates to float
-                prob = float(prob)  # Ensure confidence is a float
-                
-                results_list.append({
-                    'Image': image_file,
-                    'BBox': bbox,
-                    'Text': text,
-                    'Confidence': prob
-                })
-            logging.info(f"Processed {image_file} successfully.")
-        except Exception as e:
-            logging.error(f"Error processing {image_file}: {e}")
-
-    # Convert list to DataFrame
-    results_df = pd.DataFrame(results_list)
-
-    # Save results to CSV file
-    results_df.to_csv(text_extraction_results_file_csv, index=False)
-    logging.info(f"Saved text extraction results to {text_extraction_results_file_csv}")
-
-    # Save results to JSON file
+        master_id = os.path.splitext(image_file)[0]
+        if master_id in duplicates:
+            continue
+        if cache is not None:
+            content_hash = inputs[master_id]['content_hash'] if incremental else file_content_hash(image_path)
+            if master_id in regions_by_master_id:
+                # The regions are an input too, so they are part of the cache key
+                content_hash = config_fingerprint(content_hash, regions_by_master_id[master_id])
+            content_hashes[image_file] = content_hash
+            rows = cache.get('ocr', content_hash, fingerprint)
+            if rows is not None:
+                rows_by_file[image_file] = rows
+                cache_hits += 1
+                continue
+        pending_paths.append(image_path)
+
+    # Extract text/data from the remaining images
+    regions_by_path = {
+        image_path: regions_by_master_id[os.path.splitext(os.path.basename(image_path))[0]]
+        for image_path in pending_paths
+        if os.path.splitext(os.path.basename(image_path))[0] in regions_by_master_id
+    }
+    for image_path, rows, error in iter_ocr_results(pending_paths, num_workers, torch_threads, mode,
+                                                    regions_by_path):
+        image_file = os.path.basename(image_path)
+        if error is not None:
+            logging.error(f"Error processing {image_file}: {error}")
+            continue
+        rows_by_file[image_file] = rows
+        if cache is not None:
+            cache.put('ocr', content_hashes[image_file], fingerprint, rows)
+        logging.info(f"Processed {image_file} successfully.")
+
+    existing_records = []
+    if incremental:
+        existing_records = load_output_records(text_extraction_results_file_csv, text_extraction_results_file_json)
+
+    image_ids = [os.path.splitext(f)[0] for f in image_files]
+    skipped = {master_id: duplicates[master_id] for master_id in image_ids if master_id in duplicates}
+    if deduplicate:
+        # Duplicates get the text of the image they copy, boxes scaled to their own size
+        for master_id, (duplicate_of, _) in skipped.items():
+            original_file = files_by_master_id[duplicate_of]
+            original_rows = rows_by_file.get(original_file)
+            if original_rows is None and duplicate_of in image_ids:
+                # OCR failed on the original in this run, so there is nothing to reuse
+                continue
+            if original_rows is None:
+                original_rows = [{key: value for key, value in record.items() if key != 'Image'}
+                                 for record in existing_records if record.get('Image') == original_file]
+            rows_by_file[files_by_master_id[master_id]] = reuse_text_rows(
+                original_rows, scale_factors(os.path.join(input_images_dir, files_by_master_id[master_id]),
+                                             os.path.join(input_images_dir, original_file)))
+        log_dedup_stats('ocr', len(image_files), skipped)
+
+    # Store the results in input order
+    processed_ids = []
+    for image_file in image_files:
+        if image_file not in rows_by_file:
+            continue
+        for row in rows_by_file[image_file]:
+            results_list.append({'Image': image_file, **row})
+        processed_ids.append(os.path.splitext(image_file)[0])
+
+    if cache is not None:
+        logging.info(f"OCR cache: {cache_hits} hits, {len(image_files) - len(skipped) - cache_hits} misses.")
+
+    if incremental:
+        results_list = merge_records(existing_records, results_list, replaced_files, key='Image')
+        for master_id in processed_ids:
+            record_stage(manifest, 'ocr', master_id, inputs[master_id], stage_fingerprint(master_id))
+        for master_id in removed:
+            forget_stage(manifest, 'ocr', master_id)
+        save_manifest(manifest)
+
+    # Save results as CSV + JSON, Parquet or JSON Lines
     try:
-        with open(text_extraction_results_file_json, 'w') as json_file:
-            json.dump(results_list, json_file, indent=4)
-        logging.info(f"Saved text extraction results to {text_extraction_results_file_json}")
+        save_output(results_list, text_extraction_results_file_csv, text_extraction_results_file_json)
     except TypeError as e:
         logging.error(f"Failed to save JSON results: {e}")
         
 if __name__ == '__main__':
-    process_images_and_save_results()
+    parser = argparse.ArgumentParser(description="Extract text from the input images with EasyOCR.")
+    parser.add_argument('--incremental', action='store_true', help="Only process new or changed images.")
+    parser.add_argument('--num-workers', type=int, default=ocr_num_workers)
+    parser.add_argument('--torch-threads', type=int, default=ocr_torch_threads)
+    parser.add_argument('--mode', choices=['full', 'roi'], default=ocr_mode,
+                        help="'roi' detects text on a downscaled frame first and only recognizes detected regions.")
+    parser.add_argument('--use-segmentation-regions', action='store_true',
+                        help="In 'roi' mode, only look for text inside segmented object boxes.")
+    add_dedup_arguments(parser)
+    add_decode_argument(parser)
+    add_backend_argument(parser, ocr_backend)
+    add_cache_arguments(parser)
+    add_output_format_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    set_output_format(args.output_format)
+    ocr_backend = args.backend
+    dedup.dedup_max_distance = args.dedup_max_distance
+    preprocessing.decode_max_side = args.decode_max_side or None
+    if args.invalidate_cache:
+        get_result_cache().invalidate('ocr')
+
+    process_images_and_save_results(use_cache=not args.no_cache, incremental=args.incremental,
+                                    num_workers=args.num_workers, torch_threads=args.torch_threads,
+                                    mode=args.mode, use_segmentation_regions=args.use_segmentation_regions,
+                                    deduplicate=args.dedup)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
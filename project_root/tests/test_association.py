@@ -0,0 +1,45 @@
+import unittest
+import pandas as pd
+from utils.association import GridIndex, match_text_boxes, image_master_ids, associate_text_with_objects
+
+class TestAssociation(unittest.TestCase):
+    def test_grid_index_query(self):
+        """Only boxes sharing a grid cell with the query are returned as candidates."""
+        index = GridIndex([(0, 0, 50, 50), (200, 200, 300, 300), None], cell_size=64)
+        self.assertEqual(index.query((10, 10, 20, 20)), [0])
+        self.assertEqual(index.query((0, 0, 256, 256)), [0, 1])
+
+    def test_match_text_boxes(self):
+        """Text boxes are linked to every object covering most of their area."""
+        objects = [(0, 0, 100, 100), (40, 0, 100, 100), (300, 300, 400, 400)]
+        texts = [(10, 10, 30, 20), (50, 10, 90, 20), (95, 10, 200, 20), None]
+        matches = match_text_boxes(objects, texts)
+        self.assertEqual(dict(matches), {0: [0, 1], 1: [1]})
+
+    def test_image_master_ids(self):
+        """Master ids match os.path.splitext(name)[0], including names with underscores."""
+        names = pd.Series(['img_1.jpg', 'img_1_2.png', 'a.b.jpg', 'plain'])
+        self.assertEqual(image_master_ids(names).tolist(), ['img_1', 'img_1_2', 'a.b', 'plain'])
+
+    def test_associate_text_with_objects(self):
+        """Images whose names share a prefix are not mixed up and rows do not multiply."""
+        objects_df = pd.DataFrame({
+            'master_id': ['img_1', 'img_1', 'img_2'],
+            'object_id': [0, 1, 0],
+            'file_path': ['img_1_0.jpg', 'img_1_1.jpg', 'img_2_0.jpg'],
+            'description': ['sign', 'car', 'sign'],
+            'x_min': [0, 200, 0], 'y_min': [0, 0, 0], 'x_max': [100, 300, 100], 'y_max': [100, 100, 100],
+        })
+        text_df = pd.DataFrame({
+            'Image': ['img_1.jpg', 'img_1.jpg', 'img_2.jpg'],
+            'BBox': ['[[10, 10], [50, 10], [50, 30], [10, 30]]', '[[500, 500], [510, 500], [510, 510], [500, 510]]',
+                     '[[10, 10], [50, 10], [50, 30], [10, 30]]'],
+            'Text': ['STOP', 'far away', 'GO'],
+            'Confidence': [0.9, 0.8, 0.7],
+        })
+        associated = associate_text_with_objects(objects_df, text_df)
+        self.assertEqual(len(associated), 3)
+        self.assertEqual(associated['Text'].fillna('N/A').tolist(), ['STOP', 'N/A', 'GO'])
+
+if __name__ == '__main__':
+    unittest.main()
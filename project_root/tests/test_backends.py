@@ -0,0 +1,96 @@
+import unittest
+import os
+import shutil
+import torch
+from torch import nn
+from unittest.mock import patch
+from models import backends
+from models.backends import export_graph, load_graph, max_abs_difference
+from models.segmentation_model import ExportedSegmentationModel
+from models.text_extraction_model import ExportedOcrNetwork
+from models.identification_model import ExportedClipModel, top_k_labels
+
+class TinyNetwork(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, 3, padding=1)
+        self.linear = nn.Linear(4, 8)
+
+    def forward(self, images):
+        features = self.conv(images).mean(dim=(2, 3))
+        return self.linear(features), features
+
+class TestBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_exported'
+        cls.original_dir = backends.exported_models_dir
+        backends.exported_models_dir = cls.test_dir
+        torch.manual_seed(0)
+        cls.model = TinyNetwork().eval()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        backends.exported_models_dir = cls.original_dir
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def assert_parity(self, fmt):
+        export_graph(self.model, (torch.rand(2, 3, 16, 16),), 'tiny', fmt, input_names=['images'],
+                     output_names=['logits', 'features'],
+                     dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'}, 'logits': {0: 'batch'},
+                                   'features': {0: 'batch'}})
+        graph = load_graph('tiny', fmt)
+        # A different batch and image size than the export example
+        images = torch.rand(5, 3, 24, 20)
+        with torch.no_grad():
+            expected = list(self.model(images))
+        self.assertLess(max_abs_difference(expected, graph(images)), 1e-4)
+
+    def test_torchscript_parity(self):
+        """A traced graph reproduces the eager outputs."""
+        self.assert_parity('torchscript')
+
+    def test_onnx_parity(self):
+        """The ONNX Runtime graph reproduces the eager outputs with dynamic batch and image size."""
+        if backends.ort is None:
+            self.skipTest("onnxruntime is not installed")
+        self.assert_parity('onnx')
+
+    def test_missing_graph(self):
+        """Asking for a graph that was never exported points at the export command."""
+        with self.assertRaises(FileNotFoundError):
+            load_graph('not_exported', 'onnx')
+
+    def test_exported_model_interfaces(self):
+        """The adapters return what the eager Mask R-CNN and EasyOCR networks return."""
+        graph = lambda image: [torch.zeros(2, 4), torch.ones(2, dtype=torch.int64), torch.rand(2),
+                               torch.rand(2, 1, 8, 8)]
+        predictions = ExportedSegmentationModel(graph, 'onnx')(torch.rand(3, 3, 8, 8))
+        self.assertEqual(len(predictions), 3)
+        self.assertEqual(set(predictions[0]), {'boxes', 'labels', 'scores', 'masks'})
+
+        detector = ExportedOcrNetwork(lambda images: [torch.rand(1, 4, 4, 2), torch.rand(1, 32, 4, 4)])
+        scores, _ = detector.eval()(torch.rand(1, 3, 8, 8))
+        self.assertEqual(tuple(scores.shape), (1, 4, 4, 2))
+        recognizer = ExportedOcrNetwork(lambda lines: [torch.rand(2, 10, 97)])
+        self.assertEqual(tuple(recognizer(torch.rand(2, 1, 64, 40), None).shape), (2, 10, 97))
+
+    def test_exported_clip_features_on_model_device(self):
+        """CPU outputs of an ONNX graph are moved to the device the label embeddings live on."""
+        cpu_graph = lambda inputs: [torch.rand(len(inputs), 8)]
+        model = ExportedClipModel(cpu_graph, cpu_graph, 224)
+        # The meta device stands in for a GPU: any mix with CPU tensors is a device mismatch
+        with patch('models.identification_model.device', 'meta'):
+            image_features = model.encode_image(torch.rand(2, 3, 224, 224))
+            self.assertEqual(model.encode_text(torch.zeros(3, 77, dtype=torch.int64)).device.type, 'meta')
+        # get_text_features keeps the label embeddings on the model device
+        text_features = torch.rand(3, 8, device='meta')
+        probabilities, _ = top_k_labels(image_features, text_features, k=2)
+        self.assertEqual(image_features.device.type, 'meta')
+        self.assertEqual(tuple(probabilities.shape), (2, 2))
+
+if __name__ == '__main__':
+    unittest.main()
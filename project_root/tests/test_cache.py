@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+from utils.cache import ResultCache, file_content_hash, config_fingerprint
+
+class TestResultCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_cache'
+        cls.test_db_file = os.path.join(cls.test_dir, 'results.sqlite')
+        cls.test_image_path = os.path.join(cls.test_dir, 'test_image.jpg')
+        if not os.path.exists(cls.test_dir):
+            os.makedirs(cls.test_dir)
+        with open(cls.test_image_path, 'wb') as f:
+            f.write(b'\x00\x01\x02\x03')  # Dummy content for the image
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def setUp(self):
+        self.cache = ResultCache(self.test_db_file, max_size_mb=1)
+        self.cache.invalidate()
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_get_and_put(self):
+        """Results round-trip and are keyed by stage, content hash and fingerprint."""
+        content_hash = file_content_hash(self.test_image_path)
+        fingerprint = config_fingerprint('model', 0.5)
+        self.assertIsNone(self.cache.get('ocr', content_hash, fingerprint))
+
+        self.cache.put('ocr', content_hash, fingerprint, [{'Text': 'hello', 'Confidence': 0.9}])
+        self.assertEqual(self.cache.get('ocr', content_hash, fingerprint), [{'Text': 'hello', 'Confidence': 0.9}])
+        self.assertIsNone(self.cache.get('ocr', content_hash, config_fingerprint('model', 0.6)))
+        self.assertIsNone(self.cache.get('segmentation', content_hash, fingerprint))
+
+    def test_invalidate_stage(self):
+        """Invalidating one stage leaves the others untouched."""
+        self.cache.put('ocr', 'a', 'f', [])
+        self.cache.put('identification', 'a', 'f', ['dog', 0.9])
+        self.cache.invalidate('ocr')
+        self.assertIsNone(self.cache.get('ocr', 'a', 'f'))
+        self.assertEqual(self.cache.get('identification', 'a', 'f'), ['dog', 0.9])
+
+    def test_lru_eviction(self):
+        """The least recently used entries are evicted once the size bound is exceeded."""
+        payload = 'x' * (300 * 1024)
+        self.cache.put('ocr', 'first', 'f', payload)
+        self.cache.put('ocr', 'second', 'f', payload)
+        self.cache.get('ocr', 'first', 'f')  # Touch the first entry so the second is older
+        self.cache.put('ocr', 'third', 'f', payload)
+        self.cache.put('ocr', 'fourth', 'f', payload)
+
+        self.assertLessEqual(self.cache.total_size(), 1024 * 1024)
+        self.assertIsNone(self.cache.get('ocr', 'second', 'f'))
+        self.assertIsNotNone(self.cache.get('ocr', 'fourth', 'f'))
+
+if __name__ == '__main__':
+    unittest.main()
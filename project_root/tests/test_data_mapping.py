@@ -0,0 +1,55 @@
+import unittest
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from utils.data_mapping import create_data_mapping, write_data_mapping_json
+
+class TestDataMapping(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_data_mapping'
+        if not os.path.exists(cls.test_dir):
+            os.makedirs(cls.test_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def test_create_data_mapping_matches_groupby(self):
+        """Entries are grouped by sorted master_id with rows kept in their original order."""
+        merged_df = pd.DataFrame({
+            'master_id': ['b', 'a', 'b', 'a'],
+            'object_id': [0, 0, 1, 1],
+            'file_path': ['b_0.png', 'a_0.png', 'b_1.png', 'a_1.png'],
+            'description': ['cat', 'dog', 'car', 'tree'],
+            'BBox': ['[[0, 0], [1, 0], [1, 1], [0, 1]]', np.nan, np.nan, np.nan],
+            'Text': ['hi', np.nan, np.nan, np.nan],
+            'Confidence': [0.5, np.nan, np.nan, np.nan],
+        })
+        data_mapping = create_data_mapping(merged_df)
+
+        self.assertEqual([entry['master_id'] for entry in data_mapping], ['a', 'b'])
+        self.assertEqual([obj['object_id'] for obj in data_mapping[1]['object_details']], [0, 1])
+        self.assertEqual(data_mapping[1]['object_details'][0]['text_data'],
+                         {'BBox': '[[0, 0], [1, 0], [1, 1], [0, 1]]', 'Text': 'hi', 'Confidence': 0.5})
+
+    def test_write_data_mapping_json(self):
+        """The streaming writer produces the same bytes as json.dump with indent=4."""
+        data_mapping = [{'master_id': 'a', 'object_details': [{'object_id': 0, 'text_data': {'Text': 'hi'}}]},
+                        {'master_id': 'b', 'object_details': []}]
+        for entries in (data_mapping, []):
+            streamed_path = os.path.join(self.test_dir, 'streamed.json')
+            expected_path = os.path.join(self.test_dir, 'expected.json')
+            write_data_mapping_json(iter(entries), streamed_path)
+            with open(expected_path, 'w') as json_file:
+                json.dump({"images": entries}, json_file, indent=4)
+            with open(streamed_path) as a, open(expected_path) as b:
+                self.assertEqual(a.read(), b.read())
+
+if __name__ == '__main__':
+    unittest.main()
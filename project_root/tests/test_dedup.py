@@ -0,0 +1,107 @@
+import unittest
+import argparse
+import os
+import random
+import shutil
+import numpy as np
+from PIL import Image
+from utils.dedup import (BKTree, hamming_distance, perceptual_hash, find_duplicates, scale_factors,
+                         reuse_object_rows, reuse_text_rows, duplicate_fingerprint, add_dedup_arguments)
+from utils.manifest import plan_stage, record_stage
+
+class TestDedup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_dedup'
+        os.makedirs(cls.test_dir, exist_ok=True)
+        rng = np.random.default_rng(0)
+        # Blocky random images have distinct low frequencies, like real photos
+        for name, seed in (('original', 1), ('other', 2)):
+            blocks = np.random.default_rng(seed).integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+            image = Image.fromarray(blocks).resize((640, 480), Image.BILINEAR)
+            image.save(os.path.join(cls.test_dir, f'{name}.jpg'), quality=90)
+        original = Image.open(os.path.join(cls.test_dir, 'original.jpg'))
+        original.resize((320, 240), Image.BILINEAR).save(os.path.join(cls.test_dir, 'resized.jpg'), quality=70)
+        noisy = np.clip(np.asarray(original, dtype=np.int16) + rng.integers(-8, 9, size=(480, 640, 3)), 0, 255)
+        Image.fromarray(noisy.astype(np.uint8)).save(os.path.join(cls.test_dir, 'noisy.png'))
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def path(self, name):
+        return os.path.join(self.test_dir, name)
+
+    def test_near_duplicates_hash_close(self):
+        """Resized and re-encoded copies stay within the threshold; a different picture does not."""
+        original = perceptual_hash(self.path('original.jpg'))
+        self.assertLessEqual(hamming_distance(original, perceptual_hash(self.path('resized.jpg'))), 6)
+        self.assertLessEqual(hamming_distance(original, perceptual_hash(self.path('noisy.png'))), 6)
+        self.assertGreater(hamming_distance(original, perceptual_hash(self.path('other.jpg'))), 6)
+
+    def test_find_duplicates(self):
+        """Copies point at the first image of their group."""
+        items = [(self.path(f), os.path.splitext(f)[0]) for f in ('original.jpg', 'other.jpg', 'resized.jpg', 'noisy.png')]
+        duplicates = find_duplicates(items)
+        self.assertEqual({master_id: original for master_id, (original, _) in duplicates.items()},
+                         {'resized': 'original', 'noisy': 'original'})
+
+    def test_bk_tree_matches_brute_force(self):
+        """Range queries return exactly the hashes a linear scan finds."""
+        generator = random.Random(0)
+        hashes = [generator.getrandbits(64) for _ in range(500)]
+        # Near copies so some queries have matches
+        hashes += [value ^ (1 << generator.randrange(64)) for value in hashes[:50]]
+        tree = BKTree()
+        for index, value in enumerate(hashes):
+            tree.add(value, index)
+        for query in hashes[:20] + [generator.getrandbits(64) for _ in range(5)]:
+            expected = sorted(index for index, value in enumerate(hashes) if hamming_distance(query, value) <= 10)
+            self.assertEqual(sorted(index for _, index in tree.search(query, 10)), expected)
+
+    def test_reused_rows_are_scaled(self):
+        """Boxes copied from the original are mapped into the duplicate's pixels."""
+        factors = scale_factors(self.path('resized.jpg'), self.path('original.jpg'))
+        self.assertEqual(factors, (0.5, 0.5))
+        rows = reuse_object_rows([{'master_id': 'original', 'object_id': 1, 'file_path': 'original_1.jpg',
+                                   'x_min': 100, 'y_min': 50, 'x_max': 301, 'y_max': 250}], 'resized', factors)
+        self.assertEqual(rows, [{'master_id': 'resized', 'object_id': 1, 'file_path': 'original_1.jpg',
+                                 'x_min': 50, 'y_min': 25, 'x_max': 150, 'y_max': 125}])
+        text_rows = reuse_text_rows([{'BBox': '[[10, 20], [30, 20], [30, 40], [10, 40]]', 'Text': 'STOP',
+                                      'Confidence': 0.9}], factors)
+        self.assertEqual(text_rows[0]['BBox'], [[5.0, 10.0], [15.0, 10.0], [15.0, 20.0], [5.0, 20.0]])
+        self.assertEqual(text_rows[0]['Text'], 'STOP')
+
+    def test_duplicates_replanned_with_their_original(self):
+        """A duplicate's manifest record goes stale when its original changes or deduplication is switched off."""
+        inputs = {'original': {'content_hash': 'a'}, 'copy': {'content_hash': 'b'}}
+        duplicates = {'copy': ('original', 2)}
+        manifest = {'images': {}}
+        for master_id in inputs:
+            record_stage(manifest, 'ocr', master_id, inputs[master_id],
+                         duplicate_fingerprint('v1', master_id, duplicates, inputs))
+        self.assertEqual(duplicate_fingerprint('v1', 'original', duplicates, inputs), 'v1')
+
+        stage_fingerprint = lambda master_id: duplicate_fingerprint('v1', master_id, duplicates, inputs)
+        self.assertEqual(plan_stage(manifest, 'ocr', inputs, stage_fingerprint), ([], []))
+        # The original's content changes
+        changed_inputs = dict(inputs, original={'content_hash': 'c'})
+        changed, _ = plan_stage(manifest, 'ocr', changed_inputs,
+                                lambda master_id: duplicate_fingerprint('v1', master_id, duplicates, changed_inputs))
+        self.assertEqual(sorted(changed), ['copy', 'original'])
+        # Deduplication is switched off
+        changed, _ = plan_stage(manifest, 'ocr', inputs, 'v1')
+        self.assertEqual(changed, ['copy'])
+
+    def test_dedup_flag_defers_to_setting(self):
+        """Without --dedup the stages fall back to dedup_images instead of turning deduplication off."""
+        parser = argparse.ArgumentParser()
+        add_dedup_arguments(parser)
+        self.assertIsNone(parser.parse_args([]).dedup)
+        self.assertTrue(parser.parse_args(['--dedup']).dedup)
+
+if __name__ == '__main__':
+    unittest.main()
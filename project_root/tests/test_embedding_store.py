@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from utils.embedding_store import EmbeddingStore, normalize_rows
+
+class TestEmbeddingStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_embeddings'
+        rng = np.random.default_rng(0)
+        # Clustered vectors so the IVF lists are meaningful
+        centers = rng.normal(size=(8, 32))
+        cls.vectors = normalize_rows(centers[rng.integers(0, 8, 500)] + 0.3 * rng.normal(size=(500, 32)))
+        cls.ids = [{'master_id': f"image_{i // 5}", 'object_id': i % 5, 'file_path': f"object_{i}.png"}
+                   for i in range(len(cls.vectors))]
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def setUp(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.store = EmbeddingStore(self.test_dir)
+        self.store.reset('fingerprint')
+        # Two appends, as two identification runs would do
+        self.store.append(self.ids[:300], self.vectors[:300])
+        self.store.append(self.ids[300:], self.vectors[300:])
+
+    def test_search_matches_brute_force(self):
+        """Blocked exact search over the float16 memory map returns the brute-force top k."""
+        queries = self.vectors[:4]
+        scores, indices = EmbeddingStore(self.test_dir).search(queries, k=5, block_size=64)
+        stored = self.vectors.astype(np.float16).astype(np.float32)
+        expected = np.argsort(-(queries @ stored.T), axis=1, kind='stable')[:, :5]
+        np.testing.assert_array_equal(indices, expected)
+        np.testing.assert_allclose(scores[:, 0], 1.0, atol=1e-2)
+
+    def test_update_replaces_and_drops_rows(self):
+        """Re-encoded objects replace their rows and objects of dropped images disappear."""
+        self.store.update([self.ids[0]], -self.vectors[:1], drop_master_ids=['image_1'])
+        self.assertEqual(len(self.store), 500 - 1 - 5 + 1)
+        keys = self.store.keys()
+        self.assertIn(('image_0', 0), keys)
+        self.assertNotIn(('image_1', 0), keys)
+        _, indices = self.store.search(-self.vectors[:1], k=1)
+        self.assertEqual(self.store.ids()['file_path'].iloc[indices[0, 0]], 'object_0.png')
+
+        self.store.update([], np.zeros((0, 32)), keep_keys={('image_0', 0), ('image_2', 3)})
+        self.assertEqual(self.store.keys(), {('image_0', 0), ('image_2', 3)})
+
+    def test_ivf_index(self):
+        """Probing every list is exact; the index is ignored once the store changes."""
+        self.store.build_index(num_lists=8)
+        queries = self.vectors[10:14]
+        _, exact = self.store.search(queries, k=5)
+        _, approximate = self.store.search_index(queries, k=5, num_probes=8)
+        np.testing.assert_array_equal(approximate, exact)
+
+        self.store.append(self.ids[:1], self.vectors[:1])
+        self.assertFalse(self.store.has_index())
+
+    def test_fingerprint_change_resets(self):
+        """Embeddings from another model are discarded."""
+        self.store.ensure_fingerprint('another model')
+        self.assertEqual(len(EmbeddingStore(self.test_dir)), 0)
+
+    def test_blocks(self):
+        """Blocks cover every stored row once, in order."""
+        blocks = list(self.store.blocks(block_size=128))
+        self.assertEqual([start for start, _ in blocks], [0, 128, 256, 384])
+        np.testing.assert_allclose(np.concatenate([block for _, block in blocks]), self.vectors, atol=1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,11 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import shutil
-from models.identification_model import identify_and_describe_object, process_all_segmented_objects
+import json
+import numpy as np
+import torch
+from models.identification_model import (identify_and_describe_object, process_all_segmented_objects,
+                                         text_embeddings_cache_path, top_k_labels, label_result, load_labels)
 
 class TestIdentification(unittest.TestCase):
     @classmethod
@@ -58,6 +62,75 @@ class TestIdentification(unittest.TestCase):
         except Exception as e:
             self.fail(f"process_all_segmented_objects raised an exception: {e}")
 
+    def test_incremental_keeps_numeric_master_ids(self):
+        """Image names like 0001 stay strings, so they match the manifest and merge with earlier rows."""
+        metadata_path = os.path.join(self.test_dir, 'metadata.csv')
+        descriptions_path = os.path.join(self.test_dir, 'descriptions.csv')
+        descriptions_json_path = os.path.join(self.test_dir, 'descriptions.json')
+        with open(metadata_path, 'w') as f:
+            f.write('master_id,object_id,file_path\n0001,1,0001_1.jpg\n')
+        with open(descriptions_json_path, 'w') as f:
+            json.dump([{'master_id': '0001', 'object_id': 1, 'file_path': '0001_1.jpg', 'description': 'old',
+                        'description_score': 0.5}], f)
+        with open(descriptions_path, 'w') as f:
+            f.write('master_id,object_id,file_path,description,description_score\n0001,1,0001_1.jpg,old,0.5\n')
+        manifest = {'images': {'0001': {'content_hash': 'h', 'stages': {'segmentation': 's'}}}}
+
+        with patch('models.identification_model.metadata_file', metadata_path), \
+                patch('models.identification_model.descriptions_file', descriptions_path), \
+                patch('models.identification_model.descriptions_json_file', descriptions_json_path), \
+                patch('models.identification_model.load_manifest', return_value=manifest), \
+                patch('models.identification_model.save_manifest'), \
+                patch('models.identification_model.store_embeddings', False), \
+                patch('models.identification_model.identify_objects_batch',
+                      return_value=([('car', 0.9)], np.zeros((1, 0)))) as mock_identify:
+            process_all_segmented_objects(use_cache=False, incremental=True)
+
+        mock_identify.assert_called_once()
+        with open(descriptions_json_path) as f:
+            records = json.load(f)
+        self.assertEqual([(record['master_id'], record['description']) for record in records], [('0001', 'car')])
+        self.assertIn('identification', manifest['images']['0001']['stages'])
+
+    def test_text_embeddings_cache_path(self):
+        """The text embeddings cache is keyed by model name and label list."""
+        path = text_embeddings_cache_path(['cat', 'dog'])
+        self.assertEqual(path, text_embeddings_cache_path(['cat', 'dog']))
+        self.assertNotEqual(path, text_embeddings_cache_path(['dog', 'cat']))
+        self.assertNotEqual(path, text_embeddings_cache_path(['cat', 'dog'], model_name='RN50'))
+        self.assertTrue(path.endswith('.pt'))
+
+    def test_prompt_templates_change_cache_path(self):
+        """Prompt templates get their own text embeddings; bare labels keep the old path."""
+        path = text_embeddings_cache_path(['cat', 'dog'])
+        self.assertEqual(path, text_embeddings_cache_path(['cat', 'dog'], templates=['{}']))
+        self.assertNotEqual(path, text_embeddings_cache_path(['cat', 'dog'], templates=['a photo of a {}.']))
+
+    def test_chunked_top_k_matches_full_softmax(self):
+        """Chunked top-k returns the full-vocabulary softmax scores of the best labels."""
+        torch.manual_seed(0)
+        image_features = torch.nn.functional.normalize(torch.randn(4, 16), dim=-1)
+        text_features = torch.nn.functional.normalize(torch.randn(1000, 16), dim=-1)
+        expected_scores, expected_indices = (100.0 * image_features @ text_features.T).softmax(dim=-1).topk(5)
+        scores, indices = top_k_labels(image_features, text_features, k=5, temperature=100.0, chunk_size=128)
+        self.assertTrue(torch.equal(indices, expected_indices))
+        self.assertTrue(torch.allclose(scores, expected_scores, atol=1e-5))
+
+    def test_label_result(self):
+        """One label gives the usual (description, score) pair; more add the top list."""
+        labels = ['cat', 'dog', 'car']
+        self.assertEqual(label_result(labels, [2], [0.9], k=1), ('car', 0.9))
+        self.assertEqual(label_result(labels, [2, 0], [0.6, 0.3], k=2), ('car', 0.6, [['car', 0.6], ['cat', 0.3]]))
+        # A one-label vocabulary still gives the top list when k > 1
+        self.assertEqual(label_result(['car'], [0], [1.0], k=5), ('car', 1.0, [['car', 1.0]]))
+
+    def test_load_labels(self):
+        """Labels files skip blank lines, comments and repeats."""
+        labels_path = os.path.join(self.test_dir, 'labels.txt')
+        with open(labels_path, 'w') as f:
+            f.write('# vocabulary\ncat\n\n dog \ncat\nfire truck\n')
+        self.assertEqual(load_labels(labels_path), ['cat', 'dog', 'fire truck'])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+from utils.manifest import (load_manifest, save_manifest, scan_inputs, plan_stage, record_stage, forget_stage,
+                            merge_records, forget_missing)
+
+class TestManifest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_manifest'
+        cls.test_manifest_file = os.path.join(cls.test_dir, 'manifest.json')
+        if not os.path.exists(cls.test_dir):
+            os.makedirs(cls.test_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def write_image(self, name, content):
+        image_path = os.path.join(self.test_dir, f'{name}.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(content)
+        return image_path, name
+
+    def test_plan_stage(self):
+        """Only new, changed or re-versioned images are planned; missing ones are removed."""
+        manifest = {'images': {}}
+        image_items = [self.write_image('a', b'a'), self.write_image('b', b'b')]
+        inputs = scan_inputs(manifest, image_items)
+        self.assertEqual(plan_stage(manifest, 'ocr', inputs, 'v1'), (['a', 'b'], []))
+
+        for master_id in inputs:
+            record_stage(manifest, 'ocr', master_id, inputs[master_id], 'v1')
+        self.assertEqual(plan_stage(manifest, 'ocr', inputs, 'v1'), ([], []))
+        self.assertEqual(plan_stage(manifest, 'ocr', inputs, 'v2'), (['a', 'b'], []))
+
+        image_items = [self.write_image('a', b'changed')]
+        inputs = scan_inputs(manifest, image_items)
+        self.assertEqual(plan_stage(manifest, 'ocr', inputs, 'v1'), (['a'], ['b']))
+
+    def test_new_content_resets_other_stages(self):
+        """Recording a stage for new content invalidates the image's other stages."""
+        manifest = {'images': {}}
+        record_stage(manifest, 'segmentation', 'a', {'content_hash': 'h1'}, 'v1')
+        record_stage(manifest, 'identification', 'a', {'content_hash': 'h1'}, 'v1')
+        record_stage(manifest, 'segmentation', 'a', {'content_hash': 'h2'}, 'v1')
+        self.assertEqual(manifest['images']['a']['stages'], {'segmentation': 'v1'})
+
+        forget_stage(manifest, 'segmentation', 'a')
+        self.assertNotIn('a', manifest['images'])
+
+    def test_save_and_load(self):
+        """The manifest round-trips through disk."""
+        manifest = {'images': {}}
+        record_stage(manifest, 'ocr', 'a', {'content_hash': 'h1'}, 'v1')
+        save_manifest(manifest, self.test_manifest_file)
+        self.assertEqual(load_manifest(self.test_manifest_file), manifest)
+
+    def test_forget_missing(self):
+        """Images left out of a rewrite lose those stages' records but keep the others."""
+        manifest = {'images': {}}
+        for master_id in ('kept', 'gone'):
+            record_stage(manifest, 'ocr', master_id, {'content_hash': master_id}, 'v1')
+            record_stage(manifest, 'data_mapping', master_id, {'content_hash': master_id}, 'v1')
+        forget_missing(manifest, ['ocr'], {'kept'})
+        self.assertEqual(manifest['images']['kept']['stages'], {'ocr': 'v1', 'data_mapping': 'v1'})
+        self.assertEqual(manifest['images']['gone']['stages'], {'data_mapping': 'v1'})
+        forget_missing(manifest, ['data_mapping'], {'kept'})
+        self.assertNotIn('gone', manifest['images'])
+
+    def test_merge_records(self):
+        """Rows of replaced images are dropped and the new rows appended."""
+        existing = [{'master_id': 'a', 'v': 1}, {'master_id': 'b', 'v': 1}, {'master_id': 'c', 'v': 1}]
+        merged = merge_records(existing, [{'master_id': 'a', 'v': 2}], ['a', 'c'])
+        self.assertEqual(merged, [{'master_id': 'b', 'v': 1}, {'master_id': 'a', 'v': 2}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import json
+import shutil
+from utils import metrics
+
+class TestMetrics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_metrics'
+        if not os.path.exists(cls.test_dir):
+            os.makedirs(cls.test_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def setUp(self):
+        metrics.get_metrics().reset()
+
+    def test_timed_and_instrument(self):
+        """Spans accumulate calls, items and latency buckets per stage."""
+        with metrics.timed('stage.a', items=3):
+            pass
+        with metrics.timed('stage.a') as span:
+            span['items'] = 2
+
+        @metrics.instrument('stage.b')
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        stages = metrics.metrics_report()['stages']
+        self.assertEqual(stages['stage.a']['calls'], 2)
+        self.assertEqual(stages['stage.a']['items'], 5)
+        self.assertEqual(sum(stages['stage.a']['bucket_counts']), 2)
+        self.assertEqual(stages['stage.b']['calls'], 1)
+
+    def test_merge_worker_snapshot(self):
+        """Snapshots shipped back from worker processes are folded into the parent registry."""
+        metrics.observe('ocr.readtext', 0.2)
+        worker_snapshot = metrics.collect_and_reset()
+        metrics.observe('ocr.readtext', 0.4)
+        metrics.get_metrics().merge(worker_snapshot)
+
+        stats = metrics.metrics_report()['stages']['ocr.readtext']
+        self.assertEqual(stats['calls'], 2)
+        self.assertAlmostEqual(stats['wall_seconds'], 0.6)
+        self.assertEqual(stats['p95_seconds'], 0.5)
+        # Stages only carry the process-wide high-water mark, under a name that says so
+        self.assertNotIn('peak_rss_bytes', stats)
+        if stats['process_peak_rss_bytes'] is not None:
+            self.assertLessEqual(stats['process_peak_rss_bytes'], metrics.metrics_report()['peak_rss_bytes'])
+
+    def test_reports(self):
+        """The JSON and Prometheus reports contain every stage."""
+        metrics.observe('segmentation.forward', 0.03, items=4)
+        json_path = os.path.join(self.test_dir, 'metrics.json')
+        prom_path = os.path.join(self.test_dir, 'metrics.prom')
+        metrics.write_metrics_report(json_path, prom_path)
+
+        with open(json_path) as json_file:
+            self.assertIn('segmentation.forward', json.load(json_file)['stages'])
+        with open(prom_path) as prom_file:
+            text = prom_file.read()
+        self.assertIn('pipeline_stage_items_total{stage="segmentation.forward"} 4', text)
+        self.assertIn('pipeline_stage_latency_seconds_bucket{stage="segmentation.forward",le="+Inf"} 1', text)
+        self.assertIn('pipeline_stage_latency_seconds_count{stage="segmentation.forward"} 1', text)
+
+if __name__ == '__main__':
+    unittest.main()
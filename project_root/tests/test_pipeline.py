@@ -0,0 +1,121 @@
+import unittest
+import os
+import json
+import shutil
+from unittest.mock import patch
+import numpy as np
+from models import identification_model
+from models.pipeline import (run_single_image, summarize_objects, StreamingPipeline, parse_stage_workers,
+                             run_streaming_pipeline)
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.objects = [
+            {'object_id': 1, 'bbox': (0, 0, 50, 50), 'crop': np.zeros((50, 50, 3), dtype=np.uint8)},
+            {'object_id': 2, 'bbox': (60, 0, 100, 40), 'crop': np.zeros((40, 40, 3), dtype=np.uint8)},
+        ]
+        self.ocr_results = [([[10, 10], [30, 10], [30, 20], [10, 20]], 'STOP', 0.9)]
+
+    def test_summarize_objects(self):
+        """OCR lines are attached to the object containing them; others get N/A."""
+        text_rows = [{'BBox': [[10.0, 10.0], [30.0, 10.0], [30.0, 20.0], [10.0, 20.0]], 'Text': 'STOP',
+                      'Confidence': 0.9}]
+        summary_df = summarize_objects('image_1', self.objects, text_rows)
+        self.assertEqual(summary_df['object_id'].tolist(), [1, 2])
+        self.assertEqual(summary_df['Text'].tolist(), ['STOP', 'N/A'])
+
+    @patch('models.pipeline.extract_text_from_array')
+    @patch('models.pipeline.identify_crops')
+    @patch('models.pipeline.segment_image')
+    def test_run_single_image(self, mock_segment_image, mock_identify_crops, mock_extract_text):
+        """A single image flows through every stage without touching the shared outputs."""
+        mock_segment_image.return_value = self.objects
+        mock_identify_crops.return_value = [('stop sign', 0.8), ('car', 0.7)]
+        mock_extract_text.return_value = self.ocr_results
+        image = np.zeros((100, 120, 3), dtype=np.uint8)
+
+        result = run_single_image(image, 'image_1')
+
+        self.assertEqual([obj['description'] for obj in result['objects']], ['stop sign', 'car'])
+        self.assertEqual(len(result['summary']), 2)
+        self.assertEqual(result['annotated_image'].shape, image.shape)
+        self.assertFalse((image != 0).any())  # The input image is left untouched
+        self.assertIn('segmentation', result['timings'])
+
+    def test_streaming_pipeline(self):
+        """Items flow through concurrent stages; dropped and failed items do not reach the output."""
+        def double(x):
+            return x * 2
+
+        def drop_multiples_of_four(x):
+            if x == 6:
+                raise ValueError('boom')
+            return None if x % 4 == 0 else x
+
+        pipeline = StreamingPipeline([
+            ('double', double, 3),
+            ('filter', drop_multiples_of_four, 2),
+        ], queue_size=2)
+
+        results = sorted(pipeline.run(range(10)))
+
+        self.assertEqual(results, [2, 10, 14, 18])
+        self.assertEqual(pipeline.stats['double']['items'], 10)
+        self.assertEqual(pipeline.stats['filter']['errors'], 1)
+
+    def test_streaming_run_writes_json_and_manifest(self):
+        """A streaming run leaves JSON copies and manifest records that incremental stage runs can merge into."""
+        test_dir = 'data/test_streaming'
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir)
+        image_items = []
+        for master_id in ('0001', '0002'):
+            image_path = os.path.join(test_dir, f"{master_id}.jpg")
+            with open(image_path, 'wb') as image_file:
+                image_file.write(master_id.encode())
+            image_items.append((image_path, master_id))
+        # An image deleted since an earlier run
+        manifest = {'images': {'deleted': {'content_hash': 'x', 'stages': {'ocr': 'v0'}}}}
+        saved = {}
+        paths = {name: os.path.join(test_dir, f"{name}.{extension}")
+                 for name in ('metadata', 'descriptions', 'text', 'summaries') for extension in ('csv', 'json')}
+        objects = [{'object_id': 1, 'bbox': (0, 0, 50, 50), 'label': 3, 'score': 0.9,
+                    'crop': np.zeros((50, 50, 3), dtype=np.uint8), 'mask': np.ones((50, 50), dtype=bool)}]
+
+        with patch('models.pipeline.load_manifest', return_value=manifest), \
+                patch('models.pipeline.save_manifest', side_effect=lambda m: saved.update(m)), \
+                patch('models.pipeline.metadata_file', paths['metadata.csv']), \
+                patch('models.pipeline.descriptions_file', paths['descriptions.csv']), \
+                patch('models.pipeline.descriptions_json_file', paths['descriptions.json']), \
+                patch('models.pipeline.text_extraction_results_file_csv', paths['text.csv']), \
+                patch('models.pipeline.text_extraction_results_file_json', paths['text.json']), \
+                patch('models.pipeline.summary_results_file', paths['summaries.csv']), \
+                patch('models.pipeline.summary_results_json_file', paths['summaries.json']), \
+                patch('models.pipeline.segmented_objects_dir', test_dir), \
+                patch('models.pipeline.load_image', return_value=np.zeros((100, 120, 3), dtype=np.uint8)), \
+                patch('models.pipeline.segment_image', side_effect=lambda image: [dict(obj) for obj in objects]), \
+                patch('models.pipeline.save_object_crop', side_effect=lambda crop, mask, path: path), \
+                patch('models.pipeline.identify_crops', side_effect=lambda crops: [('stop sign', 0.8)] * len(crops)), \
+                patch('models.pipeline.extract_text_from_array', return_value=self.ocr_results), \
+                patch('models.pipeline.identification_fingerprint', return_value='clip'), \
+                patch('models.pipeline.ocr_fingerprint', return_value='easyocr'), \
+                patch.object(identification_model, 'store_embeddings', False):
+            run_streaming_pipeline(image_items)
+
+        with open(paths['descriptions.json']) as json_file:
+            self.assertEqual(sorted(record['master_id'] for record in json.load(json_file)), ['0001', '0002'])
+        with open(paths['text.json']) as json_file:
+            self.assertEqual([record['Text'] for record in json.load(json_file)], ['STOP', 'STOP'])
+        self.assertTrue(os.path.exists(paths['summaries.json']))
+        self.assertNotIn('deleted', saved['images'])
+        self.assertEqual(set(saved['images']['0002']['stages']),
+                         {'segmentation', 'identification', 'ocr', 'summarization'})
+        self.assertEqual(saved['images']['0002']['stages']['ocr'], 'easyocr')
+
+    def test_parse_stage_workers(self):
+        self.assertEqual(parse_stage_workers(['text_extraction=3']), {'text_extraction': 3})
+        with self.assertRaises(Exception):
+            parse_stage_workers(['unknown=2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from contextlib import nullcontext
+import torch
+from torch import nn
+from utils.precision import resolve_precision, apply_precision, precision_context
+
+class TestPrecision(unittest.TestCase):
+    def test_resolve_precision(self):
+        """INT8 falls back to fp32 off CPU and unknown modes are rejected."""
+        self.assertEqual(resolve_precision('int8', 'cpu'), 'int8')
+        self.assertEqual(resolve_precision('int8', 'cuda'), 'fp32')
+        with self.assertRaises(ValueError):
+            resolve_precision('fp16', 'cpu')
+
+    def test_int8_quantizes_linear_layers(self):
+        """Dynamic INT8 swaps the linear layers and stays close to the fp32 output."""
+        torch.manual_seed(0)
+        model = nn.Sequential(nn.Linear(64, 64), nn.ReLU(), nn.Linear(64, 8)).eval()
+        inputs = torch.randn(16, 64)
+        with torch.no_grad():
+            expected = model(inputs)
+            quantized = apply_precision(model, 'int8', 'cpu')
+            actual = quantized(inputs)
+        self.assertNotIsInstance(quantized[0], nn.Linear)
+        self.assertTrue(torch.allclose(actual, expected, atol=0.05))
+
+    def test_precision_context(self):
+        """bf16 runs the forward pass under autocast; fp32 leaves it untouched."""
+        self.assertIsInstance(precision_context('fp32', 'cpu'), nullcontext)
+        with precision_context('bf16', 'cpu'):
+            output = nn.Linear(4, 4)(torch.randn(2, 4))
+        self.assertEqual(output.dtype, torch.bfloat16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import threading
+from models import registry
+
+class TestRegistry(unittest.TestCase):
+    def test_load_on_first_use(self):
+        """Loaders run only when the model is first requested."""
+        calls = []
+        registry.register_model('test_model', lambda: calls.append(1) or 'instance')
+        self.assertFalse(registry.is_loaded('test_model'))
+
+        self.assertEqual(registry.get_model('test_model'), 'instance')
+        self.assertEqual(registry.get_model('test_model'), 'instance')
+        self.assertTrue(registry.is_loaded('test_model'))
+        self.assertEqual(len(calls), 1)
+
+        registry.unload('test_model')
+        self.assertFalse(registry.is_loaded('test_model'))
+
+    def test_concurrent_first_use(self):
+        """Concurrent first requests share a single load."""
+        calls = []
+        barrier = threading.Barrier(8)
+        registry.register_model('test_concurrent_model', lambda: calls.append(1) or object())
+
+        results = []
+        def request():
+            barrier.wait()
+            results.append(registry.get_model('test_concurrent_model'))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+        registry.unload('test_concurrent_model')
+
+    def test_warm_up(self):
+        """warm_up loads the requested models ahead of time."""
+        registry.register_model('test_warm_model', lambda: 'warm')
+        registry.warm_up(['test_warm_model'])
+        self.assertTrue(registry.is_loaded('test_warm_model'))
+        registry.unload('test_warm_model')
+
+    def test_unknown_model(self):
+        with self.assertRaises(KeyError):
+            registry.get_model('no_such_model')
+
+if __name__ == '__main__':
+    unittest.main()
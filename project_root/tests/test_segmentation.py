@@ -2,7 +2,13 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import shutil
-from models.segmentation_model import extract_and_save_objects, process_all_images
+import torch
+import numpy as np
+import cv2
+from utils.postprocessing import extract_object_crops
+from utils.preprocessing import preprocess_image_array, reduced_decode_factor, load_image
+from models.segmentation_model import (extract_and_save_objects, process_all_images, iter_image_batches,
+                                      delete_stale_crops)
 
 class TestSegmentation(unittest.TestCase):
     @classmethod
@@ -48,5 +54,67 @@ class TestSegmentation(unittest.TestCase):
         except Exception as e:
             self.fail(f"process_all_images raised an exception: {e}")
 
+    @patch('models.segmentation_model.load_image')
+    @patch('models.segmentation_model.preprocess_image_array')
+    def test_iter_image_batches(self, mock_preprocess_image_array, mock_load_image):
+        """Images are grouped by batch size and by the memory cap."""
+        mock_load_image.return_value = np.zeros((8, 8, 3), dtype=np.uint8)
+        mock_preprocess_image_array.return_value = torch.zeros(1, 3, 512, 512)  # 3 MiB per image
+        image_items = [(f'image_{i}.jpg', f'image_{i}') for i in range(5)]
+
+        batches = list(iter_image_batches(image_items, batch_size=2, max_batch_memory_mb=512))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[2][0][1], 'image_4')
+
+        batches = list(iter_image_batches(image_items, batch_size=4, max_batch_memory_mb=5))
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1, 1, 1])
+
+    def test_extract_object_crops(self):
+        """Crops are cut to the mask bounding box, scaled to the original resolution."""
+        masks = np.zeros((2, 1, 100, 100), dtype=np.float32)
+        masks[0, 0, 10:20, 30:50] = 0.9
+        masks[1, 0, 0:50, 0:50] = 0.9
+        scores = np.array([0.8, 0.3])
+        original_image = np.full((200, 400, 3), 255, dtype=np.uint8)
+
+        crops = list(extract_object_crops(masks, scores, original_image, score_threshold=0.5))
+        self.assertEqual(len(crops), 1)
+        self.assertEqual(crops[0]['index'], 0)
+        self.assertEqual(crops[0]['bbox'], (120, 20, 200, 40))
+        self.assertEqual(crops[0]['crop'].shape, (20, 80, 3))
+        self.assertTrue((crops[0]['crop'] == 255).all())
+
+    def test_preprocess_keeps_aspect_ratio(self):
+        """Large images are downscaled without distortion; small ones are left for the model to upscale."""
+        tensor = preprocess_image_array(np.zeros((1000, 3000, 3), dtype=np.uint8), 'cpu')
+        self.assertEqual(tuple(tensor.shape), (1, 3, 444, 1333))
+        tensor = preprocess_image_array(np.zeros((300, 400, 3), dtype=np.uint8), 'cpu')
+        self.assertEqual(tuple(tensor.shape), (1, 3, 300, 400))
+
+    def test_reduced_decode(self):
+        """Large JPEGs are decoded at the smallest reduction that still covers the target size."""
+        image_path = os.path.join(self.test_dir, 'large.jpg')
+        cv2.imwrite(image_path, np.zeros((2400, 3200, 3), dtype=np.uint8))
+        self.assertEqual(reduced_decode_factor(image_path, 800, 1333), 2)
+        self.assertEqual(reduced_decode_factor(image_path, 200, 200), 8)
+        self.assertEqual(load_image(image_path, max_side=1000).shape, (1200, 1600, 3))
+        # By default the longer side is only kept at the Mask R-CNN input limit; 0 decodes at full size
+        self.assertEqual(load_image(image_path).shape, (1200, 1600, 3))
+        self.assertEqual(load_image(image_path, max_side=0).shape, (2400, 3200, 3))
+
+    def test_delete_stale_crops(self):
+        """Crops of re-segmented or removed images are deleted unless still used or shared."""
+        paths = {name: os.path.join(self.test_dir, name) for name in ('a_1.jpg', 'a_2.jpg', 'a_2_mask.png',
+                                                                      'b_1.jpg', 'c_1.jpg')}
+        for path in paths.values():
+            open(path, 'wb').close()
+        old_rows = [{'master_id': 'a', 'file_path': paths['a_1.jpg']}, {'master_id': 'a', 'file_path': paths['a_2.jpg']},
+                    {'master_id': 'b', 'file_path': paths['b_1.jpg']},
+                    # A duplicate pointing at another image's crop
+                    {'master_id': 'd', 'file_path': paths['c_1.jpg']}]
+        new_rows = [{'master_id': 'a', 'file_path': paths['a_1.jpg']}]
+        delete_stale_crops(old_rows, new_rows, ['a', 'b', 'd'])
+        self.assertEqual(sorted(name for name, path in paths.items() if os.path.exists(path)), ['a_1.jpg', 'c_1.jpg'])
+
 if __name__ == '__main__':
     unittest.main()
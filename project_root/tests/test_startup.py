@@ -0,0 +1,56 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+# Importing every model module must stay under this budget and load no weights
+import_time_budget_seconds = 5.0
+
+startup_script = '''
+import json
+import time
+start_time = time.perf_counter()
+import models.segmentation_model
+import models.identification_model
+import models.text_extraction_model
+elapsed = time.perf_counter() - start_time
+from models import registry
+print(json.dumps({'elapsed': elapsed, 'loaded': registry.loaded_models()}))
+'''
+
+utils_import_script = '''
+import os
+import sys
+sys.path.insert(0, sys.argv[1])
+import utils.data_mapping
+import utils.visualization
+print(sorted(os.listdir('.')))
+'''
+
+class TestStartup(unittest.TestCase):
+    def test_import_time_budget(self):
+        """Importing the model modules is fast and does not load any model."""
+        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        output = subprocess.run([sys.executable, '-c', startup_script], cwd=project_root,
+                                capture_output=True, text=True, check=True).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+
+        self.assertEqual(report['loaded'], [])
+        self.assertLess(report['elapsed'], import_time_budget_seconds)
+
+    def test_utils_import_has_no_side_effects(self):
+        """Importing the data mapping and visualization modules reads and writes no files."""
+        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        work_dir = tempfile.mkdtemp()
+        try:
+            output = subprocess.run([sys.executable, '-c', utils_import_script, project_root], cwd=work_dir,
+                                    capture_output=True, text=True, check=True).stdout
+            self.assertEqual(output.strip().splitlines()[-1], '[]')
+        finally:
+            shutil.rmtree(work_dir)
+
+if __name__ == '__main__':
+    unittest.main()
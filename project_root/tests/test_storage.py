@@ -0,0 +1,67 @@
+import unittest
+import os
+import shutil
+import pandas as pd
+from utils.storage import (normalize_bbox, read_table, write_table, save_output, load_output_records,
+                           iter_output_records, jsonl_path)
+
+class TestStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_storage'
+        if not os.path.exists(cls.test_dir):
+            os.makedirs(cls.test_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def test_normalize_bbox(self):
+        """Stringified, nested-list and missing bboxes normalize to float pairs or None."""
+        self.assertEqual(normalize_bbox('[[1, 2], [3, 2], [3, 4], [1, 4]]'),
+                         [[1.0, 2.0], [3.0, 2.0], [3.0, 4.0], [1.0, 4.0]])
+        self.assertEqual(normalize_bbox([[1, 2], [3, 4]]), [[1.0, 2.0], [3.0, 4.0]])
+        self.assertIsNone(normalize_bbox('N/A'))
+        self.assertIsNone(normalize_bbox(float('nan')))
+
+    def test_parquet_round_trip(self):
+        """Parquet output keeps bboxes nested and is preferred once it is the newest output."""
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        csv_path = os.path.join(self.test_dir, 'text_extraction_results.csv')
+        json_path = os.path.join(self.test_dir, 'text_extraction_results.json')
+        records = [
+            {'Image': '1.jpg', 'BBox': [[0, 0], [10, 0], [10, 5], [0, 5]], 'Text': 'hello', 'Confidence': 0.9},
+            {'Image': '2.jpg', 'BBox': 'N/A', 'Text': 'N/A', 'Confidence': 'N/A'},
+        ]
+        save_output(records, csv_path, json_path, 'csv')
+        write_table(pd.DataFrame(records), csv_path, 'parquet')
+        os.utime(csv_path, (0, 0))
+
+        df = read_table(csv_path)
+        self.assertEqual(df['BBox'][0], [[0.0, 0.0], [10.0, 0.0], [10.0, 5.0], [0.0, 5.0]])
+        self.assertIsNone(df['BBox'][1])
+        self.assertTrue(pd.isna(df['Confidence'][1]))
+        self.assertEqual(len(load_output_records(csv_path, json_path)), 2)
+
+    def test_jsonl_streaming(self):
+        """JSON Lines output accepts a generator and is read back one record at a time."""
+        csv_path = os.path.join(self.test_dir, 'descriptions.csv')
+        json_path = os.path.join(self.test_dir, 'descriptions.json')
+        records = ({'master_id': str(i), 'object_id': i, 'description': 'a cat'} for i in range(3))
+        save_output(records, csv_path, json_path, 'jsonl')
+
+        self.assertTrue(os.path.exists(jsonl_path(csv_path)))
+        self.assertFalse(os.path.exists(csv_path))
+        reader = iter_output_records(csv_path, json_path)
+        self.assertEqual(next(reader), {'master_id': '0', 'object_id': 0, 'description': 'a cat'})
+        self.assertEqual(read_table(csv_path)['object_id'].tolist(), [0, 1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -48,6 +48,17 @@ class TestSummarization(unittest.TestCase):
         except Exception as e:
             self.fail(f"load_csv_files raised an exception: {e}")
 
+    def test_load_csv_files_keeps_numeric_master_ids(self):
+        """Image names like 0001 stay strings, so they join with the metadata and match the manifest."""
+        identification_file = 'data/test_identification_ids.csv'
+        self.addCleanup(os.remove, identification_file)
+        with open(identification_file, 'w') as f:
+            f.write('master_id,object_id,file_path,description\n0001,1,0001_1.jpg,car\n')
+        with patch('models.summarization_model.identification_results_file', identification_file), \
+                patch('models.summarization_model.text_extraction_results_file', self.text_extraction_file):
+            identification_df, _ = load_csv_files()
+        self.assertEqual(identification_df['master_id'].tolist(), ['0001'])
+
     @patch('models.summarization_model.preprocess_dataframes')
     def test_preprocess_dataframes(self, mock_preprocess_dataframes):
         """Test the preprocess_dataframes function."""
@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import shutil
-from models.text_extraction_model import extract_text, process_images_and_save_results
+from models.text_extraction_model import extract_text, process_images_and_save_results, iter_ocr_results, merge_regions, extract_text_roi
 
 class TestTextExtraction(unittest.TestCase):
     @classmethod
@@ -51,6 +51,37 @@ class TestTextExtraction(unittest.TestCase):
         except Exception as e:
             self.fail(f"process_images_and_save_results raised an exception: {e}")
 
+    @patch('models.text_extraction_model.extract_text')
+    def test_iter_ocr_results_in_process(self, mock_extract_text):
+        """Results come back in input order and failures are reported per image."""
+        mock_extract_text.side_effect = [[([[0, 0], [1, 0], [1, 1], [0, 1]], 'a', 0.5)], ValueError('bad image')]
+
+        results = list(iter_ocr_results(['a.jpg', 'b.jpg'], num_workers=1))
+
+        self.assertEqual([image_path for image_path, _, _ in results], ['a.jpg', 'b.jpg'])
+        self.assertEqual(results[0][1][0]['Text'], 'a')
+        self.assertIsNone(results[0][2])
+        self.assertIsNone(results[1][1])
+        self.assertEqual(results[1][2], 'bad image')
+
+    def test_merge_regions(self):
+        """Overlapping regions are merged, disjoint ones are kept."""
+        merged = merge_regions([(0, 0, 10, 10), (5, 5, 20, 20), (30, 30, 40, 40)])
+        self.assertEqual(sorted(merged), [(0, 0, 20, 20), (30, 30, 40, 40)])
+
+    @patch('models.text_extraction_model.get_ocr_reader')
+    def test_extract_text_roi_skips_recognition_without_text(self, mock_get_ocr_reader):
+        """Recognition is skipped entirely when the detection pass finds no text."""
+        import numpy as np
+        reader = MagicMock()
+        reader.detect.return_value = ([[]], [[]])
+        mock_get_ocr_reader.return_value = reader
+
+        self.assertEqual(extract_text_roi(np.zeros((200, 200, 3), dtype=np.uint8)), [])
+        reader.detect.assert_called_once()
+        self.assertEqual(reader.detect.call_args[0][0].shape, (100, 100, 3))
+        reader.recognize.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,89 @@
+import unittest
+import os
+import json
+import shutil
+import cv2
+import numpy as np
+from unittest.mock import patch
+from utils.postprocessing import draw_annotations
+from utils.visualization import render_visualizations, entry_annotations
+
+class TestVisualization(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup the test environment and directories."""
+        cls.test_dir = 'data/test_visualization'
+        cls.images_dir = os.path.join(cls.test_dir, 'input_images')
+        cls.output_dir = os.path.join(cls.test_dir, 'output')
+        os.makedirs(cls.images_dir, exist_ok=True)
+        cv2.imwrite(os.path.join(cls.images_dir, 'image_1.jpg'), np.full((200, 400, 3), 255, dtype=np.uint8))
+
+        cls.mapping_file = os.path.join(cls.test_dir, 'data_mapping.json')
+        text_data = {'BBox': '[[10, 10], [60, 10], [60, 30], [10, 30]]', 'Text': 'STOP', 'Confidence': 0.9}
+        entries = [
+            {'master_id': 'image_1', 'object_details': [
+                {'object_id': 1, 'file_path': 'image_1_1.jpg', 'description': 'sign', 'text_data': text_data}]},
+            {'master_id': 'image_2', 'object_details': []},
+        ]
+        with open(cls.mapping_file, 'w') as json_file:
+            json.dump({'images': entries}, json_file)
+
+        # A segmented object with a mask sidecar next to its crop
+        cls.crop_path = os.path.join(cls.test_dir, 'image_1_1.jpg')
+        mask = np.zeros((100, 200), dtype=np.uint8)
+        mask[20:80, 40:160] = 255
+        cv2.imwrite(cls.crop_path, np.zeros((100, 200, 3), dtype=np.uint8))
+        cv2.imwrite(os.path.join(cls.test_dir, 'image_1_1_mask.png'), mask)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the test environment."""
+        if os.path.exists(cls.test_dir):
+            shutil.rmtree(cls.test_dir)
+
+    def test_draw_annotations_with_mask_and_scale(self):
+        """Boxes and mask outlines are drawn at the given scale without touching the input."""
+        image = np.zeros((50, 50, 3), dtype=np.uint8)
+        mask = np.zeros((40, 40), dtype=np.uint8)
+        mask[10:30, 10:30] = 1
+        annotated = draw_annotations(image, [{'bbox': (0, 0, 40, 40), 'mask': mask}], scale=0.5)
+        self.assertFalse((image != 0).any())
+        self.assertTrue((annotated[:20, :20] != 0).any())
+        self.assertFalse((annotated[30:, 30:] != 0).any())
+
+    def test_entry_annotations_use_object_boxes_and_masks(self):
+        """Objects are drawn with their segmentation box, mask outline and OCR text in the label."""
+        text_data = {'BBox': '[[60, 60], [120, 60], [120, 80], [60, 80]]', 'Text': 'STOP', 'Confidence': 0.9}
+        objects = [{'object_id': 1, 'file_path': self.crop_path, 'description': 'sign', 'text_data': text_data}]
+        annotations, text_rows = entry_annotations(objects, 'image_1', {('image_1', 1): (50, 50, 250, 150)})
+        self.assertEqual(len(annotations), 1)
+        self.assertEqual(annotations[0]['bbox'], (50, 50, 250, 150))
+        self.assertEqual(annotations[0]['description'], 'sign (STOP)')
+        self.assertEqual(annotations[0]['mask'].shape, (100, 200))
+        self.assertEqual(text_rows[0]['BBox'][0], [60.0, 60.0])
+
+        annotated = draw_annotations(np.zeros((200, 400, 3), dtype=np.uint8), annotations, text_rows)
+        # The mask outline is green inside the red box
+        self.assertTrue((annotated[70:130, 90:210, 1] == 255).any())
+
+    def test_render_failure_does_not_stop_others(self):
+        """An entry that raises is logged and skipped; the other entries still render."""
+        def render_entry(entry, *args):
+            if entry['master_id'] == 'image_1':
+                raise ValueError("malformed BBox")
+            return False
+        with patch('utils.visualization.render_entry', side_effect=render_entry):
+            missing = render_visualizations(self.mapping_file, self.images_dir, self.output_dir, num_workers=2)
+        self.assertEqual(missing, ['image_2'])
+
+    def test_render_visualizations(self):
+        """Every mapped image is rendered in the pool and missing images are reported."""
+        missing = render_visualizations(self.mapping_file, self.images_dir, self.output_dir, num_workers=2,
+                                        thumbnail_size=100)
+        self.assertEqual(missing, ['image_2'])
+        annotated = cv2.imread(os.path.join(self.output_dir, 'annotated_image_1.jpg'))
+        self.assertEqual(annotated.shape[:2], (50, 100))
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'summary_image_1.csv')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import logging
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+from utils.storage import normalize_bbox
+from utils.metrics import instrument
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Fraction of an OCR box's area that must fall inside an object's box to link them
+association_min_overlap = 0.5
+# Side of the grid cells (in pixels) used to look up candidate objects
+association_cell_size = 64
+
+box_columns = ['x_min', 'y_min', 'x_max', 'y_max']
+association_columns = ['master_id', 'object_id', 'file_path', 'description', 'BBox', 'Text', 'Confidence']
+
+def image_master_ids(image_names):
+    """Vectorized os.path.splitext(name)[0] over a column of OCR image names."""
+    names = image_names.astype(str)
+    stems = names.str.rsplit('.', n=1).str[0]
+    return stems.where(names.str.contains('.', regex=False), names)
+
+def text_box_rect(bbox):
+    """Return the axis-aligned (x_min, y_min, x_max, y_max) of an OCR quadrilateral, or None."""
+    points = normalize_bbox(bbox)
+    if not points:
+        return None
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def overlap_fraction(text_rect, object_rect):
+    """Fraction of the text box's area covered by the object box.
+
+    Degenerate (zero-area) text boxes count as fully covered when their
+    centre lies inside the object box.
+    """
+    tx_min, ty_min, tx_max, ty_max = text_rect
+    ox_min, oy_min, ox_max, oy_max = object_rect
+    area = (tx_max - tx_min) * (ty_max - ty_min)
+    if area <= 0:
+        center_x, center_y = (tx_min + tx_max) / 2, (ty_min + ty_max) / 2
+        return 1.0 if ox_min <= center_x < ox_max and oy_min <= center_y < oy_max else 0.0
+    width = min(tx_max, ox_max) - max(tx_min, ox_min)
+    height = min(ty_max, oy_max) - max(ty_min, oy_min)
+    if width <= 0 or height <= 0:
+        return 0.0
+    return width * height / area
+
+class GridIndex:
+    """Uniform grid over axis-aligned boxes for looking up the boxes a query box may overlap."""
+
+    def __init__(self, rects, cell_size=association_cell_size):
+        self.rects = rects
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        for i, rect in enumerate(rects):
+            if rect is not None:
+                for cell in self._cells(rect):
+                    self.cells[cell].append(i)
+
+    def _cells(self, rect):
+        x_min, y_min, x_max, y_max = rect
+        for cell_x in range(int(x_min // self.cell_size), int(x_max // self.cell_size) + 1):
+            for cell_y in range(int(y_min // self.cell_size), int(y_max // self.cell_size) + 1):
+                yield cell_x, cell_y
+
+    def query(self, rect):
+        """Return the sorted indices of boxes sharing at least one grid cell with rect."""
+        candidates = set()
+        for cell in self._cells(rect):
+            candidates.update(self.cells.get(cell, ()))
+        return sorted(candidates)
+
+def match_text_boxes(object_rects, text_rects, min_overlap=association_min_overlap, cell_size=association_cell_size):
+    """Link the OCR boxes of one image to the object boxes they overlap.
+
+    Returns {object index: [text indices]} with text indices in OCR order.
+    A text box may be linked to several (nested or overlapping) objects.
+    """
+    index = GridIndex(object_rects, cell_size)
+    matches = defaultdict(list)
+    for text_idx, text_rect in enumerate(text_rects):
+        if text_rect is None:
+            continue
+        for object_idx in index.query(text_rect):
+            if overlap_fraction(text_rect, object_rects[object_idx]) >= min_overlap:
+                matches[object_idx].append(text_idx)
+    return matches
+
+@instrument('join.attach_boxes')
+def attach_object_boxes(identification_df, metadata_df):
+    """Add the segmentation box columns from metadata to identification rows, matched on (master_id, object_id)."""
+    boxes = metadata_df[['master_id', 'object_id'] + box_columns].copy()
+    boxes['master_id'] = boxes['master_id'].astype(str)
+    identification_df = identification_df.drop(columns=[c for c in box_columns if c in identification_df.columns])
+    identification_df = identification_df.assign(_key=identification_df['master_id'].astype(str))
+    merged = identification_df.merge(boxes.rename(columns={'master_id': '_key'}), on=['_key', 'object_id'], how='left')
+    return merged.drop(columns='_key')
+
+@instrument('join.associate')
+def associate_text_with_objects(objects_df, text_df, min_overlap=association_min_overlap,
+                                cell_size=association_cell_size):
+    """Return one row per (object, overlapping OCR line), keyed on master_id.
+
+    objects_df needs master_id, object_id, file_path, description and the
+    x_min/y_min/x_max/y_max box columns; text_df needs Image, BBox, Text and
+    Confidence. Objects without overlapping text get a single row with NaN
+    text fields, and OCR lines outside every object are dropped, so the
+    result grows with objects + links instead of objects x lines.
+    """
+    if any(column not in objects_df.columns for column in box_columns):
+        logging.warning("Object boxes are missing; no OCR text can be associated with the objects.")
+        objects_df = objects_df.assign(**{column: np.nan for column in box_columns})
+
+    text_by_master_id = {}
+    if not text_df.empty:
+        text_master_ids = image_master_ids(text_df['Image']).tolist()
+        text_rows = text_df[['BBox', 'Text', 'Confidence']].to_dict(orient='records')
+        for master_id, row in zip(text_master_ids, text_rows):
+            text_by_master_id.setdefault(master_id, []).append(row)
+
+    object_rows = objects_df[['master_id', 'object_id', 'file_path', 'description'] + box_columns].to_dict(orient='records')
+    objects_by_master_id = {}
+    for row in object_rows:
+        objects_by_master_id.setdefault(str(row['master_id']), []).append(row)
+
+    empty_text = {'BBox': np.nan, 'Text': np.nan, 'Confidence': np.nan}
+    associated = []
+    linked = 0
+    for master_id, objects in objects_by_master_id.items():
+        texts = text_by_master_id.get(master_id, [])
+        object_rects = [None if any(pd.isna(obj[c]) for c in box_columns) else tuple(obj[c] for c in box_columns)
+                        for obj in objects]
+        matches = match_text_boxes(object_rects, [text_box_rect(row['BBox']) for row in texts],
+                                   min_overlap, cell_size) if texts else {}
+        for object_idx, obj in enumerate(objects):
+            base_row = {column: obj[column] for column in ('master_id', 'object_id', 'file_path', 'description')}
+            text_indices = matches.get(object_idx, [])
+            linked += len(text_indices)
+            for text_row in [texts[i] for i in text_indices] or [empty_text]:
+                associated.append({**base_row, **text_row})
+
+    logging.info(f"Associated {linked} OCR lines with {len(object_rows)} objects.")
+    return pd.DataFrame(associated, columns=association_columns)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Define cache location and size bound
+cache_db_file = 'data/cache/results.sqlite'
+cache_max_size_mb = 256
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 of a file's bytes without decoding the image."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def bytes_content_hash(data):
+    """Return the SHA-256 of an in-memory buffer (e.g. an uploaded file)."""
+    return hashlib.sha256(data).hexdigest()
+
+def config_fingerprint(*parts):
+    """Return a short, stable hash of the model name and settings a result depends on."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+class ResultCache:
+    """Persistent per-stage result store keyed by content hash and config fingerprint.
+
+    Values are JSON-serialisable stage outputs. The database is kept under
+    max_size_mb by evicting the least recently used entries.
+    """
+
+    def __init__(self, db_path=cache_db_file, max_size_mb=cache_max_size_mb):
+        self.db_path = db_path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' stage TEXT NOT NULL,'
+            ' content_hash TEXT NOT NULL,'
+            ' fingerprint TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_access REAL NOT NULL,'
+            ' PRIMARY KEY (stage, content_hash, fingerprint))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+        self._conn.commit()
+
+    def get(self, stage, content_hash, fingerprint):
+        """Return the cached value, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM results WHERE stage = ? AND content_hash = ? AND fingerprint = ?',
+                (stage, content_hash, fingerprint)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                'UPDATE results SET last_access = ? WHERE stage = ? AND content_hash = ? AND fingerprint = ?',
+                (time.time(), stage, content_hash, fingerprint)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, stage, content_hash, fingerprint, value):
+        """Store a stage result and evict old entries if the cache is over budget."""
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (stage, content_hash, fingerprint, value, size, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (stage, content_hash, fingerprint, payload, len(payload), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def invalidate(self, stage=None):
+        """Drop all cached results, or only those of one stage."""
+        with self._lock:
+            if stage is None:
+                self._conn.execute('DELETE FROM results')
+            else:
+                self._conn.execute('DELETE FROM results WHERE stage = ?', (stage,))
+            self._conn.commit()
+        logging.info(f"Invalidated result cache{'' if stage is None else f' for stage {stage}'}.")
+
+    def total_size(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+
+        evicted = 0
+        rows = self._conn.execute(
+            'SELECT stage, content_hash, fingerprint, size FROM results ORDER BY last_access ASC'
+        ).fetchall()
+        for stage, content_hash, fingerprint, size in rows:
+            if total <= self.max_size_bytes:
+                break
+            self._conn.execute(
+                'DELETE FROM results WHERE stage = ? AND content_hash = ? AND fingerprint = ?',
+                (stage, content_hash, fingerprint)
+            )
+            total -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} least recently used cache entries.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Return the process-wide result cache, opening it on first use."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+def add_cache_arguments(parser):
+    """Add the shared --no-cache / --invalidate-cache flags to a stage CLI."""
+    parser.add_argument('--no-cache', action='store_true', help="Recompute everything and do not touch the cache.")
+    parser.add_argument('--invalidate-cache', action='store_true', help="Drop this stage's cached results first.")
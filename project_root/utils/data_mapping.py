@@ -1,53 +1,38 @@
 import pandas as pd
 import json
 import os
+import sys
+import argparse
 import logging
 
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.manifest import (load_manifest, save_manifest, recorded_inputs, upstream_fingerprint, plan_stage,
+                            record_stage, forget_stage, merge_records)
+from utils import storage
+from utils.storage import read_table, write_table, add_output_format_argument, set_output_format
+from utils.association import attach_object_boxes, associate_text_with_objects
+from utils.metrics import timed, instrument, add_metrics_arguments, write_metrics_report
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 identification_results_file = 'data/descriptions.csv'
+metadata_file = 'data/metadata.csv'
 text_extraction_results_file = 'data/text_extraction_results.csv'
 data_mapping_file = 'data/output/data_mapping.json'
-summary_results_file = 'data/summaries.csv'
-original_images_folder = 'data/input_images/'
-output_dir = 'data/output/table_and_annotated/'
-data_mapping_file = 'data/output/data_mapping.json'
-
-# Check if the data_mapping_file exists before trying to open it
-if not os.path.exists(data_mapping_file):
-    logging.warning(f"Data mapping file not found: {data_mapping_file}. Creating a placeholder.")
-    data_mapping = {"images": []}  # Placeholder data structure
-
-    # Optionally save this placeholder structure if you want to create the file
-    os.makedirs(os.path.dirname(data_mapping_file), exist_ok=True)
-    with open(data_mapping_file, 'w') as json_file:
-        json.dump(data_mapping, json_file, indent=4)
-    logging.info(f"Placeholder data mapping file created at: {data_mapping_file}")
-else:
-    with open(data_mapping_file, 'r') as json_file:
-        data_mapping = json.load(json_file)['images']
-
-os.makedirs(output_dir, exist_ok=True)
-
-# Check if the data_mapping_file exists before trying to open it
-if not os.path.exists(data_mapping_file):
-    raise FileNotFoundError(f"Data mapping file not found: {data_mapping_file}")
-
-# Load data
-with open(data_mapping_file, 'r') as json_file:
-    data_mapping = json.load(json_file)['images']
 
 def load_and_prepare_data():
     try:
-        identification_df = pd.read_csv(identification_results_file)
-        text_extraction_df = pd.read_csv(text_extraction_results_file)
+        identification_df = read_table(identification_results_file, dtype={'master_id': str})
+        text_extraction_df = read_table(text_extraction_results_file)
+        metadata_df = read_table(metadata_file, dtype={'master_id': str})
 
-        # Extract base filenames from the file paths for matching
-        identification_df['Base_Image'] = identification_df['file_path'].apply(lambda x: os.path.basename(x).split('_')[0])
-        text_extraction_df['Base_Image'] = text_extraction_df['Image'].apply(lambda x: x.split('_')[0])
+        # Attach each object's segmentation box so OCR lines can be matched to it
+        identification_df = attach_object_boxes(identification_df, metadata_df)
 
-        logging.info("Data loaded and base filenames extracted.")
+        logging.info("Data loaded and object boxes attached.")
         return identification_df, text_extraction_df
     except Exception as e:
         logging.error(f"Error loading CSV files: {e}")
@@ -55,64 +40,191 @@ def load_and_prepare_data():
 
 def merge_data(identification_df, text_extraction_df):
     try:
-        # Merge on base image names
-        merged_df = pd.merge(identification_df, text_extraction_df, on='Base_Image', how='left')
-
-        # Check merged DataFrame
-        logging.info("Merged DataFrame with base image names:")
-        logging.info(merged_df.head(10))
-        
+        # Link each OCR line to the objects of the same image that it overlaps
+        merged_df = associate_text_with_objects(identification_df, text_extraction_df)
+        logging.info(f"Merged {len(identification_df)} objects and {len(text_extraction_df)} OCR lines "
+                     f"into {len(merged_df)} rows.")
         return merged_df
     except Exception as e:
         logging.error(f"Error merging DataFrames: {e}")
         raise
 
-def create_data_mapping(merged_df):
-    try:
-        data_mapping = []
-        for master_id, group in merged_df.groupby('master_id'):
-            object_details = []
-            for _, row in group.iterrows():
-                item = {
-                    'object_id': row['object_id'],
-                    'file_path': row['file_path'],
-                    'description': row['description'],
-                    'text_data': {
-                        'BBox': row.get('BBox', 'N/A'),  # Use 'N/A' for missing values
-                        'Text': row.get('Text', 'N/A'),
-                        'Confidence': row.get('Confidence', 'N/A')
-                    }
+def iter_data_mapping(merged_df):
+    """Yield one mapping entry per master_id, in sorted master_id order.
+
+    Columns are converted to Python lists once and entries are built by
+    slicing them at group boundaries instead of iterating rows.
+    """
+    merged_df = merged_df[merged_df['master_id'].notna()]
+    if merged_df.empty:
+        return
+    merged_df = merged_df.sort_values('master_id', kind='stable')
+
+    master_ids = merged_df['master_id'].tolist()
+    object_ids = merged_df['object_id'].tolist()
+    file_paths = merged_df['file_path'].tolist()
+    descriptions = merged_df['description'].tolist()
+    # Use 'N/A' for missing values
+    text_columns = [merged_df[column].tolist() if column in merged_df.columns else ['N/A'] * len(merged_df)
+                    for column in ('BBox', 'Text', 'Confidence')]
+    text_data = [{'BBox': bbox, 'Text': text, 'Confidence': confidence}
+                 for bbox, text, confidence in zip(*text_columns)]
+
+    start = 0
+    for end in range(1, len(master_ids) + 1):
+        if end < len(master_ids) and master_ids[end] == master_ids[start]:
+            continue
+        yield {
+            'master_id': master_ids[start],
+            'object_details': [
+                {
+                    'object_id': object_ids[i],
+                    'file_path': file_paths[i],
+                    'description': descriptions[i],
+                    'text_data': text_data[i]
                 }
-                object_details.append(item)
-            
-            data_mapping.append({
-                'master_id': master_id,
-                'object_details': object_details
-            })
+                for i in range(start, end)
+            ]
+        }
+        start = end
 
+def create_data_mapping(merged_df):
+    try:
+        data_mapping = list(iter_data_mapping(merged_df))
         logging.info("Data mapping structure prepared.")
         return data_mapping
     except Exception as e:
         logging.error(f"Error creating data mapping: {e}")
         raise
 
+def write_data_mapping_json(entries, path=data_mapping_file):
+    """Stream entries into {"images": [...]}, byte-identical to json.dump(..., indent=4)."""
+    with timed('storage.write') as span, open(path, 'w') as json_file:
+        json_file.write('{\n    "images": [')
+        count = 0
+        for entry in entries:
+            json_file.write(',\n' if count else '\n')
+            json_file.write('        ' + json.dumps(entry, indent=4).replace('\n', '\n        '))
+            count += 1
+        json_file.write('\n    ]\n}' if count else ']\n}')
+        span['items'] = count
+    return count
+
+def flatten_data_mapping(data_mapping):
+    """Flatten the nested mapping into one row per object for columnar storage."""
+    rows = []
+    for entry in data_mapping:
+        for obj in entry['object_details']:
+            rows.append({
+                'master_id': entry['master_id'],
+                'object_id': obj['object_id'],
+                'file_path': obj['file_path'],
+                'description': obj['description'],
+                **obj['text_data']
+            })
+    return pd.DataFrame(rows, columns=['master_id', 'object_id', 'file_path', 'description', 'BBox', 'Text',
+                                       'Confidence'])
+
+def nest_data_mapping(flat_df):
+    """Rebuild the nested per-image mapping from its flattened rows, keeping row order."""
+    entries = {}
+    for row in flat_df.to_dict(orient='records'):
+        entries.setdefault(row['master_id'], []).append({
+            'object_id': row['object_id'],
+            'file_path': row['file_path'],
+            'description': row['description'],
+            'text_data': {
+                'BBox': row['BBox'] if row['BBox'] is not None else 'N/A',
+                'Text': row['Text'] if row['Text'] is not None else 'N/A',
+                'Confidence': row['Confidence'] if pd.notna(row['Confidence']) else 'N/A'
+            }
+        })
+    return [{'master_id': master_id, 'object_details': objects} for master_id, objects in entries.items()]
+
+def iter_data_mapping_entries(path=data_mapping_file):
+    """Yield the per-image entries from the JSON document, Parquet table or JSON Lines file, whichever is newer.
+
+    JSON Lines files are read one entry at a time; the other formats are
+    loaded whole.
+    """
+    fmt = storage.newest_output_format(path)
+    if fmt == 'jsonl':
+        yield from storage.iter_jsonl(storage.jsonl_path(path))
+    elif fmt == 'parquet':
+        yield from nest_data_mapping(read_table(path))
+    else:
+        with open(path, 'r') as json_file:
+            yield from json.load(json_file)['images']
+
+def load_data_mapping(path=data_mapping_file):
+    """Load the per-image mapping from whichever of its outputs is newest."""
+    return list(iter_data_mapping_entries(path))
+
 def save_data_mapping(data_mapping):
+    """Save mapping entries (a list or any iterable) in the selected output format."""
     try:
+        os.makedirs(os.path.dirname(data_mapping_file), exist_ok=True)
+        if storage.output_format == 'jsonl':
+            # Stream one image entry per line
+            path = storage.jsonl_path(data_mapping_file)
+            count = storage.write_jsonl(data_mapping, path)
+            logging.info(f"Saved data mapping for {count} images to {path}")
+            return
+
+        if storage.output_format == 'parquet':
+            # Save data mapping as one typed row per object
+            path = write_table(flatten_data_mapping(data_mapping), data_mapping_file, 'parquet')
+            logging.info(f"Saved data mapping to {path}")
+            return
+
         # Save data mapping to JSON
-        with open(data_mapping_file, 'w') as json_file:
-            json.dump({"images": data_mapping}, json_file, indent=4)
+        write_data_mapping_json(data_mapping)
         logging.info(f"Saved data mapping to {data_mapping_file}")
     except Exception as e:
         logging.error(f"Error saving data mapping: {e}")
         raise
 
-if __name__ == '__main__':
+@instrument('data_mapping')
+def build_data_mapping(incremental=False):
     identification_df, text_extraction_df = load_and_prepare_data()
 
+    if incremental:
+        # Only rebuild the entries of images whose identification or OCR results changed
+        manifest = load_manifest()
+        upstream_stages = ['identification', 'ocr']
+        inputs = recorded_inputs(manifest, upstream_stages)
+
+        def stage_fingerprint(master_id):
+            return upstream_fingerprint(manifest, master_id, upstream_stages)
+
+        changed, removed = plan_stage(manifest, 'data_mapping', inputs, stage_fingerprint)
+        identification_df = identification_df[identification_df['master_id'].astype(str).isin(changed)]
+
     merged_df = merge_data(identification_df, text_extraction_df)
 
-    data_mapping = create_data_mapping(merged_df)
+    # Entries are generated lazily so the JSON and JSON Lines writers stream them
+    data_mapping = iter_data_mapping(merged_df)
 
-    save_data_mapping(data_mapping)
+    if incremental:
+        existing_mapping = []
+        if storage.output_exists(data_mapping_file):
+            existing_mapping = load_data_mapping()
+        data_mapping = merge_records(existing_mapping, list(data_mapping), changed + removed)
+        for master_id in changed:
+            record_stage(manifest, 'data_mapping', master_id, inputs[master_id], stage_fingerprint(master_id))
+        for master_id in removed:
+            forget_stage(manifest, 'data_mapping', master_id)
+        save_manifest(manifest)
 
+    save_data_mapping(data_mapping)
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Map identification and text extraction results per image.")
+    parser.add_argument('--incremental', action='store_true', help="Only process new or changed images.")
+    add_output_format_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    set_output_format(args.output_format)
+    build_data_mapping(incremental=args.incremental)
+    write_metrics_report(args.metrics_json, args.metrics_prom)
@@ -0,0 +1,180 @@
+import logging
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from utils import preprocessing
+from utils.preprocessing import reduced_decode_factor
+from utils.storage import write_table, normalize_bbox
+from utils.cache import config_fingerprint
+from utils.metrics import timed, observe
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Off by default: duplicates get the rows of the image they copy, scaled to their own size
+dedup_images = False
+# Largest Hamming distance between 64-bit perceptual hashes that still counts as the same picture
+dedup_max_distance = 6
+# Side of the grayscale thumbnail the DCT runs on; the hash keeps its top-left 8x8 frequencies
+phash_image_size = 32
+duplicates_file = 'data/duplicates.csv'
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix, so the 2D transform is two matrix products."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_dct = _dct_matrix(phash_image_size)
+
+def perceptual_hash(image_path):
+    """Return the 64-bit DCT perceptual hash of an image as an int.
+
+    JPEGs are decoded at the smallest scale that still covers the thumbnail,
+    so hashing costs a fraction of a full decode.
+    """
+    with Image.open(image_path) as image:
+        image.draft('L', (phash_image_size * 2, phash_image_size * 2))
+        thumbnail = image.convert('L').resize((phash_image_size, phash_image_size), Image.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.float64)
+    frequencies = (_dct @ pixels @ _dct.T)[:8, :8].flatten()
+    # The DC term only reflects overall brightness, so it is left out of the median
+    bits = frequencies > np.median(frequencies[1:])
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over perceptual hashes for Hamming-distance range queries.
+
+    A query only descends into children whose edge distance is within
+    max_distance of the query's distance to the node, so it visits a small
+    part of the tree instead of comparing against every hash.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, hash_value, item):
+        if self.root is None:
+            self.root = (hash_value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance not in node[2]:
+                node[2][distance] = (hash_value, item, {})
+                return
+            node = node[2][distance]
+
+    def search(self, hash_value, max_distance):
+        """Return (distance, item) pairs within max_distance of hash_value, closest first."""
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_hash, item, children = nodes.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            nodes.extend(child for edge, child in children.items() if abs(edge - distance) <= max_distance)
+        return sorted(matches, key=lambda match: match[0])
+
+def decoded_size(image_path):
+    """Return the (width, height) load_image decodes an image at, reading only the header."""
+    with Image.open(image_path) as image:
+        width, height = image.size
+    max_side = preprocessing.decode_max_side
+    factor = reduced_decode_factor(image_path, max_side, max_side) if max_side else 1
+    return -(-width // factor), -(-height // factor)
+
+def find_duplicates(image_items, max_distance=None):
+    """Group (image_path, master_id) pairs into near-duplicates.
+
+    Returns {master_id: (duplicate_of, distance)} for every image within
+    max_distance of an earlier image; the first image of each group is the one
+    that gets processed. Unreadable images are never treated as duplicates.
+    """
+    max_distance = dedup_max_distance if max_distance is None else max_distance
+    tree = BKTree()
+    duplicates = {}
+    with timed('dedup.hash', items=len(image_items)):
+        for image_path, master_id in image_items:
+            try:
+                hash_value = perceptual_hash(image_path)
+            except OSError as e:
+                logging.warning(f"Could not hash {image_path}: {e}")
+                continue
+            matches = tree.search(hash_value, max_distance)
+            if matches:
+                distance, duplicate_of = matches[0]
+                duplicates[master_id] = (duplicate_of, distance)
+            else:
+                tree.add(hash_value, master_id)
+    return duplicates
+
+def scale_factors(image_path, duplicate_of_path):
+    """Return the (x, y) factors mapping the pixel coordinates of the original onto its duplicate."""
+    width, height = decoded_size(image_path)
+    original_width, original_height = decoded_size(duplicate_of_path)
+    return width / original_width, height / original_height
+
+def reuse_object_rows(rows, master_id, factors):
+    """Copy segmentation rows to a duplicate: its own master_id, the boxes scaled, the crops shared."""
+    scale_x, scale_y = factors
+    reused = []
+    for row in rows:
+        row = dict(row, master_id=master_id)
+        for key, scale in (('x_min', scale_x), ('x_max', scale_x), ('y_min', scale_y), ('y_max', scale_y)):
+            row[key] = int(round(float(row[key]) * scale))
+        reused.append(row)
+    return reused
+
+def reuse_text_rows(rows, factors):
+    """Copy OCR rows to a duplicate with their box corners scaled."""
+    scale_x, scale_y = factors
+    reused = []
+    for row in rows:
+        bbox = normalize_bbox(row.get('BBox'))
+        reused.append(dict(row, BBox=[[x * scale_x, y * scale_y] for x, y in bbox] if bbox else row.get('BBox')))
+    return reused
+
+def duplicate_fingerprint(fingerprint, master_id, duplicates, inputs):
+    """Return the manifest fingerprint of an image, tied to its original when its rows are copied.
+
+    A duplicate is re-planned when its original changes content, disappears or
+    is no longer its original, and when deduplication is switched on or off;
+    images that are processed themselves keep the stage fingerprint.
+    """
+    if master_id not in duplicates:
+        return fingerprint
+    duplicate_of, _ = duplicates[master_id]
+    return config_fingerprint(fingerprint, 'duplicate_of', duplicate_of, inputs[duplicate_of]['content_hash'])
+
+def log_dedup_stats(stage, total, duplicates):
+    """Log how much of a stage's work deduplication skipped and return the numbers."""
+    stats = {'images': total, 'duplicates': len(duplicates), 'processed': total - len(duplicates),
+             'skipped_fraction': len(duplicates) / total if total else 0.0}
+    logging.info(f"{stage} dedup: {stats['duplicates']} of {total} images are near-duplicates; "
+                 f"skipped {stats['skipped_fraction']:.1%} of the work.")
+    # Shows up in the metrics report as e.g. segmentation.dedup_skipped with one item per skipped image
+    observe(f"{stage}.dedup_skipped", 0.0, items=len(duplicates))
+    return stats
+
+def save_duplicates(duplicates):
+    """Record which image each duplicate reused its results from."""
+    rows = [{'master_id': master_id, 'duplicate_of': duplicate_of, 'distance': distance}
+            for master_id, (duplicate_of, distance) in duplicates.items()]
+    write_table(pd.DataFrame(rows, columns=['master_id', 'duplicate_of', 'distance']), duplicates_file, fmt='csv')
+
+def add_dedup_arguments(parser):
+    """Add the shared --dedup flags to a stage CLI."""
+    # None when the flag is absent, so the stage falls back to dedup_images
+    parser.add_argument('--dedup', action='store_true', default=None,
+                        help="Reuse the results of an earlier near-duplicate image instead of processing the image "
+                             "(default: dedup_images).")
+    parser.add_argument('--dedup-max-distance', type=int, default=dedup_max_distance,
+                        help="Largest perceptual hash Hamming distance (of 64 bits) treated as a duplicate.")
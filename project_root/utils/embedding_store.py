@@ -0,0 +1,250 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Store location; embeddings.f16 is a raw row-major float16 matrix described by meta.json
+embedding_store_dir = 'data/embeddings'
+id_columns = ['master_id', 'object_id', 'file_path']
+
+# Rows scored per matrix multiply when scanning the whole store
+search_block_size = 65536
+# Approximate (IVF) index settings; num_lists None picks about 4 * sqrt(rows)
+ivf_num_lists = None
+ivf_num_probes = 16
+ivf_train_size = 100000
+ivf_iterations = 10
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k(scores, k):
+    """Return (scores, indices) of the k largest entries of each row, best first."""
+    k = min(k, scores.shape[-1])
+    if k == 0:
+        return scores[..., :0], np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    indices = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    top_scores = np.take_along_axis(scores, indices, axis=-1)
+    order = np.argsort(-top_scores, axis=-1, kind='stable')
+    return np.take_along_axis(top_scores, order, axis=-1), np.take_along_axis(indices, order, axis=-1)
+
+def spherical_kmeans(vectors, num_lists, iterations=ivf_iterations, seed=0):
+    """Cluster unit vectors by cosine similarity and return the normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=num_lists)
+        # Empty lists keep their previous centroid
+        centroids[counts > 0] = normalize_rows(sums[counts > 0])
+    return centroids
+
+class EmbeddingStore:
+    """Append-only, memory-mapped float16 matrix of normalized CLIP image embeddings.
+
+    Row i of the matrix belongs to row i of the id table (master_id,
+    object_id, file_path). meta.json records the row count, dimension and
+    the fingerprint of the model that produced the embeddings.
+    """
+
+    def __init__(self, path=embedding_store_dir):
+        self.path = path
+        self.meta = {'count': 0, 'dim': None, 'fingerprint': None, 'ids_bytes': 0}
+        if os.path.exists(self._file('meta.json')):
+            with open(self._file('meta.json')) as meta_file:
+                self.meta = json.load(meta_file)
+        self._ids = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def __len__(self):
+        return self.meta['count']
+
+    def _save_meta(self):
+        with open(self._file('meta.json.tmp'), 'w') as meta_file:
+            json.dump(self.meta, meta_file, indent=4)
+        os.replace(self._file('meta.json.tmp'), self._file('meta.json'))
+
+    def reset(self, fingerprint=None):
+        """Drop every embedding and the index, e.g. after the model changed."""
+        for name in ('embeddings.f16', 'ids.csv', 'ivf.npz'):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self.meta = {'count': 0, 'dim': None, 'fingerprint': fingerprint, 'ids_bytes': 0}
+        self._ids = None
+        os.makedirs(self.path, exist_ok=True)
+        self._save_meta()
+
+    def ensure_fingerprint(self, fingerprint):
+        """Reset the store if its embeddings were made by a different model or precision."""
+        if self.meta['fingerprint'] != fingerprint:
+            if len(self):
+                logging.warning(f"Embedding store {self.path} was built with another model; starting over.")
+            self.reset(fingerprint)
+
+    def embeddings(self):
+        """Return the (count, dim) float16 matrix as a read-only memory map."""
+        if not len(self):
+            return np.zeros((0, self.meta['dim'] or 0), dtype=np.float16)
+        return np.memmap(self._file('embeddings.f16'), dtype=np.float16, mode='r', shape=(len(self), self.meta['dim']))
+
+    def ids(self):
+        """Return the id table, one row per embedding."""
+        if self._ids is None:
+            if len(self):
+                self._ids = pd.read_csv(self._file('ids.csv'), dtype={'master_id': str}, nrows=len(self))
+            else:
+                self._ids = pd.DataFrame(columns=id_columns)
+        return self._ids
+
+    def keys(self):
+        ids = self.ids()
+        return set(zip(ids['master_id'], ids['object_id'].astype(int)))
+
+    def append(self, ids, embeddings):
+        """Append id records and their embeddings; the embeddings are normalized and stored as float16."""
+        embeddings = normalize_rows(embeddings)
+        if not len(embeddings):
+            return
+        if self.meta['dim'] is None:
+            self.meta['dim'] = int(embeddings.shape[1])
+        os.makedirs(self.path, exist_ok=True)
+
+        # Cut off anything a crashed append wrote after the last committed row; meta.json is the commit point
+        with open(self._file('embeddings.f16'), 'ab') as matrix_file:
+            matrix_file.truncate(len(self) * self.meta['dim'] * 2)
+            matrix_file.write(embeddings.astype(np.float16).tobytes())
+        with open(self._file('ids.csv'), 'a', newline='') as ids_file:
+            ids_file.truncate(self.meta['ids_bytes'])
+            pd.DataFrame(ids, columns=id_columns).to_csv(ids_file, header=not self.meta['ids_bytes'], index=False)
+
+        self.meta['count'] += len(embeddings)
+        self.meta['ids_bytes'] = os.path.getsize(self._file('ids.csv'))
+        self._ids = None
+        self._drop_index()
+        self._save_meta()
+
+    def remove(self, keep_mask):
+        """Keep only the rows where keep_mask is True, compacting the matrix block by block."""
+        keep_mask = np.asarray(keep_mask, dtype=bool)
+        if keep_mask.all():
+            return
+        matrix = self.embeddings()
+        with open(self._file('embeddings.f16.tmp'), 'wb') as matrix_file:
+            for start in range(0, len(self), search_block_size):
+                block_mask = keep_mask[start:start + search_block_size]
+                matrix_file.write(np.ascontiguousarray(matrix[start:start + search_block_size][block_mask]).tobytes())
+        del matrix
+        os.replace(self._file('embeddings.f16.tmp'), self._file('embeddings.f16'))
+        self.ids()[keep_mask].to_csv(self._file('ids.csv'), index=False)
+        self.meta['count'] = int(keep_mask.sum())
+        self.meta['ids_bytes'] = os.path.getsize(self._file('ids.csv'))
+        self._ids = None
+        self._drop_index()
+        self._save_meta()
+
+    def update(self, ids, embeddings, drop_master_ids=(), keep_keys=None):
+        """Replace the rows of re-encoded objects and forget stale ones, then append.
+
+        Rows whose (master_id, object_id) appears in ids are replaced, rows of
+        drop_master_ids are removed and, when keep_keys is given, so is every
+        row whose (master_id, object_id) is not in it.
+        """
+        if len(self):
+            existing = self.ids()
+            keys = pd.MultiIndex.from_arrays([existing['master_id'], existing['object_id'].astype(int)])
+            keep_mask = ~existing['master_id'].isin(set(drop_master_ids)).to_numpy()
+            replaced = [(str(row['master_id']), int(row['object_id'])) for row in ids]
+            if replaced:
+                keep_mask &= ~keys.isin(replaced)
+            if keep_keys is not None:
+                keep_mask &= keys.isin(list(keep_keys))
+            self.remove(keep_mask)
+        self.append(ids, embeddings)
+
+    def search(self, queries, k=10, block_size=search_block_size):
+        """Exact cosine search: return (scores, row indices) of the k best rows per query.
+
+        The memory-mapped matrix is scored in blocks, so memory stays bounded
+        by block_size rows regardless of the store size.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        matrix = self.embeddings()
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(matrix), block_size):
+            block_scores = queries @ np.asarray(matrix[start:start + block_size], dtype=np.float32).T
+            block_indices = np.broadcast_to(np.arange(start, start + block_scores.shape[1]), block_scores.shape)
+            candidates = np.concatenate([best_scores, block_scores], axis=1)
+            candidate_indices = np.concatenate([best_indices, block_indices], axis=1)
+            best_scores, positions = top_k(candidates, k)
+            best_indices = np.take_along_axis(candidate_indices, positions, axis=1)
+        return best_scores, best_indices
+
+    def _drop_index(self):
+        if os.path.exists(self._file('ivf.npz')):
+            os.remove(self._file('ivf.npz'))
+
+    def has_index(self):
+        return os.path.exists(self._file('ivf.npz'))
+
+    def build_index(self, num_lists=None, train_size=ivf_train_size, iterations=ivf_iterations, seed=0):
+        """Build the approximate IVF index: k-means lists over a sample, then every row assigned to its list."""
+        matrix = self.embeddings()
+        if not len(matrix):
+            raise ValueError("Cannot index an empty embedding store")
+        num_lists = num_lists or ivf_num_lists or int(4 * np.sqrt(len(matrix)))
+        num_lists = max(1, min(num_lists, len(matrix)))
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(matrix), size=min(train_size, len(matrix)), replace=False))
+        centroids = spherical_kmeans(np.asarray(matrix[sample], dtype=np.float32), num_lists, iterations, seed)
+
+        assignments = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), search_block_size):
+            block = np.asarray(matrix[start:start + search_block_size], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        # Rows grouped by list; list j holds order[offsets[j]:offsets[j + 1]]
+        order = np.argsort(assignments, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assignments[order], np.arange(num_lists + 1))
+        np.savez(self._file('ivf.npz'), centroids=centroids, order=order, offsets=offsets, count=len(matrix))
+        logging.info(f"Built IVF index with {num_lists} lists over {len(matrix)} embeddings.")
+
+    def search_index(self, queries, k=10, num_probes=ivf_num_probes):
+        """Approximate cosine search that only scores the rows of the num_probes closest IVF lists."""
+        index = np.load(self._file('ivf.npz'))
+        if int(index['count']) != len(self):
+            logging.warning("IVF index is out of date; falling back to exact search.")
+            return self.search(queries, k)
+        centroids, order, offsets = index['centroids'], index['order'], index['offsets']
+        queries = normalize_rows(np.atleast_2d(queries))
+        matrix = self.embeddings()
+
+        _, probes = top_k(queries @ centroids.T, num_probes)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, query_probes) in enumerate(zip(queries, probes)):
+            candidates = np.sort(np.concatenate([order[offsets[j]:offsets[j + 1]] for j in query_probes]))
+            scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+            top_scores, positions = top_k(scores, k)
+            all_scores[i, :len(positions)] = top_scores
+            all_indices[i, :len(positions)] = candidates[positions]
+        return all_scores, all_indices
+
+    def blocks(self, block_size=search_block_size):
+        """Yield (start row, float32 block) over the stored embeddings in order."""
+        matrix = self.embeddings()
+        for start in range(0, len(matrix), block_size):
+            yield start, np.asarray(matrix[start:start + block_size], dtype=np.float32)
+
+def get_embedding_store(path=None):
+    return EmbeddingStore(path or embedding_store_dir)
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import logging
+
+from utils.cache import file_content_hash, config_fingerprint
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Define file paths
+manifest_file = 'data/manifest.json'
+
+def load_manifest(path=manifest_file):
+    """Load the manifest of processed inputs, or an empty one if none exists yet."""
+    if not os.path.exists(path):
+        return {'images': {}}
+    with open(path, 'r') as json_file:
+        return json.load(json_file)
+
+def save_manifest(manifest, path=manifest_file):
+    """Write the manifest atomically so an interrupted run never leaves it half written."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as json_file:
+        json.dump(manifest, json_file, indent=4)
+    os.replace(tmp_path, path)
+
+def scan_inputs(manifest, image_items):
+    """Return {master_id: input info} for (image_path, master_id) pairs.
+
+    Files whose size and modification time match the manifest reuse the
+    recorded content hash instead of being re-read.
+    """
+    inputs = {}
+    for image_path, master_id in image_items:
+        stat = os.stat(image_path)
+        entry = manifest['images'].get(master_id)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            content_hash = entry['content_hash']
+        else:
+            content_hash = file_content_hash(image_path)
+        inputs[master_id] = {
+            'file_name': os.path.basename(image_path),
+            'content_hash': content_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+    return inputs
+
+def recorded_inputs(manifest, stages):
+    """Return input info for every image that has at least one of the given stages recorded."""
+    return {
+        master_id: entry
+        for master_id, entry in manifest['images'].items()
+        if any(stage in entry.get('stages', {}) for stage in stages)
+    }
+
+def upstream_fingerprint(manifest, master_id, stages):
+    """Fingerprint derived from the versions the upstream stages recorded for an image."""
+    recorded = manifest['images'].get(master_id, {}).get('stages', {})
+    return config_fingerprint([recorded.get(stage) for stage in stages])
+
+def plan_stage(manifest, stage, inputs, fingerprint):
+    """Work out which images a stage has to (re)process and which it has to drop.
+
+    fingerprint is either a string or a callable taking a master_id. Returns
+    (changed, removed) lists of master_ids: changed images are new, have new
+    content or were processed with a different model/config; removed images
+    were processed before but are no longer among the inputs.
+    """
+    changed = []
+    for master_id, info in inputs.items():
+        expected = fingerprint(master_id) if callable(fingerprint) else fingerprint
+        entry = manifest['images'].get(master_id)
+        if (entry is None or entry.get('content_hash') != info['content_hash']
+                or entry.get('stages', {}).get(stage) != expected):
+            changed.append(master_id)
+
+    removed = [
+        master_id for master_id, entry in manifest['images'].items()
+        if stage in entry.get('stages', {}) and master_id not in inputs
+    ]
+    logging.info(f"Manifest plan for {stage}: {len(changed)} changed, {len(removed)} removed, "
+                 f"{len(inputs) - len(changed)} up to date.")
+    return changed, removed
+
+def record_stage(manifest, stage, master_id, info, fingerprint):
+    """Mark an image as processed by a stage. New content invalidates every other stage."""
+    entry = manifest['images'].get(master_id)
+    if entry is None or entry.get('content_hash') != info['content_hash']:
+        entry = {'stages': {}}
+        manifest['images'][master_id] = entry
+    for field in ('file_name', 'content_hash', 'size', 'mtime'):
+        if field in info:
+            entry[field] = info[field]
+    entry['stages'][stage] = fingerprint
+    entry['updated_at'] = time.time()
+
+def forget_stage(manifest, stage, master_id):
+    """Remove a stage's record for an image, dropping the image once no stage remains."""
+    entry = manifest['images'].get(master_id)
+    if entry is None:
+        return
+    entry.get('stages', {}).pop(stage, None)
+    if not entry.get('stages'):
+        del manifest['images'][master_id]
+
+def forget_missing(manifest, stages, master_ids):
+    """Drop the records of stages for every image not in master_ids, e.g. after the outputs were rewritten."""
+    for master_id in list(manifest['images']):
+        if master_id not in master_ids:
+            for stage in stages:
+                forget_stage(manifest, stage, master_id)
+
+def merge_records(existing_records, new_records, replaced_keys, key='master_id'):
+    """Drop existing records whose key is in replaced_keys and append the new ones."""
+    replaced_keys = set(replaced_keys)
+    merged = [record for record in existing_records if record.get(key) not in replaced_keys]
+    merged.extend(new_records)
+    return merged
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import functools
+import logging
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+metrics_prefix = 'pipeline'
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process so far, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class StageMetrics:
+    """Accumulated timings of one named stage or function.
+
+    process_peak_rss_bytes is the process-wide high-water mark seen when the
+    stage last finished, not the memory the stage itself used; per-stage
+    peaks come from benchmarks/bench_pipeline.py.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_seconds = 0.0
+        self.process_peak_rss_bytes = None
+        self.bucket_counts = [0] * (len(latency_buckets) + 1)
+
+    def observe(self, wall_seconds, cpu_seconds=0.0, items=1, rss_bytes=None):
+        self.calls += 1
+        self.items += items
+        self.wall_seconds += wall_seconds
+        self.cpu_seconds += cpu_seconds
+        self.max_seconds = max(self.max_seconds, wall_seconds)
+        if rss_bytes is not None:
+            self.process_peak_rss_bytes = max(self.process_peak_rss_bytes or 0, rss_bytes)
+        self.bucket_counts[bisect.bisect_left(latency_buckets, wall_seconds)] += 1
+
+    def merge(self, other):
+        self.calls += other['calls']
+        self.items += other['items']
+        self.wall_seconds += other['wall_seconds']
+        self.cpu_seconds += other['cpu_seconds']
+        self.max_seconds = max(self.max_seconds, other['max_seconds'])
+        if other['process_peak_rss_bytes'] is not None:
+            self.process_peak_rss_bytes = max(self.process_peak_rss_bytes or 0, other['process_peak_rss_bytes'])
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, other['bucket_counts'])]
+
+    def quantile(self, q):
+        """Estimate a latency quantile as the upper bound of the bucket that contains it."""
+        if self.calls == 0:
+            return None
+        rank = q * self.calls
+        cumulative = 0
+        for bound, count in zip(latency_buckets + (float('inf'),), self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound if bound != float('inf') else self.max_seconds
+        return self.max_seconds
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'items': self.items,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'max_seconds': self.max_seconds,
+            'items_per_second': self.items / self.wall_seconds if self.wall_seconds > 0 else None,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'process_peak_rss_bytes': self.process_peak_rss_bytes,
+            'bucket_counts': list(self.bucket_counts),
+        }
+
+class MetricsRegistry:
+    """Thread-safe collection of StageMetrics keyed by stage name."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name, wall_seconds, cpu_seconds=0.0, items=1, rss_bytes=None):
+        with self._lock:
+            self._stages.setdefault(name, StageMetrics()).observe(wall_seconds, cpu_seconds, items, rss_bytes)
+
+    def merge(self, snapshot):
+        """Fold in the stages of another registry's snapshot, e.g. one returned by a worker process."""
+        with self._lock:
+            for name, stats in snapshot.items():
+                self._stages.setdefault(name, StageMetrics()).merge(stats)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self.started_at = time.time()
+
+_registry = MetricsRegistry()
+metrics_enabled = True
+
+def get_metrics():
+    return _registry
+
+def observe(name, wall_seconds, cpu_seconds=0.0, items=1):
+    """Record one externally timed call of a stage."""
+    if metrics_enabled:
+        _registry.observe(name, wall_seconds, cpu_seconds, items, peak_rss_bytes())
+
+@contextmanager
+def timed(name, items=1):
+    """Time the enclosed block as one call of stage name.
+
+    Yields a dict whose 'items' can be updated inside the block when the
+    number of processed items is only known at the end. CPU time is process
+    wide, so it includes helper threads (e.g. torch intra-op threads) and any
+    stage running concurrently.
+    """
+    span = {'items': items}
+    if not metrics_enabled:
+        yield span
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield span
+    finally:
+        _registry.observe(name, time.perf_counter() - wall_start, time.process_time() - cpu_start, span['items'],
+                          peak_rss_bytes())
+
+def instrument(name):
+    """Decorator that times every call of a function as stage name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def collect_and_reset():
+    """Return this process's snapshot and start over; used to ship worker metrics to the parent."""
+    snapshot = _registry.snapshot()
+    _registry.reset()
+    return snapshot
+
+def metrics_report():
+    """Return the JSON-serialisable report of every stage recorded in this process."""
+    return {
+        'started_at': _registry.started_at,
+        'elapsed_seconds': time.time() - _registry.started_at,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'latency_buckets': list(latency_buckets),
+        'stages': _registry.snapshot(),
+    }
+
+def _label(name):
+    return name.replace('\\', '\\\\').replace('"', '\\"')
+
+def prometheus_text(report=None):
+    """Render a report in the Prometheus text exposition format."""
+    report = report or metrics_report()
+    p = metrics_prefix
+    lines = [
+        f'# HELP {p}_stage_calls_total Number of timed calls per stage.',
+        f'# TYPE {p}_stage_calls_total counter',
+    ]
+    stages = report['stages']
+    for name, stats in stages.items():
+        lines.append(f'{p}_stage_calls_total{{stage="{_label(name)}"}} {stats["calls"]}')
+    for metric, key, help_text in (('items_total', 'items', 'Items processed per stage.'),
+                                   ('wall_seconds_total', 'wall_seconds', 'Wall time spent per stage.'),
+                                   ('cpu_seconds_total', 'cpu_seconds', 'Process CPU time spent per stage.')):
+        lines += [f'# HELP {p}_stage_{metric} {help_text}', f'# TYPE {p}_stage_{metric} counter']
+        lines += [f'{p}_stage_{metric}{{stage="{_label(name)}"}} {stats[key]}' for name, stats in stages.items()]
+
+    lines += [f'# HELP {p}_stage_latency_seconds Latency of one call per stage.',
+              f'# TYPE {p}_stage_latency_seconds histogram']
+    for name, stats in stages.items():
+        cumulative = 0
+        for bound, count in zip(list(report['latency_buckets']) + ['+Inf'], stats['bucket_counts']):
+            cumulative += count
+            lines.append(f'{p}_stage_latency_seconds_bucket{{stage="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{p}_stage_latency_seconds_sum{{stage="{_label(name)}"}} {stats["wall_seconds"]}')
+        lines.append(f'{p}_stage_latency_seconds_count{{stage="{_label(name)}"}} {stats["calls"]}')
+
+    if report['peak_rss_bytes'] is not None:
+        lines += [f'# HELP {p}_peak_rss_bytes Peak resident set size of the process.',
+                  f'# TYPE {p}_peak_rss_bytes gauge',
+                  f'{p}_peak_rss_bytes {report["peak_rss_bytes"]}']
+    return '\n'.join(lines) + '\n'
+
+def write_metrics_report(json_path=None, prometheus_path=None):
+    """Write the current report as JSON and/or Prometheus text."""
+    report = metrics_report()
+    if json_path:
+        os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+        with open(json_path, 'w') as json_file:
+            json.dump(report, json_file, indent=4)
+        logging.info(f"Saved metrics report to {json_path}")
+    if prometheus_path:
+        os.makedirs(os.path.dirname(prometheus_path) or '.', exist_ok=True)
+        with open(prometheus_path, 'w') as prom_file:
+            prom_file.write(prometheus_text(report))
+        logging.info(f"Saved Prometheus metrics to {prometheus_path}")
+
+def add_metrics_arguments(parser):
+    """Add the shared --metrics-json / --metrics-prom flags to a stage CLI."""
+    parser.add_argument('--metrics-json', help="Write per-stage timings, throughput and peak memory as JSON.")
+    parser.add_argument('--metrics-prom', help="Write the same metrics in Prometheus text format.")
@@ -1,3 +1,4 @@
+import os
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
@@ -25,3 +26,156 @@ def visualize_segmentation(original_image, masks, scores, threshold=0.5):
 
 def save_image(image, save_path):
     cv2.imwrite(save_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+
+def mask_bounding_boxes(binary_masks):
+    """Return the (x_min, y_min, x_max, y_max) box of each mask in an (N, H, W) boolean array.
+
+    x_max and y_max are exclusive. The second return value flags masks that
+    contain at least one pixel; boxes of empty masks are meaningless.
+    """
+    rows = binary_masks.any(axis=2)
+    cols = binary_masks.any(axis=1)
+    has_pixels = rows.any(axis=1)
+
+    y_min = rows.argmax(axis=1)
+    y_max = rows.shape[1] - rows[:, ::-1].argmax(axis=1)
+    x_min = cols.argmax(axis=1)
+    x_max = cols.shape[1] - cols[:, ::-1].argmax(axis=1)
+
+    boxes = np.stack([x_min, y_min, x_max, y_max], axis=1)
+    return boxes, has_pixels
+
+def extract_object_crops(masks, scores, original_image, score_threshold=0.5, mask_threshold=0.5):
+    """Yield a tight crop for every confident detection.
+
+    masks is the (N, 1, h, w) soft mask array predicted on the resized model
+    input and original_image the full-resolution frame. Only the bounding box
+    region of each mask is resized to full resolution and applied, so no
+    full-frame buffers are allocated per object.
+    """
+    keep = np.flatnonzero(scores > score_threshold)
+    if len(keep) == 0:
+        return
+
+    binary_masks = masks[keep, 0] > mask_threshold
+    boxes, has_pixels = mask_bounding_boxes(binary_masks)
+
+    mask_height, mask_width = binary_masks.shape[1:]
+    original_height, original_width = original_image.shape[:2]
+    scale_x = original_width / mask_width
+    scale_y = original_height / mask_height
+
+    for i, detection_index in enumerate(keep):
+        if not has_pixels[i]:
+            continue
+
+        x_min, y_min, x_max, y_max = boxes[i]
+        crop_x_min = int(np.floor(x_min * scale_x))
+        crop_y_min = int(np.floor(y_min * scale_y))
+        crop_x_max = min(original_width, max(crop_x_min + 1, int(np.ceil(x_max * scale_x))))
+        crop_y_max = min(original_height, max(crop_y_min + 1, int(np.ceil(y_max * scale_y))))
+
+        roi_mask = binary_masks[i, y_min:y_max, x_min:x_max].astype(np.uint8)
+        roi_mask = cv2.resize(roi_mask, (crop_x_max - crop_x_min, crop_y_max - crop_y_min),
+                              interpolation=cv2.INTER_NEAREST)
+
+        crop = original_image[crop_y_min:crop_y_max, crop_x_min:crop_x_max].copy()
+        crop[roi_mask == 0] = 0
+
+        yield {
+            'index': int(detection_index),
+            'score': float(scores[detection_index]),
+            'bbox': (crop_x_min, crop_y_min, crop_x_max, crop_y_max),
+            'crop': crop,
+            'mask': roi_mask,
+        }
+
+def save_object_crop(crop, mask, save_path, with_alpha=False, mask_sidecar=False):
+    """Save a BGR object crop, optionally as a BGRA PNG and/or with a PNG mask next to it.
+
+    Returns the path the crop was written to, which switches to .png when
+    with_alpha is set.
+    """
+    if with_alpha:
+        save_path = os.path.splitext(save_path)[0] + '.png'
+        crop = np.dstack([crop, mask * 255])
+    cv2.imwrite(save_path, crop)
+
+    if mask_sidecar:
+        cv2.imwrite(os.path.splitext(save_path)[0] + '_mask.png', mask * 255)
+
+    return save_path
+
+def load_crop_mask(crop_path, size=None):
+    """Return the crop-local binary mask saved with a crop, or None if it was not saved.
+
+    The mask comes from the --mask-sidecar PNG or the alpha channel of an
+    --alpha crop. size (width, height) resizes it to a box of another size,
+    e.g. the scaled box of a duplicate image sharing the crop.
+    """
+    if not isinstance(crop_path, str):
+        return None
+    mask = None
+    sidecar_path = os.path.splitext(crop_path)[0] + '_mask.png'
+    if os.path.exists(sidecar_path):
+        mask = cv2.imread(sidecar_path, cv2.IMREAD_GRAYSCALE)
+    elif crop_path.lower().endswith('.png') and os.path.exists(crop_path):
+        crop = cv2.imread(crop_path, cv2.IMREAD_UNCHANGED)
+        if crop is not None and crop.ndim == 3 and crop.shape[2] == 4:
+            mask = crop[:, :, 3]
+    if mask is None:
+        return None
+    mask = (mask > 0).astype(np.uint8)
+    if size is not None and (mask.shape[1], mask.shape[0]) != tuple(size):
+        mask = cv2.resize(mask, tuple(size), interpolation=cv2.INTER_NEAREST)
+    return mask
+
+def fit_thumbnail(image, max_size):
+    """Downscale an image so its longer side is at most max_size; returns (image, scale)."""
+    height, width = image.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return image, 1.0
+    scale = max_size / max(height, width)
+    resized = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+def mask_outline(mask, x_offset=0, y_offset=0, scale=1.0):
+    """Return the outer contours of a binary crop-local mask in image coordinates."""
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [np.round((contour + (x_offset, y_offset)) * scale).astype(np.int32) for contour in contours]
+
+def draw_annotations(image, objects, text_rows=(), scale=1.0, copy=True):
+    """Return a BGR image with object boxes, mask outlines, labels and OCR boxes drawn on it.
+
+    objects need a 'bbox' (x_min, y_min, x_max, y_max) and optionally a
+    'description' and a crop-local 'mask'; text_rows are OCR rows with a
+    'BBox' polygon and 'Text'. Coordinates are multiplied by scale, so
+    annotations can be drawn straight onto a downscaled thumbnail. Pass
+    copy=False to draw in place.
+    """
+    annotated = image.copy() if copy else image
+
+    for obj in objects:
+        x_min, y_min, x_max, y_max = [int(round(v * scale)) for v in obj['bbox']]
+        cv2.rectangle(annotated, (x_min, y_min), (max(x_min, x_max - 1), max(y_min, y_max - 1)), (0, 0, 255), 2)
+        mask = obj.get('mask')
+        if mask is not None:
+            contours = mask_outline(mask, obj['bbox'][0], obj['bbox'][1], scale)
+            cv2.drawContours(annotated, contours, -1, (0, 255, 0), 1, cv2.LINE_AA)
+        label = obj.get('description')
+        if label:
+            _draw_label(annotated, label, x_min, y_min)
+
+    for row in text_rows:
+        polygon = np.round(np.array(row['BBox'], dtype=np.float32) * scale).astype(np.int32).reshape(-1, 1, 2)
+        cv2.polylines(annotated, [polygon], isClosed=True, color=(0, 200, 255), thickness=1)
+
+    return annotated
+
+def _draw_label(image, text, x, y, font_scale=0.5):
+    (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+    top = max(0, y - text_height - baseline - 4)
+    cv2.rectangle(image, (x, top), (x + text_width + 4, top + text_height + baseline + 4), (0, 255, 255), -1)
+    cv2.putText(image, text, (x + 2, top + text_height + 2), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 1,
+                cv2.LINE_AA)
@@ -0,0 +1,57 @@
+import logging
+import functools
+from contextlib import nullcontext
+import torch
+from torch import nn
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# fp32: full precision. int8: dynamic INT8 quantization of nn.Linear weights (CPU only).
+# bf16: bfloat16 autocast around the forward pass.
+precision_modes = ('fp32', 'int8', 'bf16')
+
+def device_type(device):
+    return torch.device(device).type
+
+@functools.lru_cache(maxsize=None)
+def resolve_precision(mode, device):
+    """Return the precision mode that will actually be used on device, falling back to fp32.
+
+    Results are cached, so each fallback warning is logged once per process.
+    """
+    if mode not in precision_modes:
+        raise ValueError(f"Unknown precision mode: {mode}")
+    if mode == 'int8' and device_type(device) != 'cpu':
+        logging.warning("Dynamic INT8 quantization only runs on CPU; using fp32.")
+        return 'fp32'
+    if mode == 'bf16':
+        if device_type(device) == 'cuda' and not torch.cuda.is_bf16_supported():
+            logging.warning("This GPU does not support bfloat16; using fp32.")
+            return 'fp32'
+        if device_type(device) == 'cpu' and not cpu_has_native_bf16():
+            logging.warning("This CPU has no native bfloat16 support; bf16 may be slower than fp32.")
+    return mode
+
+def cpu_has_native_bf16():
+    """Return True if PyTorch dispatches to AVX512 or AMX kernels, which accelerate bfloat16."""
+    get_capability = getattr(torch.backends.cpu, 'get_cpu_capability', None)
+    return get_capability is not None and get_capability().upper().startswith(('AVX512', 'AMX'))
+
+def apply_precision(model, mode, device):
+    """Prepare an fp32 model for inference in mode; int8 quantizes its linear layers."""
+    mode = resolve_precision(mode, device)
+    if mode == 'int8':
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    return model
+
+def precision_context(mode, device):
+    """Return the context the forward pass runs in: bfloat16 autocast for bf16, otherwise a no-op."""
+    if mode == 'bf16' and resolve_precision(mode, device) == 'bf16':
+        return torch.autocast(device_type=device_type(device), dtype=torch.bfloat16)
+    return nullcontext()
+
+def add_precision_argument(parser, default='fp32'):
+    """Add the shared --precision flag to a stage CLI."""
+    parser.add_argument('--precision', choices=precision_modes, default=default,
+                        help="Inference precision: fp32, dynamic int8 (CPU) or bf16 autocast.")
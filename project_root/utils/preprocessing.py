@@ -2,12 +2,92 @@ import cv2
 from PIL import Image
 from torchvision.transforms import functional as F
 
-def preprocess_image(image_path, device, target_size=(800, 800)):
-    image = cv2.imread(image_path)
+# Mask R-CNN input size: the shorter side is scaled to min_size unless the longer side would
+# exceed max_size, the same rule torchvision's detection transform applies internally
+segmentation_min_size = 800
+segmentation_max_size = 1333
+
+# Longest side of the decoded image every stage shares; JPEGs are decoded at 1/2, 1/4 or 1/8
+# resolution while the longer side stays at least this size, and None decodes at full resolution.
+# Boxes and crops are in decoded pixels, so all stages must use the same value.
+decode_max_side = segmentation_max_size
+
+_reduced_read_flags = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def aspect_preserving_size(width, height, min_size=segmentation_min_size, max_size=segmentation_max_size):
+    """Return the (width, height) that scales the shorter side to min_size without the longer exceeding max_size."""
+    scale = min(min_size / min(width, height), max_size / max(width, height))
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def reduced_decode_factor(image_path, min_size, max_size):
+    """Return the largest JPEG decode reduction (1, 2, 4 or 8) that is still at least the target size.
+
+    Only the file header is read. Other formats always decode at full size.
+    """
+    try:
+        with Image.open(image_path) as image:
+            if image.format != 'JPEG':
+                return 1
+            width, height = image.size
+    except OSError:
+        return 1
+    target_width, target_height = aspect_preserving_size(width, height, min_size, max_size)
+    for factor in (8, 4, 2):
+        if width // factor >= target_width and height // factor >= target_height:
+            return factor
+    return 1
+
+def load_image(image_path, max_side=None):
+    """Decode an image once as BGR for segmentation, cropping and OCR to share.
+
+    Large JPEGs are decoded at a reduced resolution whose longer side is still
+    at least max_side (decode_max_side by default).
+    """
+    max_side = decode_max_side if max_side is None else max_side
+    factor = reduced_decode_factor(image_path, max_side, max_side) if max_side else 1
+    image = cv2.imread(image_path, _reduced_read_flags[factor])
     if image is None:
         raise ValueError(f"Failed to load image: {image_path}")
+    return image
+
+def add_decode_argument(parser):
+    """Add the shared --decode-max-side flag to a stage CLI."""
+    parser.add_argument('--decode-max-side', type=int, default=decode_max_side,
+                        help="Decode JPEGs at reduced resolution while the longer side stays at least this size; "
+                             "0 decodes at full resolution. Every stage must use the same value.")
+
+def preprocess_image(image_path, device, target_size=None):
+    """Decode and preprocess an image when only the model input is needed.
+
+    JPEGs larger than the model input are decoded at reduced resolution.
+    Callers that also crop or run OCR should decode once with load_image and
+    use preprocess_image_array instead.
+    """
+    factor = 1 if target_size else reduced_decode_factor(image_path, segmentation_min_size, segmentation_max_size)
+    image = cv2.imread(image_path, _reduced_read_flags[factor])
+    if image is None:
+        raise ValueError(f"Failed to load image: {image_path}")
+    return preprocess_image_array(image, device, target_size)
+
+def preprocess_image_array(image, device, target_size=None, min_size=segmentation_min_size,
+                           max_size=segmentation_max_size):
+    """Convert a decoded BGR image into a Mask R-CNN input tensor.
+
+    The image is downscaled with its aspect ratio kept so the model sees
+    undistorted objects and predicts masks at the smallest useful size;
+    smaller images are left for the model to upscale. target_size forces the
+    old fixed (width, height) resize.
+    """
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image = cv2.resize(image, target_size)
+    height, width = image.shape[:2]
+    size = target_size or aspect_preserving_size(width, height, min_size, max_size)
+    if target_size or size[0] < width:
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA if size[0] < width else cv2.INTER_LINEAR)
     image = F.to_tensor(image).unsqueeze(0).to(device)
     return image
 
@@ -18,4 +98,4 @@ def convert_to_grayscale(image):
     return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
 
 def normalize_image(image):
-    return image / 255.0
\ No newline at end of file
+    return image / 255.0
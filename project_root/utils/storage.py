@@ -0,0 +1,237 @@
+import os
+import json
+import math
+import logging
+import pandas as pd
+
+from utils.metrics import timed
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Output format for tabular results: 'csv' writes CSV plus indented JSON as
+# before, 'parquet' writes a single typed Parquet file and 'jsonl' streams one
+# JSON record per line, both next to the CSV path
+output_formats = ('csv', 'parquet', 'jsonl')
+output_format = 'csv'
+
+# Rows converted to records at a time when streaming a DataFrame
+record_chunk_size = 10000
+
+# Column types used for the Parquet backend
+bbox_columns = ['BBox']
+float_columns = ['Confidence', 'score', 'description_score']
+int_columns = ['object_id', 'label', 'x_min', 'y_min', 'x_max', 'y_max']
+categorical_columns = ['master_id', 'description', 'Image']
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+def set_output_format(fmt):
+    """Select the output format used by every stage in this process."""
+    global output_format
+    if fmt not in output_formats:
+        raise ValueError(f"Unknown output format: {fmt}")
+    if fmt == 'parquet' and pa is None:
+        raise ImportError("The parquet output format requires pyarrow (pip install pyarrow)")
+    output_format = fmt
+
+def add_output_format_argument(parser):
+    """Add the shared --output-format flag to a stage CLI."""
+    parser.add_argument('--output-format', choices=output_formats, default=output_format,
+                        help="Write results as CSV + JSON, typed Parquet or streamed JSON Lines.")
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def jsonl_path(path):
+    return os.path.splitext(path)[0] + '.jsonl'
+
+def write_jsonl(records, path):
+    """Write records one JSON object per line as they are produced and return how many were written."""
+    count = 0
+    with open(path, 'w') as jsonl_file:
+        for record in records:
+            jsonl_file.write(json.dumps(record, default=str))
+            jsonl_file.write('\n')
+            count += 1
+    return count
+
+def iter_jsonl(path):
+    """Yield the records of a JSON Lines file one at a time."""
+    with open(path, 'r') as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_frame_records(df, chunk_size=record_chunk_size):
+    """Yield the rows of a DataFrame as dicts without building the whole list at once."""
+    for start in range(0, len(df), chunk_size):
+        yield from df.iloc[start:start + chunk_size].to_dict(orient='records')
+
+def normalize_bbox(value):
+    """Return a bbox as a list of [x, y] float pairs, or None when it is missing or malformed.
+
+    Accepts lists, Parquet arrays and the stringified lists found in CSV files.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str):
+        if value in ('', 'N/A', 'NaN'):
+            return None
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    try:
+        return [[float(x), float(y)] for x, y in value]
+    except (TypeError, ValueError):
+        return None
+
+def to_arrow_table(df):
+    """Convert a result DataFrame into an Arrow table with typed columns.
+
+    Bboxes become list<list<double>>, confidences doubles, ids integers and
+    labels dictionary-encoded strings; 'N/A' placeholders become nulls.
+    """
+    arrays, names = [], []
+    for column in df.columns:
+        values = df[column]
+        if column in bbox_columns:
+            array = pa.array([normalize_bbox(v) for v in values], type=pa.list_(pa.list_(pa.float64())))
+        elif column in float_columns:
+            array = pa.array(pd.to_numeric(values, errors='coerce'), type=pa.float64(), from_pandas=True)
+        elif column in int_columns:
+            array = pa.array(pd.to_numeric(values, errors='coerce').astype('Int64'), type=pa.int64(), from_pandas=True)
+        else:
+            strings = [None if (v is None or (isinstance(v, float) and math.isnan(v)) or v == 'N/A') else str(v)
+                       for v in values]
+            array = pa.array(strings, type=pa.string())
+            if column in categorical_columns:
+                array = array.dictionary_encode()
+        arrays.append(array)
+        names.append(column)
+    return pa.Table.from_arrays(arrays, names=names)
+
+def from_arrow_table(table):
+    """Convert an Arrow table back into a DataFrame with bboxes as plain lists."""
+    df = table.to_pandas()
+    for column in bbox_columns:
+        if column in df.columns:
+            df[column] = [normalize_bbox(v) for v in df[column]]
+    for column in categorical_columns:
+        if column in df.columns:
+            df[column] = df[column].astype(object)
+    return df
+
+def newest_output_format(csv_path):
+    """Return 'csv', 'parquet' or 'jsonl' for whichever output of csv_path was written last, or None."""
+    paths = (('csv', csv_path), ('parquet', parquet_path(csv_path)), ('jsonl', jsonl_path(csv_path)))
+    candidates = [(os.path.getmtime(path), fmt) for fmt, path in paths if os.path.exists(path)]
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+def output_exists(csv_path):
+    return newest_output_format(csv_path) is not None
+
+def read_table(csv_path, columns=None, **csv_kwargs):
+    """Read a stage output from Parquet, JSON Lines or CSV, whichever was written most recently."""
+    fmt = newest_output_format(csv_path)
+    if fmt is None:
+        raise FileNotFoundError(f"File not found: {csv_path}")
+    with timed('storage.read') as span:
+        df = _read_table(csv_path, fmt, columns, **csv_kwargs)
+        span['items'] = len(df)
+    return df
+
+def _read_table(csv_path, fmt, columns=None, **csv_kwargs):
+    if fmt == 'jsonl':
+        df = pd.DataFrame(iter_jsonl(jsonl_path(csv_path)))
+        return df[columns] if columns is not None else df
+    if fmt == 'parquet':
+        if pq is None:
+            raise ImportError(f"Reading {parquet_path(csv_path)} requires pyarrow (pip install pyarrow)")
+        return from_arrow_table(pq.read_table(parquet_path(csv_path), columns=columns))
+    return pd.read_csv(csv_path, usecols=columns, **csv_kwargs)
+
+def write_table(df, csv_path, fmt=None):
+    """Write a stage output as CSV, Parquet or JSON Lines and return the path written."""
+    fmt = fmt or output_format
+    with timed('storage.write', items=len(df)):
+        return _write_table(df, csv_path, fmt)
+
+def _write_table(df, csv_path, fmt):
+    if fmt == 'jsonl':
+        path = jsonl_path(csv_path)
+        write_jsonl(iter_frame_records(df), path)
+    elif fmt == 'parquet':
+        path = parquet_path(csv_path)
+        pq.write_table(to_arrow_table(df), path, compression='zstd')
+    else:
+        path = csv_path
+        df.to_csv(path, index=False)
+    return path
+
+def save_output(records, csv_path, json_path, fmt=None):
+    """Save results given as a DataFrame or an iterable of records.
+
+    csv writes CSV + indented JSON and parquet a single Parquet file, both
+    from a fully built table; jsonl writes each record as it is produced, so
+    a generator is never materialized.
+    """
+    fmt = fmt or output_format
+    if fmt == 'jsonl':
+        if isinstance(records, pd.DataFrame):
+            records = iter_frame_records(records)
+        path = jsonl_path(csv_path)
+        with timed('storage.write') as span:
+            count = write_jsonl(records, path)
+            span['items'] = count
+        logging.info(f"Saved {count} rows to {path}")
+        return
+
+    if isinstance(records, pd.DataFrame):
+        df = records
+        records = None
+    else:
+        records = list(records)
+        df = pd.DataFrame(records)
+    path = write_table(df, csv_path, fmt)
+    logging.info(f"Saved {len(df)} rows to {path}")
+    if fmt == 'csv':
+        write_json_records(records if records is not None else df.to_dict(orient='records'), json_path)
+
+def write_json_records(records, json_path):
+    """Write the indented JSON copy that the csv format keeps next to each CSV."""
+    with timed('storage.write_json', items=len(records)), open(json_path, 'w') as json_file:
+        json.dump(records, json_file, indent=4)
+    logging.info(f"Saved {len(records)} rows to {json_path}")
+
+def iter_output_records(csv_path, json_path, chunk_size=record_chunk_size):
+    """Yield previously saved records from whichever format was written last.
+
+    JSON Lines and Parquet outputs are read incrementally; the indented JSON
+    written by the csv format has to be loaded as a whole.
+    """
+    fmt = newest_output_format(csv_path)
+    if fmt == 'jsonl':
+        yield from iter_jsonl(jsonl_path(csv_path))
+    elif fmt == 'parquet':
+        if pq is None:
+            raise ImportError(f"Reading {parquet_path(csv_path)} requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(parquet_path(csv_path)).iter_batches(batch_size=chunk_size):
+            yield from from_arrow_table(pa.Table.from_batches([batch])).to_dict(orient='records')
+    elif os.path.exists(json_path):
+        with open(json_path, 'r') as json_file:
+            yield from json.load(json_file)
+
+def load_output_records(csv_path, json_path):
+    """Load previously saved records from whichever format was written last."""
+    return list(iter_output_records(csv_path, json_path))
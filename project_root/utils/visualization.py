@@ -1,54 +1,110 @@
-import pandas as pd
-import json
 import os
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-from PIL import Image
+import sys
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import cv2
+
+# Add the project root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.storage import save_output, read_table, output_exists, normalize_bbox
+from utils.association import text_box_rect
+from utils import preprocessing
+from utils.preprocessing import load_image, add_decode_argument
+from utils.postprocessing import draw_annotations, fit_thumbnail, load_crop_mask
+from utils.data_mapping import iter_data_mapping_entries, data_mapping_file, metadata_file
+from utils.metrics import instrument, add_metrics_arguments, write_metrics_report
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Define file paths
-data_mapping_file = 'data/output/data_mapping.json'
-summary_results_file = 'data/summaries.csv'
 original_images_folder = 'data/input_images/'
 output_dir = 'data/output/table_and_annotated/'
 
-# Create output directory if it doesn't exist
-os.makedirs(output_dir, exist_ok=True)
+# Rendering threads; OpenCV releases the GIL while decoding, drawing and encoding
+render_num_workers = 4
+# Longest side of annotated images in pixels, None keeps the original size
+render_thumbnail_size = None
 
-# Load data mapping
-with open(data_mapping_file, 'r') as json_file:
-    data_mapping = json.load(json_file)['images']
+def load_object_boxes(master_ids=None, path=metadata_file):
+    """Return {(master_id, object_id): (x_min, y_min, x_max, y_max)} from the segmentation metadata."""
+    if not output_exists(path):
+        return {}
+    metadata_df = read_table(path, columns=['master_id', 'object_id', 'x_min', 'y_min', 'x_max', 'y_max'],
+                             dtype={'master_id': str})
+    metadata_df['master_id'] = metadata_df['master_id'].astype(str)
+    if master_ids is not None:
+        metadata_df = metadata_df[metadata_df['master_id'].isin(set(master_ids))]
+    return {
+        (master_id, int(object_id)): (int(x_min), int(y_min), int(x_max), int(y_max))
+        for master_id, object_id, x_min, y_min, x_max, y_max in zip(
+            metadata_df['master_id'], metadata_df['object_id'], metadata_df['x_min'], metadata_df['y_min'],
+            metadata_df['x_max'], metadata_df['y_max'])
+    }
 
-def plot_image_with_annotations(image_path, objects, output_path):
+def _object_key(master_id, object_id):
     try:
-        img = Image.open(image_path)
-    except FileNotFoundError:
-        print(f"Image not found: {image_path}")
-        return
-    
-    fig, ax = plt.subplots(1, figsize=(12, 8))
-    ax.imshow(img)
+        return str(master_id), int(object_id)
+    except (TypeError, ValueError):
+        return None
 
+def entry_annotations(objects, master_id=None, object_boxes=None):
+    """Turn mapping objects into draw_annotations objects and OCR rows.
+
+    Objects with a segmentation box in object_boxes are drawn with that box,
+    the mask outline saved with their crop and a "description (text)" label;
+    their OCR lines are outlined as text rows. Objects without a box fall back
+    to a box around their OCR line.
+    """
+    annotations, text_rows = [], []
+    by_object = {}
     for obj in objects:
-        bbox_data = obj['text_data']['BBox']
-        if pd.notna(bbox_data) and bbox_data not in ['N/A', 'NaN']:
-            try:
-                bbox = json.loads(bbox_data)
-                if isinstance(bbox, list) and len(bbox) == 4:
-                    x_min, y_min, x_max, y_max = bbox[0][0], bbox[0][1], bbox[2][0], bbox[2][1]
-                    rect = Rectangle((x_min, y_min), x_max - x_min, y_max - y_min,
-                                     linewidth=2, edgecolor='red', facecolor='none')
-                    ax.add_patch(rect)
-                    annotation_text = f"{obj['description']} ({obj['text_data']['Text']})"
-                    plt.text(x_min, y_min - 10, annotation_text,
-                             bbox=dict(facecolor='yellow', alpha=0.5), fontsize=8, color='black')
-                else:
-                    print(f"Invalid BBox format for object {obj['object_id']} in {obj['file_path']}: {bbox}")
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
-                print(f"Error parsing BBox for object {obj['object_id']} in {obj['file_path']}: {e}")
-
-    plt.axis('off')
-    plt.savefig(output_path, bbox_inches='tight', pad_inches=0)
-    plt.close()
+        text_data = obj['text_data']
+        rect = text_box_rect(text_data['BBox'])
+        key = _object_key(master_id, obj['object_id'])
+        box = (object_boxes or {}).get(key)
+        if box is None:
+            if rect is not None:
+                annotations.append({'bbox': rect, 'description': f"{obj['description']} ({text_data['Text']})"})
+            continue
+
+        # The mapping has one row per OCR line, so an object can appear several times
+        if key not in by_object:
+            annotation = {'bbox': box, 'description': obj['description'], 'texts': []}
+            mask = load_crop_mask(obj['file_path'], (box[2] - box[0], box[3] - box[1]))
+            if mask is not None:
+                annotation['mask'] = mask
+            by_object[key] = annotation
+            annotations.append(annotation)
+        if rect is not None:
+            by_object[key]['texts'].append(str(text_data['Text']))
+            text_rows.append({'BBox': normalize_bbox(text_data['BBox']), 'Text': text_data['Text']})
+
+    for annotation in by_object.values():
+        texts = annotation.pop('texts')
+        if texts:
+            annotation['description'] = f"{annotation['description']} ({', '.join(texts)})"
+    return annotations, text_rows
+
+def render_annotated_image(image_path, objects, output_path, thumbnail_size=None, master_id=None,
+                           object_boxes=None):
+    """Draw the mapping objects of one image directly onto its pixels and write the result.
+
+    With thumbnail_size the image is downscaled first so its longer side is
+    at most that many pixels. Returns False if the image cannot be read.
+    """
+    # Decode the same way the stages did so the stored boxes line up with the pixels
+    try:
+        image = load_image(image_path)
+    except ValueError:
+        logging.warning(f"Image not found: {image_path}")
+        return False
+    image, scale = fit_thumbnail(image, thumbnail_size)
+    annotations, text_rows = entry_annotations(objects, master_id, object_boxes)
+    draw_annotations(image, annotations, text_rows, scale=scale, copy=False)
+    return cv2.imwrite(output_path, image)
 
 def generate_summary_table(objects, csv_output_path, json_output_path):
     summary_data = []
@@ -62,35 +118,106 @@ def generate_summary_table(objects, csv_output_path, json_output_path):
             'Confidence': obj['text_data']['Confidence']
         })
     
-    summary_df = pd.DataFrame(summary_data)
-    
-    # Save as CSV
-    summary_df.to_csv(csv_output_path, index=False)
-    print(f"Saved summary table to CSV: {csv_output_path}")
-    
-    # Save as JSON
-    with open(json_output_path, 'w') as json_file:
-        json.dump(summary_data, json_file, indent=4)
-    print(f"Saved summary table to JSON: {json_output_path}")
+    # Save as CSV + JSON, Parquet or JSON Lines
+    save_output(summary_data, csv_output_path, json_output_path)
 
-# Generate output for each master image
-for entry in data_mapping:
+@instrument('visualization.render_entry')
+def render_entry(entry, images_dir=original_images_folder, output_dir=output_dir, thumbnail_size=None,
+                 object_boxes=None):
+    """Write the annotated image and summary table of one mapping entry.
+
+    object_boxes maps (master_id, object_id) to segmentation boxes, see
+    load_object_boxes. Returns False when the original image is missing.
+    """
     master_id = entry['master_id']
     objects = entry['object_details']
-    
+
     base_image_name = f"{master_id}.jpg"
-    original_image_path = os.path.join(original_images_folder, base_image_name)
-    
+    original_image_path = os.path.join(images_dir, base_image_name)
+
     annotated_image_path = os.path.join(output_dir, f"annotated_{base_image_name}")
     summary_table_csv_path = os.path.join(output_dir, f"summary_{master_id}.csv")
     summary_table_json_path = os.path.join(output_dir, f"summary_{master_id}.json")
-    
+
     if not os.path.exists(original_image_path):
-        print(f"Image not found: {original_image_path}")
-        continue
-    
-    plot_image_with_annotations(original_image_path, objects, annotated_image_path)
-    
+        logging.warning(f"Image not found: {original_image_path}")
+        return False
+
+    render_annotated_image(original_image_path, objects, annotated_image_path, thumbnail_size, master_id,
+                           object_boxes)
     generate_summary_table(objects, summary_table_csv_path, summary_table_json_path)
+    return True
+
+@instrument('visualization')
+def render_visualizations(mapping_file=data_mapping_file, images_dir=original_images_folder, output_dir=output_dir,
+                          master_ids=None, num_workers=render_num_workers, thumbnail_size=render_thumbnail_size,
+                          metadata_path=metadata_file):
+    """Render annotated images and summary tables for the mapped images across a thread pool.
+
+    Reads the mapping one entry at a time and keeps at most 2 * num_workers
+    entries in flight; master_ids restricts rendering to those images.
+    Returns the master_ids whose original image was missing. An entry that
+    fails to render is logged and counted as a failure without stopping the
+    others.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    wanted = set(master_ids) if master_ids is not None else None
+    object_boxes = load_object_boxes(wanted, metadata_path)
+    missing = []
+    failed = []
+    rendered = 0
+
+    def render(entry):
+        try:
+            return entry['master_id'], render_entry(entry, images_dir, output_dir, thumbnail_size, object_boxes), None
+        except Exception as e:
+            return entry['master_id'], False, e
+
+    def collect(done):
+        nonlocal rendered
+        for future in done:
+            master_id, ok, error = future.result()
+            if error is not None:
+                logging.error(f"Failed to render {master_id}: {error}")
+                failed.append(master_id)
+                continue
+            rendered += ok
+            if not ok:
+                missing.append(master_id)
+
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        in_flight = set()
+        for entry in iter_data_mapping_entries(mapping_file):
+            if wanted is not None and str(entry['master_id']) not in wanted:
+                continue
+            if len(in_flight) >= 2 * max(1, num_workers):
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(render, entry))
+        collect(wait(in_flight).done)
+
+    logging.info(f"Rendered {rendered} annotated images and summary tables in {output_dir}"
+                 + (f"; {len(failed)} failed" if failed else ""))
+    return missing
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render annotated images and summary tables from the data mapping.")
+    parser.add_argument('--data-mapping', default=data_mapping_file)
+    parser.add_argument('--images-dir', default=original_images_folder)
+    parser.add_argument('--metadata', default=metadata_file,
+                        help="Segmentation metadata with the object boxes; masks are read from the crops' sidecars.")
+    parser.add_argument('--output-dir', default=output_dir)
+    parser.add_argument('--master-ids', nargs='+', help="Only render these images.")
+    parser.add_argument('--num-workers', type=int, default=render_num_workers)
+    parser.add_argument('--thumbnail-size', type=int, default=render_thumbnail_size,
+                        help="Downscale annotated images so their longer side is at most this many pixels.")
+    add_decode_argument(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    # Boxes are in decoded pixels, so the images are decoded as the stages decoded them
+    preprocessing.decode_max_side = args.decode_max_side or None
 
-print(f"Annotated images and summary tables saved in {output_dir}")
\ No newline at end of file
+    render_visualizations(args.data_mapping, args.images_dir, args.output_dir, args.master_ids,
+                          num_workers=args.num_workers, thumbnail_size=args.thumbnail_size, metadata_path=args.metadata)
+    write_metrics_report(args.metrics_json, args.metrics_prom)